@@ -1 +1 @@
-# package marker
+# package marker
@@ -0,0 +1,458 @@
+# execution/backtest.py
+"""
+Backtest / replay of the generator rule through ExecutionEngine (DEMO ledger).
+
+  - VirtualClock replaces wall-clock time (clock.set_clock)
+  - SMA rule evaluated vectorised (NumPy) over the whole OHLCV array per symbol
+  - event-driven: jumps from candidate signal to candidate signal / exit, never candle by candle
+  - entries go through ExecutionEngine.execute_signal (DEMO path, wallet + PnL engine)
+  - exits: simulated fill model over future candles (first TP/SL touch, vectorised search)
+
+Usage:
+  python -m execution.backtest --data DIR [--brain brain.xlsx] [--out report.json]
+  python -m execution.backtest --store /var/data/candles [--brain brain.xlsx]
+  python -m execution.backtest --synthetic 36x525600
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from execution import clock
+from execution.db import db
+
+logger = logging.getLogger("gbm")
+
+TF_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000,
+}
+
+# OHLCV columns
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+
+# ----------------------------
+# data
+# ----------------------------
+def load_ohlcv_file(path: Path) -> np.ndarray:
+    """(n, 6) float64 [ts_ms, open, high, low, close, volume], sorted by ts."""
+    path = Path(path)
+    if path.suffix == ".npy":
+        arr = np.load(path, mmap_mode="r")
+    elif path.suffix == ".npz":
+        with np.load(path) as z:
+            arr = z["ohlcv"] if "ohlcv" in z else z[z.files[0]]
+    elif path.suffix == ".csv":
+        arr = np.genfromtxt(path, delimiter=",", dtype=np.float64)
+        if arr.ndim == 2 and np.isnan(arr[0]).all():
+            arr = arr[1:]  # header row
+    else:
+        raise ValueError(f"unsupported OHLCV file: {path}")
+
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.ndim != 2 or arr.shape[1] < 6:
+        raise ValueError(f"bad OHLCV shape {arr.shape} in {path}")
+    arr = arr[:, :6]
+    if arr.shape[0] > 1 and np.any(np.diff(arr[:, TS]) <= 0):
+        arr = arr[np.argsort(arr[:, TS], kind="stable")]
+    return arr
+
+
+def _symbol_from_stem(stem: str, tf: str) -> str:
+    parts = stem.split("_") if "_" in stem else stem.split("-")
+    if len(parts) >= 3 and parts[-1] == tf:
+        parts = parts[:-1]
+    return "/".join(parts[:2]) if len(parts) >= 2 else stem
+
+
+def load_ohlcv_dir(data_dir: Path, tf: str, symbols: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    out: Dict[str, np.ndarray] = {}
+    for p in sorted(Path(data_dir).iterdir()):
+        if p.suffix not in (".npy", ".npz", ".csv"):
+            continue
+        sym = _symbol_from_stem(p.stem, tf)
+        if symbols and sym not in symbols:
+            continue
+        out[sym] = load_ohlcv_file(p)
+    return out
+
+
+def load_ohlcv_store(root: Path, tf: str, symbols: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Zero-copy memmap views from the generator's candle store; a timeframe that is not
+    stored is resampled from the 1m files.
+    """
+    from execution.candle_store import CandleStore
+    from execution.resampler import resample, BASE_TF
+
+    store = CandleStore(root)
+    out: Dict[str, np.ndarray] = {}
+    for sym in (symbols or store.symbols(tf) or store.symbols(BASE_TF)):
+        v = store.view(sym, tf)
+        if v.shape[0] == 0 and tf != BASE_TF:
+            v = resample(store.view(sym, BASE_TF), tf)
+        if v.shape[0]:
+            out[sym] = v
+    return out
+
+
+def synthetic_ohlcv(n_symbols: int, n_candles: int, tf_ms: int = 60_000, seed: int = 7) -> Dict[str, np.ndarray]:
+    """Random-walk candles for offline throughput runs."""
+    rng = np.random.default_rng(seed)
+    t0 = 1_700_000_000_000 - (1_700_000_000_000 % tf_ms)
+    ts = t0 + tf_ms * np.arange(n_candles, dtype=np.float64)
+    out: Dict[str, np.ndarray] = {}
+    for s in range(n_symbols):
+        close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.001, n_candles)))
+        open_ = np.empty_like(close)
+        open_[0] = close[0]
+        open_[1:] = close[:-1]
+        wick = np.abs(rng.normal(0.0, 0.0005, (2, n_candles))) * close
+        high = np.maximum(open_, close) + wick[0]
+        low = np.minimum(open_, close) - wick[1]
+        vol = rng.uniform(1.0, 10.0, n_candles)
+        out[f"SYN{s:03d}/USDT"] = np.column_stack([ts, open_, high, low, close, vol])
+    return out
+
+
+# ----------------------------
+# indicators / fill model
+# ----------------------------
+def rolling_sma(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(x.shape[0], np.nan)
+    if n <= 0 or x.shape[0] < n:
+        return out
+    c = np.cumsum(np.concatenate(([0.0], x)))
+    out[n - 1:] = (c[n:] - c[:-n]) / n
+    return out
+
+
+def first_exit(arr: np.ndarray, start: int, tp: float, sl: float, chunk: int = 2048) -> Optional[Tuple[int, float, str]]:
+    """
+    First candle >= start touching TP (high >= tp) or SL (low <= sl).
+    Both in one candle -> SL (conservative). Gaps fill at the open.
+    """
+    n = arr.shape[0]
+    i = start
+    while i < n:
+        j = min(n, i + chunk)
+        hit = (arr[i:j, HIGH] >= tp) | (arr[i:j, LOW] <= sl)
+        k = int(np.argmax(hit))
+        if hit[k]:
+            idx = i + k
+            o = float(arr[idx, OPEN])
+            if arr[idx, LOW] <= sl:
+                return idx, min(o, sl), "SL"
+            return idx, max(o, tp), "TP"
+        i = j
+        chunk *= 2
+    return None
+
+
+class SimulatedPriceFeed:
+    """Stands in for ExecutionEngine.price_feed: prices are set by the replay loop."""
+
+    def __init__(self):
+        self.prices: Dict[str, float] = {}
+
+    def fetch_ticker(self, symbol: str) -> Dict[str, Any]:
+        return {"symbol": symbol, "last": self.prices[symbol]}
+
+    def fetch_tickers(self, symbols: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        syms = symbols if symbols is not None else list(self.prices)
+        return {s: {"symbol": s, "last": self.prices[s]} for s in syms if s in self.prices}
+
+
+# ----------------------------
+# config
+# ----------------------------
+def default_params() -> Dict[str, Any]:
+    # same defaults as execution.signal_generator.run_once
+    return {
+        "tf": "1m",
+        "ma_period": 20,
+        "min_conf": 0.70,
+        "usdt_size": 1.0,
+        "tp_pct": 0.03,
+        "sl_pct": 0.015,
+        "sl_buf": 0.001,
+        "cooldown_s": 600,
+        "max_open": 1,
+        "symbols": [],
+        "overrides": {},
+    }
+
+
+def params_from_brain(path: Path) -> Dict[str, Any]:
+    from execution.brain_config import compile_brain
+
+    cfg = compile_brain(path)
+    p = default_params()
+    p.update({
+        "tf": cfg.tf,
+        "ma_period": cfg.ma_period,
+        "min_conf": cfg.min_conf,
+        "usdt_size": cfg.usdt_size,
+        "tp_pct": cfg.tp_pct,
+        "sl_pct": cfg.sl_pct,
+        "sl_buf": cfg.sl_buf,
+        "cooldown_s": cfg.cooldown_s,
+        "max_open": cfg.max_open,
+        "symbols": list(cfg.symbols),
+        "overrides": {k: dict(v) for k, v in cfg.overrides.items()},
+    })
+    return p
+
+
+# ----------------------------
+# engine
+# ----------------------------
+def _prepare_db(db_path: Path) -> None:
+    from execution.db.repository import update_system_state
+
+    db.DB_PATH = Path(db_path)
+    db.set_persistent_connection(True)
+    db.init_db()
+    update_system_state(status="ACTIVE", startup_sync_ok=True, kill_switch=False)
+
+
+def run_backtest(
+    data: Dict[str, np.ndarray],
+    params: Dict[str, Any],
+    db_path: Path,
+    start_balance: float = 100000.0,
+    fee_pct: float = 0.10,
+) -> Dict[str, Any]:
+    os.environ["MODE"] = "DEMO"
+    os.environ["KILL_SWITCH"] = "false"
+    os.environ["PRICE_CACHE_TTL_SECONDS"] = "0"
+
+    t_setup = time.perf_counter()
+    _prepare_db(db_path)
+
+    from execution.execution_engine import ExecutionEngine
+    from execution.virtual_wallet import VirtualWallet, set_wallet
+    from execution.pnl_engine import PnLEngine, set_pnl_engine
+    from execution.signal_generator import build_trade_signal
+
+    vclock = clock.VirtualClock()
+    clock.set_clock(vclock)
+
+    wallet = VirtualWallet(start_balance=start_balance, fee_pct=fee_pct, checkpoint_seconds=float("inf"), checkpoint_fills=10 ** 9).load()
+    set_wallet(wallet)
+    pnl = PnLEngine(start_equity=start_balance, snapshot_seconds=float("inf"))
+    set_pnl_engine(pnl)
+
+    engine = ExecutionEngine()
+    feed = SimulatedPriceFeed()
+    engine.price_feed = feed
+    setup_s = time.perf_counter() - t_setup
+    t_start = time.perf_counter()
+
+    tf = params["tf"]
+    tf_ms = TF_MS.get(tf)
+    if tf_ms is None:
+        raise ValueError(f"unsupported timeframe: {tf}")
+    confidence = 0.75  # rule: 0.75 if last > ma (else 0.50, never tradable at MIN_CONF >= 0.5)
+    cooldown_ms = float(params["cooldown_s"]) * 1000.0
+    max_open = int(params["max_open"])
+
+    symbols = [s for s in (params.get("symbols") or list(data)) if s in data] or list(data)
+
+    # vectorised candidate evaluation
+    t_ind = time.perf_counter()
+    cand_t: Dict[str, np.ndarray] = {}   # decision time (candle close, ms)
+    cand_i: Dict[str, np.ndarray] = {}   # candle index
+    n_candles = 0
+    for sym in symbols:
+        arr = data[sym]
+        n_candles += arr.shape[0]
+        close = arr[:, CLOSE]
+        ma = rolling_sma(close, int(params["ma_period"]))
+        ok = (close > ma) & (confidence >= float(params["min_conf"]))
+        idx = np.flatnonzero(ok)
+        cand_i[sym] = idx
+        cand_t[sym] = arr[idx, TS] + tf_ms
+    ind_s = time.perf_counter() - t_ind
+
+    # event queue: (time_ms, kind, seq, payload); exits (0) before entries (1) at the same time
+    heap: List[Tuple[float, int, int, Any]] = []
+    seq = 0
+
+    def push_candidate(sym: str, t_min: float) -> None:
+        nonlocal seq
+        k = int(np.searchsorted(cand_t[sym], t_min, side="left"))
+        if k < cand_t[sym].shape[0]:
+            seq += 1
+            heapq.heappush(heap, (float(cand_t[sym][k]), 1, seq, (sym, k)))
+
+    for sym in symbols:
+        push_candidate(sym, -np.inf)
+
+    open_exits: Dict[int, float] = {}
+    stats = {"signals": 0, "rejected": 0, "blocked_slots": 0, "closed": 0, "wins": 0, "losses": 0}
+    per_symbol: Dict[str, Dict[str, float]] = {s: {"trades": 0, "pnl": 0.0} for s in symbols}
+
+    while heap:
+        t_ms, kind, _seq, payload = heapq.heappop(heap)
+        vclock.advance_to(t_ms / 1000.0)
+
+        if kind == 0:
+            pid, sym, price, reason = payload
+            feed.prices[sym] = price
+            c = engine.close_demo_position(pid, price, reason)
+            open_exits.pop(pid, None)
+            stats["closed"] += 1
+            stats["wins" if c["pnl"] > 0 else "losses"] += 1
+            per_symbol[sym]["pnl"] += c["pnl"]
+            continue
+
+        sym, k = payload
+        if len(wallet.positions) >= max_open:
+            stats["blocked_slots"] += 1
+            nxt = min(open_exits.values()) if open_exits else np.inf
+            if np.isfinite(nxt):
+                push_candidate(sym, max(nxt, t_ms + 1))
+            continue
+
+        arr = data[sym]
+        i = int(cand_i[sym][k])
+        last = float(arr[i, CLOSE])
+        ma_last = float(np.mean(arr[i - int(params["ma_period"]) + 1:i + 1, CLOSE]))
+        o = params["overrides"].get(sym, {})
+        tp_pct = float(o.get("TP_PCT", params["tp_pct"]))
+        sl_pct = float(o.get("SL_PCT", params["sl_pct"]))
+
+        sig = build_trade_signal(
+            symbol=sym, last=last, ma=ma_last, confidence=confidence,
+            usdt_size=float(o.get("USDT_SIZE", params["usdt_size"])),
+            tp_pct=tp_pct, sl_pct=sl_pct, sl_buf=float(params["sl_buf"]), tf=tf,
+        )
+        feed.prices[sym] = last
+        engine.execute_signal(sig)
+        stats["signals"] += 1
+        push_candidate(sym, t_ms + cooldown_ms)
+
+        pid = next((p for p, pos in wallet.positions.items() if pos.get("signal_id") == sig["signal_id"]), None)
+        if pid is None:
+            stats["rejected"] += 1
+            continue
+
+        per_symbol[sym]["trades"] += 1
+        pos = wallet.positions[pid]
+        ex = first_exit(arr, i + 1, float(pos["tp_price"]), float(pos["sl_price"]))
+        if ex is None:
+            open_exits[pid] = np.inf
+            continue
+        j, px, reason = ex
+        t_exit = float(arr[j, TS]) + tf_ms
+        open_exits[pid] = t_exit
+        seq += 1
+        heapq.heappush(heap, (t_exit, 0, seq, (pid, sym, float(px), reason)))
+
+    # mark what is still open at the last close
+    last_prices = {s: float(data[s][-1, CLOSE]) for s in symbols if data[s].shape[0]}
+    for sym in pnl.open_symbols():
+        if sym in last_prices:
+            pnl.mark(sym, last_prices[sym])
+    pnl.snapshot()
+    wallet.checkpoint()
+
+    elapsed = time.perf_counter() - t_start
+    clock.set_clock(None)
+    db.set_persistent_connection(False)
+
+    closed = stats["closed"]
+    return {
+        "symbols": len(symbols),
+        "candles": int(n_candles),
+        "setup_s": round(setup_s, 4),
+        "elapsed_s": round(elapsed, 4),
+        "indicator_s": round(ind_s, 4),
+        "candles_per_s": round(n_candles / elapsed, 1) if elapsed > 0 else None,
+        "signals": stats["signals"],
+        "rejected": stats["rejected"],
+        "blocked_by_max_open": stats["blocked_slots"],
+        "trades_closed": closed,
+        "trades_open": len(wallet.positions),
+        "wins": stats["wins"],
+        "losses": stats["losses"],
+        "win_rate": round(stats["wins"] / closed, 4) if closed else None,
+        "realized_pnl": round(wallet.realized_pnl, 8),
+        "unrealized_pnl": round(wallet.unrealized_pnl(last_prices), 8),
+        "fees_paid": round(wallet.fees_paid, 8),
+        "final_equity": round(pnl.equity, 8),
+        "max_drawdown": round(pnl.max_drawdown, 6),
+        "per_symbol": {s: {"trades": v["trades"], "pnl": round(v["pnl"], 8)} for s, v in per_symbol.items() if v["trades"]},
+        "params": {k: v for k, v in params.items() if k != "overrides"},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m execution.backtest")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--data", help="directory of SYMBOL_QUOTE[_tf].npy|.npz|.csv OHLCV files")
+    src.add_argument("--store", help="candle store directory (CANDLE_STORE_DIR)")
+    src.add_argument("--synthetic", help="NxM random-walk data: N symbols x M candles")
+    ap.add_argument("--brain", help="brain.xlsx to read GENERATOR_CONFIG/SYMBOL_OVERRIDES from")
+    ap.add_argument("--tf", default=None)
+    ap.add_argument("--ma-period", type=int, default=None)
+    ap.add_argument("--cooldown", type=int, default=None, help="seconds")
+    ap.add_argument("--max-open", type=int, default=None)
+    ap.add_argument("--balance", type=float, default=100000.0)
+    ap.add_argument("--fee-pct", type=float, default=0.10)
+    ap.add_argument("--db", default=None, help="SQLite path (default: temp file)")
+    ap.add_argument("--out", default=None, help="write JSON report here")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='[%(levelname)s] %(asctime)s - %(message)s')
+
+    params = params_from_brain(Path(args.brain)) if args.brain else default_params()
+    for key, val in (("tf", args.tf), ("ma_period", args.ma_period), ("cooldown_s", args.cooldown), ("max_open", args.max_open)):
+        if val is not None:
+            params[key] = val
+
+    if args.synthetic:
+        n_sym, n_c = (int(x) for x in args.synthetic.lower().split("x"))
+        data = synthetic_ohlcv(n_sym, n_c, TF_MS[params["tf"]])
+        params["symbols"] = []
+    elif args.store:
+        data = load_ohlcv_store(Path(args.store), params["tf"], params.get("symbols") or None)
+    else:
+        data = load_ohlcv_dir(Path(args.data), params["tf"], params.get("symbols") or None)
+    if not data:
+        print("no OHLCV data found")
+        return 2
+
+    tmpdir = None
+    if args.db:
+        db_path = Path(args.db)
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix="gbm_backtest_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        db_path = Path(tmpdir.name) / "backtest.db"
+
+    # virtual_wallet fills log at INFO: hidden unless --verbose
+    report = run_backtest(data, params, db_path, start_balance=args.balance, fee_pct=args.fee_pct)
+
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
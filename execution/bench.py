@@ -0,0 +1,334 @@
+# execution/bench.py
+"""
+Offline microbenchmarks for the worker's hot paths.
+
+  python -m execution.bench run [--quick] [--only outbox,signal,repo,exchange,reconcile] [--out bench.json]
+  python -m execution.bench compare baseline.json current.json [--threshold 0.2] [--floor-us 2]
+
+Suites:
+  outbox     append_signal / pop_next_signal at outbox depths 10 .. 100k (--quick: .. 1k)
+  signal     _fingerprint, validate_signal
+  repo       every public repository function at table sizes 100 / 10k rows (--quick: 100)
+  exchange   BinanceSpotClient precision helpers + min notional (FakeExchange backend)
+  reconcile  ExecutionEngine.reconcile_oco over 10 / 50 active OCO links (FakeExchange)
+
+Everything runs in a temp dir (DB, outbox, traces) against execution.fake_exchange: no network,
+no /var/data. Each case reports per-call min / p50 / p95 / mean in microseconds; repository
+functions the suite has no case for are listed under "skipped".
+
+compare matches cases by name and flags a regression when p50 grew by more than --threshold
+(fraction) and by more than --floor-us (timer noise); exit status 1 if any case regressed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+SUITES = ("outbox", "signal", "repo", "exchange", "reconcile")
+
+
+def _measure(fn: Callable[[int], Any], n: int) -> Dict[str, float]:
+    fn(-1)  # warm-up (imports, first connection, caches)
+    samples = []
+    for i in range(n):
+        t0 = time.perf_counter_ns()
+        fn(i)
+        samples.append((time.perf_counter_ns() - t0) / 1000.0)
+    samples.sort()
+    return {
+        "n": n,
+        "min_us": round(samples[0], 3),
+        "p50_us": round(samples[len(samples) // 2], 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "mean_us": round(sum(samples) / len(samples), 3),
+    }
+
+
+def _signal(i: int, symbol: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "signal_id": f"bench-{i}-{random.getrandbits(32):08x}",
+        "final_verdict": "TRADE",
+        "certified_signal": True,
+        "created_at_utc": datetime.now(timezone.utc).isoformat(),
+        "execution": {
+            "symbol": symbol or f"S{i}/USDT",
+            "direction": "LONG",
+            "entry": {"type": "MARKET"},
+            "position_size": 1.0,
+        },
+    }
+
+
+# ----------------------------
+# suites
+# ----------------------------
+def bench_outbox(tmp: Path, quick: bool) -> Dict[str, Dict[str, float]]:
+    from execution.signal_client import append_signal, pop_next_signal, _atomic_write_json, _fingerprint
+
+    out = {}
+    for depth in (10, 100, 1000) if quick else (10, 100, 1000, 10000, 100000):
+        path = str(tmp / f"outbox_{depth}.json")
+        prefill = [_signal(i) for i in range(depth)]
+        for s in prefill:
+            s["_fingerprint"] = _fingerprint(s)
+        _atomic_write_json(path, {"signals": prefill})
+        n = max(3, min(200, 20000 // depth))
+        fresh = [_signal(depth + i) for i in range(n + 1)]
+        out[f"outbox.append[depth={depth}]"] = _measure(lambda i: append_signal(fresh[i], path), n)
+        out[f"outbox.pop[depth={depth}]"] = _measure(lambda i: pop_next_signal(path), n)
+    return out
+
+
+def bench_signal(tmp: Path, quick: bool) -> Dict[str, Dict[str, float]]:
+    from execution.signal_client import _fingerprint, validate_signal
+
+    sig = _signal(1, "BTC/USDT")
+    n = 2000 if quick else 20000
+    return {
+        "signal._fingerprint": _measure(lambda i: _fingerprint(sig), n),
+        "signal.validate_signal": _measure(lambda i: validate_signal(sig), n),
+    }
+
+
+def _populate(size: int) -> None:
+    from execution.db import db, repository as r
+
+    db.set_persistent_connection(True)
+    try:
+        now = time.time()
+        for i in range(size):
+            sym = f"SYM{i % 20}/USDT"
+            pid, _ = r.record_demo_entry(f"pop-{i}", sym, "LONG", 1.0, 100.0, 0.1, "USDT", 101.0, 99.0)
+            if i % 2:
+                r.record_demo_exit(pid, f"pop-{i}", sym, 1.0, 101.0, 0.1, "USDT", 0.9, "TP")
+            r.log_event("BENCH_POPULATE", f"row {i}")
+            r.mark_signal_id_executed(f"sig-{i}", signal_hash=f"h{i}", action="TRADE_DEMO", symbol=sym)
+            r.create_oco_link(f"sig-{i}", sym, sym.split("/")[0], f"tp{i}", f"sl{i}", 101.0, 99.0, 98.9, 1.0)
+            if i >= 10:
+                r.set_oco_status(i + 1, "CLOSED_TP")
+            r.insert_pnl_event("DEMO", f"sig-{i}", sym, "SELL", 1.0, 101.0, 0.1, 0.9)
+        r.insert_signal_history([(f"SYM{i % 20}/USDT", f"sig-{i}", "bench", now - i) for i in range(size)])
+    finally:
+        db.set_persistent_connection(False)
+
+
+def _repo_cases(size: int) -> Dict[str, Callable[[int], Any]]:
+    from execution.db import repository as r
+
+    now = time.time()
+    tag = f"{size}-{random.getrandbits(32):08x}"
+    return {
+        "get_system_state": lambda i: r.get_system_state(),
+        "update_system_state": lambda i: r.update_system_state(status="RUNNING"),
+        "claim_profile_request": lambda i: r.claim_profile_request("bench", os.getpid()),
+        "get_pause_reason": lambda i: r.get_pause_reason(),
+        "set_pause_reason": lambda i: r.set_pause_reason(None),
+        "get_open_positions": lambda i: r.get_open_positions(),
+        "get_latest_open_position": lambda i: r.get_latest_open_position("SYM2/USDT"),
+        "open_position": lambda i: r.open_position("SYM1/USDT", "LONG", 1.0, 100.0),
+        "close_position": lambda i: r.close_position(i % size + 1, 101.0, 1.0),
+        "list_open_positions_detail": lambda i: r.list_open_positions_detail(),
+        "log_event": lambda i: r.log_event("BENCH", f"call {i}"),
+        "create_oco_link": lambda i: r.create_oco_link(f"b-{tag}-{i}", "SYM1/USDT", "SYM1", "tp", "sl", 101.0, 99.0, 98.9, 1.0),
+        "set_oco_status": lambda i: r.set_oco_status(1, "ACTIVE"),
+        "list_active_oco_links": lambda i: r.list_active_oco_links(limit=50),
+        "has_active_oco_for_symbol": lambda i: r.has_active_oco_for_symbol("SYM3/USDT"),
+        "get_open_positions_count": lambda i: r.get_open_positions_count(),
+        "signal_id_already_executed": lambda i: r.signal_id_already_executed(f"sig-{i % size}"),
+        "mark_signal_id_executed": lambda i: r.mark_signal_id_executed(f"b-{tag}-{i}", signal_hash="h", action="BENCH", symbol="SYM1/USDT"),
+        "record_demo_entry": lambda i: r.record_demo_entry(f"b-{tag}-{i}", "SYM1/USDT", "LONG", 1.0, 100.0, 0.1, "USDT"),
+        "record_demo_exit": lambda i: r.record_demo_exit(i % size + 1, "x", "SYM1/USDT", 1.0, 101.0, 0.1, "USDT", 0.9, "TP"),
+        "list_demo_fills_after": lambda i: r.list_demo_fills_after(max(0, size - 50)),
+        "get_demo_wallet_checkpoint": lambda i: r.get_demo_wallet_checkpoint(),
+        "save_demo_wallet_checkpoint": lambda i: r.save_demo_wallet_checkpoint('{"USDT": 1000.0}', 0.0, 0.0, size),
+        "insert_pnl_event": lambda i: r.insert_pnl_event("BENCH", "x", "SYM1/USDT", "SELL", 1.0, 101.0, 0.1, 0.9),
+        "list_pnl_events_after": lambda i: r.list_pnl_events_after(max(0, size - 50)),
+        "get_risk_state": lambda i: r.get_risk_state(),
+        "save_risk_state": lambda i: r.save_risk_state(0.0, 0.0, 0.05, 0.0, 0.0, "2026-01-01", 0.0, 0.0, 1000.0, 1000.0, 1000.0, 1000.0, "[]", size),
+        "insert_signal_history": lambda i: r.insert_signal_history([("SYM1/USDT", f"b-{tag}-{i}", "bench", now)]),
+        "list_signal_history_since": lambda i: r.list_signal_history_since(now - 60),
+        "prune_signal_history": lambda i: r.prune_signal_history(0.0),
+    }
+
+
+def bench_repo(tmp: Path, quick: bool, skipped: List[str]) -> Dict[str, Dict[str, float]]:
+    from execution.db import db, repository as r
+
+    public = sorted(
+        name for name, fn in vars(r).items()
+        if callable(fn) and not name.startswith("_") and hasattr(fn, "__wrapped__") and fn.__module__ == r.__name__
+    )
+    out = {}
+    for size in (100,) if quick else (100, 10000):
+        db.DB_PATH = tmp / f"bench_{size}.db"
+        db.init_db()
+        _populate(size)
+        cases = _repo_cases(size)
+        for name in public:
+            if name not in cases:
+                if name not in skipped:
+                    skipped.append(name)
+                continue
+            out[f"repo.{name}[rows={size}]"] = _measure(cases[name], 50 if quick else 200)
+    return out
+
+
+def _live_env() -> None:
+    os.environ.update({
+        "MODE": "TESTNET",
+        "BINANCE_API_KEY": "bench",
+        "BINANCE_API_SECRET": "bench",
+        "EXCHANGE_BACKEND": "fake",
+        "FAKE_EXCHANGE_VOLATILITY": "0",
+    })
+
+
+def bench_exchange(tmp: Path, quick: bool) -> Dict[str, Dict[str, float]]:
+    _live_env()
+    from execution.exchange_client import BinanceSpotClient
+
+    c = BinanceSpotClient()
+    n = 2000 if quick else 20000
+    sym = "BTC/USDT"
+    return {
+        "exchange.floor_amount": _measure(lambda i: c.floor_amount(sym, 0.123456789), n),
+        "exchange.floor_price": _measure(lambda i: c.floor_price(sym, 76253.91234), n),
+        "exchange._amount_str": _measure(lambda i: c._amount_str(sym, 0.123456789), n),
+        "exchange._price_str": _measure(lambda i: c._price_str(sym, 76253.91234), n),
+        "exchange.get_min_notional": _measure(lambda i: c.get_min_notional(sym), n),
+    }
+
+
+def bench_reconcile(tmp: Path, quick: bool) -> Dict[str, Dict[str, float]]:
+    _live_env()
+    from execution.db import db
+    from execution.db.repository import create_oco_link
+    from execution.execution_engine import ExecutionEngine
+
+    out = {}
+    for links in (10,) if quick else (10, 50):
+        db.DB_PATH = tmp / f"reconcile_{links}.db"
+        db.init_db()
+        engine = ExecutionEngine()
+        fx = engine.exchange.exchange
+        for i in range(links):
+            sym = "BTC/USDT"
+            fx._balances["BTC"] = fx._balances.get("BTC", 0.0) + 1.0
+            res = fx.privatePostOrderOco({
+                "symbol": fx.market_id(sym), "quantity": "1.0",
+                "price": "1000000", "stopPrice": "1", "stopLimitPrice": "0.9",
+            })
+            sl_id, tp_id = (str(rep["orderId"]) for rep in res["orderReports"])
+            create_oco_link(f"rc-{links}-{i}", sym, "BTC", tp_id, sl_id, 1000000.0, 1.0, 0.9, 1.0)
+        out[f"reconcile.reconcile_oco[links={links}]"] = _measure(lambda i: engine.reconcile_oco(), 20 if quick else 100)
+    return out
+
+
+# ----------------------------
+# run / compare
+# ----------------------------
+def run(suites: List[str], quick: bool) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, float]] = {}
+    skipped: List[str] = []
+    with tempfile.TemporaryDirectory(prefix="gbm_bench_") as d:
+        tmp = Path(d)
+        os.environ.setdefault("TRACE_PATH", str(tmp / "trace.tsv"))
+        os.environ.setdefault("VIRTUAL_START_BALANCE", "1000")
+        for suite in suites:
+            t0 = time.perf_counter()
+            if suite == "outbox":
+                results.update(bench_outbox(tmp, quick))
+            elif suite == "signal":
+                results.update(bench_signal(tmp, quick))
+            elif suite == "repo":
+                results.update(bench_repo(tmp, quick, skipped))
+            elif suite == "exchange":
+                results.update(bench_exchange(tmp, quick))
+            elif suite == "reconcile":
+                results.update(bench_reconcile(tmp, quick))
+            print(f"{suite:10s} done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "suites": suites,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(base: Dict[str, Any], cur: Dict[str, Any], threshold: float, floor_us: float) -> List[Dict[str, Any]]:
+    rows = []
+    b, c = base.get("results", {}), cur.get("results", {})
+    for name in sorted(set(b) | set(c)):
+        if name not in c:
+            rows.append({"name": name, "status": "missing"})
+            continue
+        if name not in b:
+            rows.append({"name": name, "status": "new", "p50_us": c[name]["p50_us"]})
+            continue
+        old, new = float(b[name]["p50_us"]), float(c[name]["p50_us"])
+        ratio = new / old if old > 0 else float("inf")
+        if ratio > 1.0 + threshold and new - old > floor_us:
+            status = "REGRESSION"
+        elif ratio < 1.0 - threshold and old - new > floor_us:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"name": name, "status": status, "base_us": old, "p50_us": new, "ratio": round(ratio, 3)})
+    return rows
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m execution.bench")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--quick", action="store_true", help="smaller depths / table sizes / iteration counts")
+    r.add_argument("--only", default=",".join(SUITES), help=f"comma separated subset of {','.join(SUITES)}")
+    r.add_argument("--out", default=None, help="write JSON results here")
+    c = sub.add_parser("compare")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.2, help="p50 growth that counts as a regression (fraction)")
+    c.add_argument("--floor-us", type=float, default=2.0, help="ignore differences below this (timer noise)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "run":
+        suites = [s.strip() for s in args.only.split(",") if s.strip()]
+        unknown = [s for s in suites if s not in SUITES]
+        if unknown:
+            ap.error(f"unknown suite(s): {','.join(unknown)}")
+        report = run(suites, args.quick)
+        for name, s in report["results"].items():
+            print(f"{name:55s} n={s['n']:6d} p50_us={s['p50_us']:12.3f} p95_us={s['p95_us']:12.3f} min_us={s['min_us']:12.3f}")
+        if report["skipped"]:
+            print(f"skipped (no case): {','.join(report['skipped'])}")
+        if args.out:
+            Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        return 0
+
+    base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    cur = json.loads(Path(args.current).read_text(encoding="utf-8"))
+    rows = compare(base, cur, args.threshold, args.floor_us)
+    for row in rows:
+        if "ratio" in row:
+            print(f"{row['status']:10s} {row['name']:55s} {row['base_us']:12.3f} -> {row['p50_us']:12.3f} us  x{row['ratio']}")
+        else:
+            print(f"{row['status']:10s} {row['name']}")
+    regressions = sum(1 for row in rows if row["status"] == "REGRESSION")
+    print(f"{regressions} regression(s) of {len(rows)} case(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+# execution/brain_config.py
+"""
+brain.xlsx -> immutable GeneratorConfig, compiled once per file version.
+
+  - per call: one os.stat(); (mtime_ns, size) unchanged -> cached object
+  - stat changed: sha256 of the file; same content -> cached object (touch / copy)
+  - content changed: JSON sidecar with the same sha256 -> no parse (e.g. after a restart)
+  - otherwise: openpyxl read_only parse, sidecar rewrite, BRAIN_CONFIG_RELOAD audit event
+
+Sheets:
+  GENERATOR_CONFIG  column A = key, column B = value
+  SYMBOL_OVERRIDES  SYMBOL | USDT_SIZE_OVERRIDE | TP_PCT_OVERRIDE | SL_PCT_OVERRIDE (header row 1, optional)
+  RULES             NAME | TYPE | EXPRESSION | WEIGHT | ENABLED (header row 1, optional; see rules.py)
+
+A RULES sheet that fails validation is rejected at load time: compile_brain raises, and a
+running cache keeps the previous config (BRAIN_CONFIG_INVALID audit event) until the file
+changes again.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger("gbm")
+
+# bump when GeneratorConfig fields / parsing change: invalidates every sidecar
+CONFIG_VERSION = 3
+
+
+def _bool(v: Any) -> bool:
+    return str(v).strip().lower() in ("true", "1", "yes", "y")
+
+
+def _safe_float(v: Any, default: float) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return default
+
+
+def _safe_int(v: Any, default: int) -> int:
+    try:
+        return int(v)
+    except Exception:
+        return default
+
+
+def _json_value(v: Any) -> Any:
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return str(v)
+
+
+@dataclass(frozen=True)
+class GeneratorConfig:
+    enabled: bool = False
+    symbols: Tuple[str, ...] = ("BTC/USDT",)
+    max_open: int = 1
+    tf: str = "1m"
+    limit: int = 50
+    ma_period: int = 20
+    min_conf: float = 0.70
+    usdt_size: float = 1.0
+    tp_pct: float = 0.03
+    sl_pct: float = 0.015
+    sl_buf: float = 0.001
+    cooldown_s: int = 600
+    # per-symbol throttle on top of the cooldown (0 = off)
+    max_signals_per_hour: int = 0
+    direction: str = "LONG"
+    # symbol -> {"USDT_SIZE"|"TP_PCT"|"SL_PCT": value}
+    overrides: Mapping[str, Mapping[str, float]] = field(default_factory=lambda: MappingProxyType({}))
+    # RULES rows (name, type, expression, weight, enabled); empty = rules.DEFAULT_RULES
+    rules: Tuple[Tuple[str, str, str, float, bool], ...] = ()
+    # GENERATOR_CONFIG as read (JSON-safe), for keys without a typed field
+    raw: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    sha256: str = ""
+
+    def for_symbol(self, symbol: str) -> Tuple[float, float, float]:
+        """(usdt_size, tp_pct, sl_pct) with SYMBOL_OVERRIDES applied."""
+        o = self.overrides.get(symbol, {})
+        return (
+            float(o.get("USDT_SIZE", self.usdt_size)),
+            float(o.get("TP_PCT", self.tp_pct)),
+            float(o.get("SL_PCT", self.sl_pct)),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {f.name: getattr(self, f.name) for f in fields(self)}
+        d["symbols"] = list(self.symbols)
+        d["overrides"] = {k: dict(v) for k, v in self.overrides.items()}
+        d["rules"] = [list(r) for r in self.rules]
+        d["raw"] = dict(self.raw)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "GeneratorConfig":
+        d = dict(d)
+        d["symbols"] = tuple(d.get("symbols") or ())
+        d["overrides"] = MappingProxyType({k: MappingProxyType(dict(v)) for k, v in (d.get("overrides") or {}).items()})
+        d["rules"] = tuple(tuple(r) for r in (d.get("rules") or ()))
+        d["raw"] = MappingProxyType(dict(d.get("raw") or {}))
+        return cls(**d)
+
+    def ruleset(self):
+        """Compiled RULES (cached per rows / MA_PERIOD)."""
+        from execution.rules import compile_rules
+        return compile_rules(self.rules, self.ma_period)
+
+
+def _read_kv(ws) -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    for row in ws.iter_rows(min_row=1, max_row=200, max_col=2, values_only=True):
+        k = row[0] if row else None
+        if k is None:
+            break
+        cfg[str(k).strip()] = _json_value(row[1] if len(row) > 1 else None)
+    return cfg
+
+
+def _read_overrides(ws) -> Dict[str, Dict[str, float]]:
+    overrides: Dict[str, Dict[str, float]] = {}
+    for row in ws.iter_rows(min_row=2, max_row=499, max_col=4, values_only=True):
+        row = tuple(row) + (None,) * (4 - len(row))
+        sym, usdt, tp, sl = row[:4]
+        if sym is None:
+            break
+        sym = str(sym).strip()
+        if not sym:
+            continue
+        o: Dict[str, float] = {}
+        if usdt not in (None, ""):
+            o["USDT_SIZE"] = _safe_float(usdt, 0.0)
+        if tp not in (None, ""):
+            o["TP_PCT"] = _safe_float(tp, 0.0)
+        if sl not in (None, ""):
+            o["SL_PCT"] = _safe_float(sl, 0.0)
+        if o:
+            overrides[sym] = o
+    return overrides
+
+
+def _read_rules(ws) -> Tuple[Tuple[str, str, str, float, bool], ...]:
+    rules = []
+    for i, row in enumerate(ws.iter_rows(min_row=2, max_row=199, max_col=5, values_only=True)):
+        row = tuple(row) + (None,) * (5 - len(row))
+        name, rtype, expr, weight, enabled = row[:5]
+        if name is None and expr is None:
+            break
+        rules.append((
+            str(name or f"rule_{i + 1}").strip(),
+            str(rtype or "").strip().upper(),
+            str(expr or "").strip(),
+            _safe_float(weight, 1.0) if weight not in (None, "") else 1.0,
+            True if enabled in (None, "") else _bool(enabled),
+        ))
+    return tuple(rules)
+
+
+def _parse_symbols(cfg: Dict[str, Any]) -> Tuple[str, ...]:
+    symbols_csv = str(cfg.get("SYMBOLS_CSV") or "").strip()
+    if symbols_csv:
+        return tuple(s.strip() for s in symbols_csv.split(",") if s.strip())
+    # fallback single symbol
+    return (str(cfg.get("SYMBOL") or "BTC/USDT").strip(),)
+
+
+def compile_brain(path: Path, sha256: str = "") -> GeneratorConfig:
+    """Full parse (read_only: streams the sheet XML instead of building the whole workbook)."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if "GENERATOR_CONFIG" not in wb.sheetnames:
+            raise ValueError("GENERATOR_CONFIG sheet missing")
+        cfg = _read_kv(wb["GENERATOR_CONFIG"])
+        overrides = _read_overrides(wb["SYMBOL_OVERRIDES"]) if "SYMBOL_OVERRIDES" in wb.sheetnames else {}
+        rules = _read_rules(wb["RULES"]) if "RULES" in wb.sheetnames else ()
+    finally:
+        wb.close()
+
+    gc = GeneratorConfig.from_dict({
+        "enabled": _bool(cfg.get("ENABLED", False)),
+        "symbols": _parse_symbols(cfg),
+        "max_open": _safe_int(cfg.get("MAX_OPEN_POSITIONS"), 1),
+        "tf": str(cfg.get("TIMEFRAME") or "1m").strip(),
+        "limit": _safe_int(cfg.get("LIMIT"), 50),
+        "ma_period": _safe_int(cfg.get("MA_PERIOD"), 20),
+        "min_conf": _safe_float(cfg.get("MIN_CONF"), 0.70),
+        "usdt_size": _safe_float(cfg.get("USDT_SIZE"), 1.0),
+        "tp_pct": _safe_float(cfg.get("TP_PCT"), 0.03),
+        "sl_pct": _safe_float(cfg.get("SL_PCT"), 0.015),
+        "sl_buf": _safe_float(cfg.get("SL_LIMIT_BUFFER_PCT"), 0.001),
+        "cooldown_s": _safe_int(cfg.get("COOLDOWN_SECONDS"), 600),
+        "max_signals_per_hour": _safe_int(cfg.get("MAX_SIGNALS_PER_HOUR"), 0),
+        "direction": str(cfg.get("DIRECTION") or "LONG").strip().upper(),
+        "overrides": overrides,
+        "rules": rules,
+        "raw": cfg,
+        "sha256": sha256,
+    })
+    # validation at load time (raises RuleError with every bad row)
+    gc.ruleset()
+    return gc
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BrainConfigCache:
+    def __init__(self, path: Path, sidecar: Optional[Path] = None):
+        self.path = Path(path)
+        self.sidecar = Path(sidecar) if sidecar else self.path.with_suffix(".compiled.json")
+        self._key: Optional[Tuple[int, int]] = None
+        self._config: Optional[GeneratorConfig] = None
+        # sha256 of a version that failed to compile: not re-parsed every loop
+        self._rejected: Optional[str] = None
+
+    def get(self) -> GeneratorConfig:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"brain.xlsx not found at {self.path}")
+        key = (st.st_mtime_ns, st.st_size)
+        if self._config is not None and key == self._key:
+            return self._config
+        return self._refresh(key)
+
+    def _read_sidecar(self) -> Optional[Dict[str, Any]]:
+        try:
+            blob = json.loads(self.sidecar.read_text(encoding="utf-8"))
+            return blob if blob.get("version") == CONFIG_VERSION else None
+        except Exception:
+            return None
+
+    def _write_sidecar(self, key: Tuple[int, int], cfg: GeneratorConfig) -> None:
+        blob = {
+            "version": CONFIG_VERSION,
+            "mtime_ns": key[0],
+            "size": key[1],
+            "sha256": cfg.sha256,
+            "config": cfg.to_dict(),
+        }
+        try:
+            tmp = self.sidecar.with_suffix(".tmp")
+            tmp.write_text(json.dumps(blob, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+            tmp.replace(self.sidecar)
+        except Exception as e:
+            # cache only: a read-only disk costs a parse per restart, nothing more
+            logger.warning("BRAIN_CONFIG_SIDECAR_WRITE_FAIL | path=%s err=%s", self.sidecar, e)
+
+    def _refresh(self, key: Tuple[int, int]) -> GeneratorConfig:
+        t0 = time.perf_counter()
+        sha = _sha256(self.path)
+        if self._config is not None and sha == self._config.sha256:
+            self._key = key
+            return self._config
+        if self._config is not None and sha == self._rejected:
+            self._key = key
+            return self._config
+
+        side = self._read_sidecar()
+        if side is not None and side.get("sha256") == sha:
+            cfg = GeneratorConfig.from_dict(side["config"])
+            source = "sidecar"
+            if (side.get("mtime_ns"), side.get("size")) != key:
+                self._write_sidecar(key, cfg)
+        else:
+            try:
+                cfg = compile_brain(self.path, sha256=sha)
+            except Exception as e:
+                if self._config is None:
+                    raise
+                self._rejected, self._key = sha, key
+                logger.error("BRAIN_CONFIG_INVALID | sha=%s keeping=%s err=%s", sha[:12], self._config.sha256[:12], e)
+                try:
+                    from execution.db.repository import log_event
+                    log_event("BRAIN_CONFIG_INVALID", f"sha={sha[:12]} keeping={self._config.sha256[:12]} err={e}")
+                except Exception:
+                    pass
+                return self._config
+            source = "xlsx"
+            self._write_sidecar(key, cfg)
+
+        prev = self._config.sha256[:12] if self._config is not None else "-"
+        self._config, self._key, self._rejected = cfg, key, None
+        ms = (time.perf_counter() - t0) * 1000
+        logger.info("BRAIN_CONFIG_RELOAD | source=%s sha=%s prev=%s symbols=%s rules=%s ms=%.1f", source, sha[:12], prev, len(cfg.symbols), len(cfg.rules), ms)
+        try:
+            from execution.db.repository import log_event
+            log_event("BRAIN_CONFIG_RELOAD", f"source={source} sha={sha[:12]} prev={prev} symbols={len(cfg.symbols)} rules={len(cfg.rules)} ms={ms:.1f}")
+        except Exception:
+            pass
+        return cfg
+
+
+_caches: Dict[str, BrainConfigCache] = {}
+
+
+def get_brain_config(path: Path) -> GeneratorConfig:
+    """Process-wide cache per path; sidecar at BRAIN_CONFIG_CACHE_PATH or <brain>.compiled.json."""
+    key = str(path)
+    cache = _caches.get(key)
+    if cache is None:
+        sidecar = os.getenv("BRAIN_CONFIG_CACHE_PATH", "").strip() or None
+        cache = _caches[key] = BrainConfigCache(Path(path), Path(sidecar) if sidecar else None)
+    return cache.get()
@@ -0,0 +1,288 @@
+# execution/candle_store.py
+"""
+Local OHLCV store: one append-only float64 file per symbol/timeframe, read through np.memmap.
+
+  row = [ts_ms, open, high, low, close, volume]   (48 bytes)
+  file = {CANDLE_STORE_DIR}/{BASE}_{QUOTE}_{tf}.f64
+
+sync() fetches only candles from the last stored timestamp on (the last stored candle is
+usually still forming, so it is refetched and overwritten in place), pages forward after
+downtime, and repairs holes inside the requested window. view() returns a read-only
+zero-copy array for the generator and backtest tooling.
+
+CLI (deep history):
+  python -m execution.candle_store backfill --symbols BTC/USDT,ETH/USDT --tf 1m --days 365
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from execution import clock
+
+logger = logging.getLogger("gbm")
+
+COLS = 6
+ROW_BYTES = COLS * 8
+FETCH_LIMIT = 1000  # Binance klines max per request
+
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(COLS)
+
+_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+
+def timeframe_ms(tf: str) -> int:
+    tf = str(tf).strip()
+    unit = tf[-1:]
+    if unit not in _UNIT_MS or not tf[:-1].isdigit():
+        raise ValueError(f"unsupported timeframe: {tf}")
+    return int(tf[:-1]) * _UNIT_MS[unit]
+
+
+def _empty() -> np.ndarray:
+    return np.empty((0, COLS), dtype=np.float64)
+
+
+class CandleStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._maps: Dict[Tuple[str, str], Tuple[int, np.ndarray]] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # holes the exchange itself does not have (maintenance windows): don't refetch every loop
+        self._known_gaps: Set[Tuple[str, str, float]] = set()
+
+    # ----------------------------
+    # files / views
+    # ----------------------------
+    def path(self, symbol: str, tf: str) -> Path:
+        safe = str(symbol).upper().replace("/", "_").replace(":", "_")
+        return self.root / f"{safe}_{tf}.f64"
+
+    def _lock(self, symbol: str, tf: str) -> threading.Lock:
+        key = (symbol, tf)
+        with self._locks_guard:
+            lk = self._locks.get(key)
+            if lk is None:
+                lk = self._locks[key] = threading.Lock()
+            return lk
+
+    def view(self, symbol: str, tf: str) -> np.ndarray:
+        """Read-only (n, 6) view over the file; remapped only when the file grows/shrinks."""
+        p = self.path(symbol, tf)
+        try:
+            size = p.stat().st_size
+        except FileNotFoundError:
+            return _empty()
+        n = size // ROW_BYTES
+        if n == 0:
+            return _empty()
+
+        key = (symbol, tf)
+        hit = self._maps.get(key)
+        if hit is not None and hit[0] == n:
+            return hit[1]
+        mm = np.memmap(p, dtype=np.float64, mode="r", shape=(n, COLS))
+        self._maps[key] = (n, mm)
+        return mm
+
+    def last_ts(self, symbol: str, tf: str) -> Optional[float]:
+        v = self.view(symbol, tf)
+        return float(v[-1, TS]) if v.shape[0] else None
+
+    def symbols(self, tf: str) -> List[str]:
+        out = []
+        suffix = f"_{tf}.f64"
+        for p in sorted(self.root.glob(f"*{suffix}")):
+            base_quote = p.name[: -len(suffix)]
+            parts = base_quote.split("_", 1)
+            out.append("/".join(parts) if len(parts) == 2 else base_quote)
+        return out
+
+    # ----------------------------
+    # writes
+    # ----------------------------
+    def write(self, symbol: str, tf: str, rows: Any) -> int:
+        """
+        Merges candles into the store. Returns number of rows appended.
+          - rows at/after the last stored ts: tail overwritten in place + append (fast path)
+          - rows older than the tail (gap repair): merge + rewrite
+        """
+        new = np.asarray(rows, dtype=np.float64)
+        if new.size == 0:
+            return 0
+        new = new.reshape(-1, COLS) if new.ndim == 1 else new[:, :COLS]
+        new = new[np.argsort(new[:, TS], kind="stable")]
+        # last occurrence wins for duplicate timestamps
+        _, idx = np.unique(new[::-1, TS], return_index=True)
+        new = new[::-1][idx]
+
+        p = self.path(symbol, tf)
+        with self._lock(symbol, tf):
+            cur = self.view(symbol, tf)
+            n = cur.shape[0]
+            if n == 0:
+                self._rewrite(p, new)
+                return int(new.shape[0])
+
+            first_new = new[0, TS]
+            # position in existing data where the new block starts
+            pos = int(np.searchsorted(cur[:, TS], first_new, side="left"))
+            overlap = n - pos
+            if overlap <= new.shape[0] and (overlap == 0 or np.array_equal(cur[pos:, TS], new[:overlap, TS])):
+                with open(p, "r+b") as f:
+                    f.seek(pos * ROW_BYTES)
+                    f.write(np.ascontiguousarray(new).tobytes())
+                self._maps.pop((symbol, tf), None)
+                return int(new.shape[0] - overlap)
+
+            merged = np.concatenate([np.asarray(cur), new])
+            _, idx = np.unique(merged[::-1, TS], return_index=True)
+            merged = merged[::-1][idx]
+            self._rewrite(p, merged)
+            return int(merged.shape[0] - n)
+
+    def _rewrite(self, p: Path, arr: np.ndarray) -> None:
+        tmp = p.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._maps = {k: v for k, v in self._maps.items() if self.path(*k) != p}
+        os.replace(tmp, p)
+
+    # ----------------------------
+    # exchange sync
+    # ----------------------------
+    def _fetch(self, ex: Any, symbol: str, tf: str, since: Optional[int], limit: int) -> List[List[float]]:
+        if since is None:
+            return ex.fetch_ohlcv(symbol, timeframe=tf, limit=limit)
+        return ex.fetch_ohlcv(symbol, timeframe=tf, since=int(since), limit=limit)
+
+    def fetch_range(self, ex: Any, symbol: str, tf: str, since_ms: float, until_ms: Optional[float] = None) -> int:
+        """Pages forward from since_ms (inclusive) until until_ms / now. Returns rows appended."""
+        step = timeframe_ms(tf)
+        until = float(until_ms) if until_ms is not None else clock.now() * 1000.0
+        since = int(since_ms)
+        added = 0
+        while since <= until:
+            need = int((until - since) // step) + 1
+            rows = self._fetch(ex, symbol, tf, since, max(1, min(FETCH_LIMIT, need)))
+            if not rows:
+                break
+            added += self.write(symbol, tf, rows)
+            last = float(rows[-1][TS])
+            if len(rows) < min(FETCH_LIMIT, need) or last + step <= since:
+                break
+            since = int(last + step)
+        return added
+
+    def sync(self, ex: Any, symbol: str, tf: str, min_rows: int) -> np.ndarray:
+        """
+        Brings symbol/tf up to date and guarantees (when the exchange has them) at least
+        min_rows contiguous recent candles. Returns the full view.
+        """
+        step = timeframe_ms(tf)
+        now_ms = clock.now() * 1000.0
+        v = self.view(symbol, tf)
+
+        if v.shape[0] == 0:
+            # cold start: the window (+ deeper history only via backfill CLI)
+            self.fetch_range(ex, symbol, tf, now_ms - step * (int(min_rows) - 1) - (now_ms % step))
+            return self.view(symbol, tf)
+
+        last = float(v[-1, TS])
+        missing = int((now_ms - last) // step) + 1
+        if missing <= FETCH_LIMIT:
+            # steady state: one request, usually 1-2 candles (the forming one + a just-closed one)
+            rows = self._fetch(ex, symbol, tf, int(last), max(2, missing))
+            self.write(symbol, tf, rows)
+        else:
+            # long downtime: restart the window instead of paging through everything missed
+            start = max(last, now_ms - step * (int(min_rows) - 1) - (now_ms % step))
+            self.fetch_range(ex, symbol, tf, start)
+
+        self.repair_gaps(ex, symbol, tf, window=int(min_rows))
+        return self.view(symbol, tf)
+
+    def repair_gaps(self, ex: Any, symbol: str, tf: str, window: int) -> int:
+        """Refetches holes inside the last `window` candles. Returns rows added."""
+        step = timeframe_ms(tf)
+        v = self.view(symbol, tf)
+        if v.shape[0] < 2:
+            return 0
+        ts = np.asarray(v[-int(window):, TS]) if window > 0 else np.asarray(v[:, TS])
+        holes = np.flatnonzero(np.diff(ts) > step)
+        added = 0
+        for h in holes:
+            start = float(ts[h] + step)
+            end = float(ts[h + 1] - step)
+            key = (symbol, tf, start)
+            if key in self._known_gaps:
+                continue
+            got = self.fetch_range(ex, symbol, tf, start, end)
+            if got == 0:
+                self._known_gaps.add(key)
+                logger.info("CANDLE_GAP_UNFILLABLE | %s %s from=%s to=%s", symbol, tf, int(start), int(end))
+            added += got
+        return added
+
+    def window(self, symbol: str, tf: str, n: int) -> np.ndarray:
+        """Last n candles (view, no copy)."""
+        v = self.view(symbol, tf)
+        return v[-int(n):] if n > 0 else v
+
+
+_store: Optional[CandleStore] = None
+
+
+def get_candle_store() -> CandleStore:
+    global _store
+    if _store is None:
+        _store = CandleStore(Path(os.getenv("CANDLE_STORE_DIR", "/var/data/candles")))
+    return _store
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m execution.candle_store")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    bf = sub.add_parser("backfill", help="download history into the store")
+    bf.add_argument("--symbols", required=True, help="comma-separated, e.g. BTC/USDT,ETH/USDT")
+    bf.add_argument("--tf", default="1m")
+    bf.add_argument("--days", type=float, default=30.0)
+    st = sub.add_parser("stats", help="rows / range per stored symbol")
+    st.add_argument("--tf", default="1m")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(asctime)s - %(message)s')
+    store = get_candle_store()
+
+    if args.cmd == "backfill":
+        import ccxt
+        from execution.cassette import wrap_exchange
+
+        ex = wrap_exchange(ccxt.binance({"enableRateLimit": True, "options": {"defaultType": "spot"}}), channel="candle_store")
+        since = time.time() * 1000.0 - args.days * 86_400_000.0
+        for sym in [s.strip() for s in args.symbols.split(",") if s.strip()]:
+            t = time.perf_counter()
+            added = store.fetch_range(ex, sym, args.tf, since)
+            store.repair_gaps(ex, sym, args.tf, window=0)
+            logger.info("CANDLE_BACKFILL | %s %s added=%s rows=%s s=%.1f", sym, args.tf, added, store.view(sym, args.tf).shape[0], time.perf_counter() - t)
+        return 0
+
+    for sym in store.symbols(args.tf):
+        v = store.view(sym, args.tf)
+        if v.shape[0]:
+            print(f"{sym:16s} rows={v.shape[0]:9d} from={int(v[0, TS])} to={int(v[-1, TS])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+# execution/cassette.py
+"""
+Record/replay layer for ccxt exchange instances.
+
+  EXCHANGE_CASSETTE_MODE=off     -> wrap_exchange() returns the exchange untouched (default)
+  EXCHANGE_CASSETTE_MODE=record  -> every call is forwarded and written to the cassette
+  EXCHANGE_CASSETTE_MODE=replay  -> calls are served from the cassette, no network
+
+Cassette = gzip JSON lines, one line per call:
+  {"c": channel, "m": method, "k": args_key, "t": offset_s, "d": elapsed_s, "r": result | "e": error}
+
+Replay speed (EXCHANGE_CASSETTE_SPEED): 1.0 = recorded latency, 2.0 = twice as fast, 0 = no delay.
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("gbm")
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+def _call_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    raw = json.dumps([list(args), kwargs], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _error_class(name: str):
+    try:
+        import ccxt  # type: ignore
+        cls = getattr(ccxt, name, None)
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls
+    except Exception:
+        pass
+    return RuntimeError
+
+
+class Cassette:
+    def __init__(self, path: Path, mode: str, speed: float = 0.0, strict: bool = True):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"invalid cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.speed = float(speed)
+        self.strict = strict
+
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self._fh = None
+
+        # replay: entries in recorded order + two indexes into them (by call key, by method for
+        # non-strict fallback); _used marks entries consumed through either index
+        self._entries: List[Dict[str, Any]] = []
+        self._used: List[bool] = []
+        self._by_key: Dict[Tuple[str, str, str], Deque[int]] = {}
+        self._by_method: Dict[Tuple[str, str], Deque[int]] = {}
+
+        if mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = gzip.open(self.path, "at", encoding="utf-8")
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"cassette not found: {self.path}")
+        n = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                e = json.loads(line)
+                self._by_key.setdefault((e["c"], e["m"], e["k"]), deque()).append(n)
+                self._by_method.setdefault((e["c"], e["m"]), deque()).append(n)
+                self._entries.append(e)
+                self._used.append(False)
+                n += 1
+        logger.info("CASSETTE_LOADED | path=%s entries=%s", self.path, n)
+
+    def _take(self, q: Optional[Deque[int]]) -> Optional[Dict[str, Any]]:
+        # serve in recorded order, skipping entries already served through the other index;
+        # the last entry keeps being served once the queue runs dry
+        if not q:
+            return None
+        while len(q) > 1 and self._used[q[0]]:
+            q.popleft()
+        i = q.popleft() if len(q) > 1 else q[0]
+        self._used[i] = True
+        return self._entries[i]
+
+    def call(self, channel: str, method: str, fn, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any:
+        key = _call_key(args, kwargs)
+        if self.mode == "replay":
+            return self._replay(channel, method, key)
+
+        t = time.monotonic()
+        entry: Dict[str, Any] = {"c": channel, "m": method, "k": key, "t": round(t - self._t0, 6)}
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            entry["d"] = round(time.monotonic() - t, 6)
+            entry["e"] = {"type": type(e).__name__, "msg": str(e)}
+            self._write(entry)
+            raise
+        entry["d"] = round(time.monotonic() - t, 6)
+        entry["r"] = result
+        self._write(entry)
+        return result
+
+    def _replay(self, channel: str, method: str, key: str) -> Any:
+        with self._lock:
+            e = self._take(self._by_key.get((channel, method, key)))
+            if e is None and not self.strict:
+                e = self._take(self._by_method.get((channel, method)))
+        if e is None:
+            raise CassetteMiss(f"no recorded call for {channel}.{method} key={key}")
+
+        if self.speed > 0:
+            time.sleep(float(e.get("d") or 0.0) / self.speed)
+
+        if "e" in e:
+            err = e["e"] or {}
+            raise _error_class(str(err.get("type") or ""))(err.get("msg") or "")
+        return e.get("r")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, default=str, separators=(",", ":"))
+        with self._lock:
+            if self._fh is not None:
+                self._fh.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class CassetteExchange:
+    """
+    Transparent proxy around a ccxt exchange.
+    Public method calls go through the cassette; plain attributes (urls, options, rateLimit)
+    are read from and written to the wrapped instance.
+    """
+
+    def __init__(self, inner: Any, cassette: Cassette, channel: str):
+        object.__setattr__(self, "_inner", inner)
+        object.__setattr__(self, "_cassette", cassette)
+        object.__setattr__(self, "_channel", channel)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._inner, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        cassette = self._cassette
+        channel = self._channel
+
+        def _call(*args, **kwargs):
+            return cassette.call(channel, name, attr, args, kwargs)
+
+        return _call
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._inner, name, value)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_registry_lock = threading.Lock()
+
+
+def _close_all() -> None:
+    for c in list(_cassettes.values()):
+        try:
+            c.close()
+        except Exception:
+            pass
+
+
+atexit.register(_close_all)
+
+
+def get_cassette(path: Path, mode: str, speed: float = 0.0, strict: bool = True) -> Cassette:
+    """One Cassette per file per process, shared by every wrapped exchange."""
+    k = str(Path(path).resolve())
+    with _registry_lock:
+        c = _cassettes.get(k)
+        if c is None:
+            c = Cassette(Path(path), mode=mode, speed=speed, strict=strict)
+            _cassettes[k] = c
+        return c
+
+
+def wrap_exchange(exchange: Any, channel: str) -> Any:
+    """
+    Wraps a ccxt instance according to EXCHANGE_CASSETTE_* env.
+    channel separates streams inside one cassette (spot_client / price_feed / generator).
+    """
+    mode = os.getenv("EXCHANGE_CASSETTE_MODE", "off").strip().lower()
+    if mode not in MODES:
+        logger.warning("CASSETTE_MODE_INVALID | mode=%s -> off", mode)
+        mode = "off"
+    if mode == "off":
+        return exchange
+
+    path = Path(os.getenv("EXCHANGE_CASSETTE_PATH", "/var/data/cassettes/exchange.jsonl.gz"))
+    speed = float(os.getenv("EXCHANGE_CASSETTE_SPEED", "0"))
+    strict = _env_bool("EXCHANGE_CASSETTE_STRICT", "true")
+
+    cassette = get_cassette(path, mode=mode, speed=speed, strict=strict)
+    logger.info("CASSETTE_WRAP | channel=%s mode=%s path=%s", channel, mode, path)
+    return CassetteExchange(exchange, cassette, channel)
+
+
+def summarize(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Per channel.method call counts, errors and latency (recorded)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            e = json.loads(line)
+            s = out.setdefault(f"{e['c']}.{e['m']}", {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            d = float(e.get("d") or 0.0)
+            s["calls"] += 1
+            s["errors"] += 1 if "e" in e else 0
+            s["total_s"] += d
+            s["max_s"] = max(s["max_s"], d)
+    for s in out.values():
+        s["avg_ms"] = round(1000.0 * s["total_s"] / s["calls"], 3) if s["calls"] else 0.0
+        s["max_ms"] = round(1000.0 * s.pop("max_s"), 3)
+        s.pop("total_s")
+    return out
+
+
+if __name__ == "__main__":
+    # python -m execution.cassette <cassette.jsonl.gz>
+    if len(sys.argv) != 2:
+        print("usage: python -m execution.cassette <cassette.jsonl.gz>")
+        sys.exit(2)
+    for name, s in sorted(summarize(Path(sys.argv[1])).items()):
+        print(f"{name:40s} calls={s['calls']:6d} errors={s['errors']:4d} avg_ms={s['avg_ms']:9.3f} max_ms={s['max_ms']:9.3f}")
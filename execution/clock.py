@@ -0,0 +1,66 @@
+# execution/clock.py
+"""
+Process-wide clock.
+
+Runtime uses WallClock. Backtests / replays install a VirtualClock with set_clock();
+sleep() then advances virtual time instead of blocking.
+"""
+import time
+from typing import Optional
+
+
+class WallClock:
+    def now(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0):
+        self.t = float(start)
+
+    def now(self) -> float:
+        return self.t
+
+    def monotonic(self) -> float:
+        return self.t
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.t += float(seconds)
+
+    def advance_to(self, ts: float) -> None:
+        # never goes backwards
+        if ts > self.t:
+            self.t = float(ts)
+
+
+_clock = WallClock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock: Optional[object]) -> None:
+    """Install a clock (None -> back to wall clock)."""
+    global _clock
+    _clock = clock if clock is not None else WallClock()
+
+
+def now() -> float:
+    return _clock.now()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    _clock.sleep(seconds)
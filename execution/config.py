@@ -1,32 +1,41 @@
-# execution/config.py
-import os
-from pathlib import Path
-
-
-def _env_bool(name: str, default: str = "false") -> bool:
-    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "y", "on")
-
-
-# რეჟიმი: DEMO | TESTNET | LIVE
-MODE = os.getenv("MODE", "DEMO").strip().upper()
-if MODE not in ("DEMO", "TESTNET", "LIVE"):
-    MODE = "DEMO"
-
-# LIVE/TESTNET-ზე დამატებითი დაცვა (დროებით იგივე gate ორივეზე)
-LIVE_CONFIRMATION = _env_bool("LIVE_CONFIRMATION", "false")
-
-# Startup sync gate
-STARTUP_SYNC_ENABLED = _env_bool("STARTUP_SYNC_ENABLED", "true")
-
-# DEMO ბალანსი
-VIRTUAL_START_BALANCE = float(os.getenv("VIRTUAL_START_BALANCE", "100000"))
-
-# Binance keys (TESTNET/LIVE-ზე უნდა იყოს)
-BINANCE_API_KEY = os.getenv("BINANCE_API_KEY", "").strip()
-BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET", "").strip()
-
-# Kill switch (Render-ზე default TRUE უსაფრთხოდ)
-KILL_SWITCH = _env_bool("KILL_SWITCH", "true")
-
-# Persistent DB path (Render disk)
-DB_PATH = Path(os.getenv("DB_PATH", "/var/data/genius_bot.db"))
+# execution/config.py
+import os
+from pathlib import Path
+
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+# რეჟიმი: DEMO | TESTNET | LIVE
+MODE = os.getenv("MODE", "DEMO").strip().upper()
+if MODE not in ("DEMO", "TESTNET", "LIVE"):
+    MODE = "DEMO"
+
+# LIVE/TESTNET-ზე დამატებითი დაცვა (დროებით იგივე gate ორივეზე)
+LIVE_CONFIRMATION = _env_bool("LIVE_CONFIRMATION", "false")
+
+# Startup sync gate
+STARTUP_SYNC_ENABLED = _env_bool("STARTUP_SYNC_ENABLED", "true")
+
+# DEMO ბალანსი
+VIRTUAL_START_BALANCE = float(os.getenv("VIRTUAL_START_BALANCE", "100000"))
+DEMO_QUOTE_ASSET = os.getenv("DEMO_QUOTE_ASSET", "USDT").strip().upper()
+# DEMO fee (%), Binance spot taker default
+DEMO_FEE_PCT = float(os.getenv("DEMO_FEE_PCT", "0.10"))
+# DEMO ledger checkpoint: every N seconds or every N fills (whichever first)
+DEMO_CHECKPOINT_SECONDS = float(os.getenv("DEMO_CHECKPOINT_SECONDS", "30"))
+DEMO_CHECKPOINT_FILLS = int(os.getenv("DEMO_CHECKPOINT_FILLS", "20"))
+
+# PnL/drawdown quote asset (LIVE/TESTNET start equity = free balance of this asset)
+PNL_QUOTE_ASSET = os.getenv("PNL_QUOTE_ASSET", DEMO_QUOTE_ASSET).strip().upper()
+
+# Binance keys (TESTNET/LIVE-ზე უნდა იყოს)
+BINANCE_API_KEY = os.getenv("BINANCE_API_KEY", "").strip()
+BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET", "").strip()
+
+# Kill switch (Render-ზე default TRUE უსაფრთხოდ)
+KILL_SWITCH = _env_bool("KILL_SWITCH", "true")
+
+# Persistent DB path (Render disk)
+DB_PATH = Path(os.getenv("DB_PATH", "/var/data/genius_bot.db"))
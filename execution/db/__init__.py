@@ -1 +1 @@
-# db subpackage
+# db subpackage
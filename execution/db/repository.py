@@ -1,255 +1,697 @@
-# execution/db/repository.py
-from datetime import datetime, timezone
-from execution.db.db import get_connection
-
-
-def _utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
-
-
-# ---------------- SYSTEM STATE ----------------
-
-def get_system_state():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM system_state WHERE id = 1")
-    row = cur.fetchone()
-    conn.close()
-    return row
-
-
-def update_system_state(status=None, startup_sync_ok=None, kill_switch=None):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    fields = []
-    values = []
-
-    if status is not None:
-        fields.append("status = ?")
-        values.append(str(status))
-
-    if startup_sync_ok is not None:
-        fields.append("startup_sync_ok = ?")
-        values.append(int(startup_sync_ok))
-
-    if kill_switch is not None:
-        fields.append("kill_switch = ?")
-        values.append(int(kill_switch))
-
-    fields.append("updated_at = ?")
-    values.append(_utc_now())
-
-    sql = f"UPDATE system_state SET {', '.join(fields)} WHERE id = 1"
-    cur.execute(sql, values)
-
-    conn.commit()
-    conn.close()
-
-
-# ---------------- POSITIONS ----------------
-
-def get_open_positions():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM positions WHERE status = 'OPEN'")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-
-def get_latest_open_position(symbol: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, symbol, side, size, entry_price, status, opened_at, closed_at, pnl
-        FROM positions
-        WHERE status = 'OPEN' AND symbol = ?
-        ORDER BY id DESC
-        LIMIT 1
-        """,
-        (str(symbol),)
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row
-
-
-def open_position(symbol, side, size, entry_price):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO positions
-        (symbol, side, size, entry_price, status, opened_at)
-        VALUES (?, ?, ?, ?, 'OPEN', ?)
-        """,
-        (str(symbol), str(side), float(size), float(entry_price), _utc_now())
-    )
-    conn.commit()
-    conn.close()
-
-
-def close_position(position_id: int, close_price: float, pnl: float):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE positions
-        SET status='CLOSED', closed_at=?, pnl=?
-        WHERE id=?
-        """,
-        (_utc_now(), float(pnl), int(position_id))
-    )
-    conn.commit()
-    conn.close()
-
-
-# ---------------- AUDIT LOG ----------------
-
-def log_event(event_type, message):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO audit_log (event_type, message, created_at)
-        VALUES (?, ?, ?)
-        """,
-        (str(event_type), str(message), _utc_now())
-    )
-    conn.commit()
-    conn.close()
-
-
-# ---------------- OCO LINKS ----------------
-
-def create_oco_link(
-    signal_id: str,
-    symbol: str,
-    base_asset: str,
-    tp_order_id: str,
-    sl_order_id: str,
-    tp_price: float,
-    sl_stop_price: float,
-    sl_limit_price: float,
-    amount: float,
-):
-    conn = get_connection()
-    cur = conn.cursor()
-    now = _utc_now()
-    cur.execute(
-        """
-        INSERT INTO oco_links
-        (signal_id, symbol, base_asset, tp_order_id, sl_order_id, tp_price, sl_stop_price, sl_limit_price, amount, status, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'ACTIVE', ?, ?)
-        """,
-        (
-            str(signal_id), str(symbol), str(base_asset),
-            str(tp_order_id), str(sl_order_id),
-            float(tp_price), float(sl_stop_price), float(sl_limit_price),
-            float(amount),
-            now, now
-        )
-    )
-    conn.commit()
-    conn.close()
-
-
-def set_oco_status(link_id: int, status: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE oco_links
-        SET status=?, updated_at=?
-        WHERE id=?
-        """,
-        (str(status), _utc_now(), int(link_id))
-    )
-    conn.commit()
-    conn.close()
-
-
-def list_active_oco_links(limit: int = 50):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, signal_id, symbol, base_asset, tp_order_id, sl_order_id, tp_price, sl_stop_price, sl_limit_price, amount, status, created_at, updated_at
-        FROM oco_links
-        WHERE status='ACTIVE'
-        ORDER BY id DESC
-        LIMIT ?
-        """,
-        (int(limit),)
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-
-def has_active_oco_for_symbol(symbol: str) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT 1
-        FROM oco_links
-        WHERE status='ACTIVE' AND UPPER(symbol)=UPPER(?)
-        LIMIT 1
-        """,
-        (str(symbol),)
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row is not None
-
-
-def get_open_positions_count() -> int:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM positions WHERE status = 'OPEN'")
-    n = int(cur.fetchone()[0] or 0)
-    conn.close()
-    return n
-
-
-# ---------------- EXECUTED SIGNALS (IDEMPOTENCY + AUDIT) ----------------
-
-def signal_id_already_executed(signal_id: str) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT 1 FROM executed_signals WHERE signal_id = ? LIMIT 1",
-        (str(signal_id),)
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row is not None
-
-
-def mark_signal_id_executed(
-    signal_id: str,
-    signal_hash: str = None,
-    action: str = None,
-    symbol: str = None
-):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT OR IGNORE INTO executed_signals
-        (signal_id, signal_hash, action, symbol, executed_at)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (
-            str(signal_id),
-            str(signal_hash) if signal_hash is not None else None,
-            str(action) if action is not None else None,
-            str(symbol) if symbol is not None else None,
-            _utc_now()
-        )
-    )
-    conn.commit()
-    conn.close()
+# execution/db/repository.py
+import time
+from functools import wraps
+from datetime import datetime, timezone
+from typing import Optional
+from execution.db.db import get_connection
+from execution.metrics import histogram
+
+DB_SECONDS = histogram("gbm_db_seconds", "repository call duration (connect + query + commit)", ["op"])
+
+
+def _timed(fn):
+    h = DB_SECONDS.labels(op=fn.__name__)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            h.observe(time.perf_counter() - t0)
+
+    return wrapper
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------------- SYSTEM STATE ----------------
+
+@_timed
+def get_system_state():
+    """
+    tuple: (id, status, startup_sync_ok, kill_switch, updated_at, mode, pause_reason)
+    Explicit columns: physical order differs between fresh and migrated DBs.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, status, startup_sync_ok, kill_switch, updated_at, mode, pause_reason FROM system_state WHERE id = 1"
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+@_timed
+def update_system_state(status=None, startup_sync_ok=None, kill_switch=None, profile_seconds=None):
+    conn = get_connection()
+    cur = conn.cursor()
+
+    fields = []
+    values = []
+
+    if status is not None:
+        fields.append("status = ?")
+        values.append(str(status))
+
+    if startup_sync_ok is not None:
+        fields.append("startup_sync_ok = ?")
+        values.append(int(startup_sync_ok))
+
+    if kill_switch is not None:
+        fields.append("kill_switch = ?")
+        values.append(int(kill_switch))
+
+    if profile_seconds is not None:
+        fields.append("profile_seconds = ?")
+        values.append(int(profile_seconds))
+
+    fields.append("updated_at = ?")
+    values.append(_utc_now())
+
+    sql = f"UPDATE system_state SET {', '.join(fields)} WHERE id = 1"
+    cur.execute(sql, values)
+
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def get_pause_reason() -> Optional[str]:
+    """system_state.pause_reason: set by the guard on a limit breach; new entries are blocked while set."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT pause_reason FROM system_state WHERE id = 1")
+    row = cur.fetchone()
+    conn.close()
+    return str(row[0]) if row and row[0] else None
+
+
+@_timed
+def set_pause_reason(reason: Optional[str]) -> None:
+    """reason=None lifts the entry gate."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE system_state SET pause_reason = ?, updated_at = ? WHERE id = 1",
+        (str(reason) if reason else None, _utc_now()),
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def claim_profile_request(role: str, pid: int) -> int:
+    """
+    Takes the operator's profiling request (system_state.profile_seconds > 0) if it is addressed
+    to this process: profile_target NULL (any process), the role ("worker" / "generator") or the
+    pid. Compare-and-set on the value read, so exactly one poller wins; returns the window length,
+    0 when there is nothing to claim or another process got it first.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT profile_seconds, profile_target FROM system_state WHERE id = 1")
+    row = cur.fetchone()
+    seconds = int(row[0] or 0) if row else 0
+    target = str(row[1] or "").strip() if row else ""
+    if seconds <= 0 or (target and target not in (role, str(pid))):
+        conn.close()
+        return 0
+    cur.execute(
+        "UPDATE system_state SET profile_seconds = 0, profile_target = NULL WHERE id = 1 AND profile_seconds = ?",
+        (seconds,),
+    )
+    claimed = cur.rowcount == 1
+    conn.commit()
+    conn.close()
+    return seconds if claimed else 0
+
+
+# ---------------- POSITIONS ----------------
+
+@_timed
+def get_open_positions():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM positions WHERE status = 'OPEN'")
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_timed
+def get_latest_open_position(symbol: str):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, symbol, side, size, entry_price, status, opened_at, closed_at, pnl
+        FROM positions
+        WHERE status = 'OPEN' AND symbol = ?
+        ORDER BY id DESC
+        LIMIT 1
+        """,
+        (str(symbol),)
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+@_timed
+def open_position(symbol, side, size, entry_price) -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO positions
+        (symbol, side, size, entry_price, status, opened_at)
+        VALUES (?, ?, ?, ?, 'OPEN', ?)
+        """,
+        (str(symbol), str(side), float(size), float(entry_price), _utc_now())
+    )
+    position_id = int(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    return position_id
+
+
+@_timed
+def close_position(position_id: int, close_price: float, pnl: float):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE positions
+        SET status='CLOSED', closed_at=?, pnl=?
+        WHERE id=?
+        """,
+        (_utc_now(), float(pnl), int(position_id))
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def list_open_positions_detail():
+    """Open DEMO-ledger positions (record_demo_entry sets signal_id / entry_fee; LIVE rows don't)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, symbol, side, size, entry_price, signal_id, tp_price, sl_price, entry_fee, opened_at
+        FROM positions
+        WHERE status = 'OPEN' AND (signal_id IS NOT NULL OR entry_fee IS NOT NULL)
+        ORDER BY id ASC
+        """
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+# ---------------- AUDIT LOG ----------------
+
+@_timed
+def log_event(event_type, message):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO audit_log (event_type, message, created_at)
+        VALUES (?, ?, ?)
+        """,
+        (str(event_type), str(message), _utc_now())
+    )
+    conn.commit()
+    conn.close()
+
+
+# ---------------- OCO LINKS ----------------
+
+@_timed
+def create_oco_link(
+    signal_id: str,
+    symbol: str,
+    base_asset: str,
+    tp_order_id: str,
+    sl_order_id: str,
+    tp_price: float,
+    sl_stop_price: float,
+    sl_limit_price: float,
+    amount: float,
+):
+    conn = get_connection()
+    cur = conn.cursor()
+    now = _utc_now()
+    cur.execute(
+        """
+        INSERT INTO oco_links
+        (signal_id, symbol, base_asset, tp_order_id, sl_order_id, tp_price, sl_stop_price, sl_limit_price, amount, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'ACTIVE', ?, ?)
+        """,
+        (
+            str(signal_id), str(symbol), str(base_asset),
+            str(tp_order_id), str(sl_order_id),
+            float(tp_price), float(sl_stop_price), float(sl_limit_price),
+            float(amount),
+            now, now
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def set_oco_status(link_id: int, status: str):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE oco_links
+        SET status=?, updated_at=?
+        WHERE id=?
+        """,
+        (str(status), _utc_now(), int(link_id))
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def list_active_oco_links(limit: int = 50):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, signal_id, symbol, base_asset, tp_order_id, sl_order_id, tp_price, sl_stop_price, sl_limit_price, amount, status, created_at, updated_at
+        FROM oco_links
+        WHERE status='ACTIVE'
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (int(limit),)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_timed
+def has_active_oco_for_symbol(symbol: str) -> bool:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT 1
+        FROM oco_links
+        WHERE status='ACTIVE' AND UPPER(symbol)=UPPER(?)
+        LIMIT 1
+        """,
+        (str(symbol),)
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row is not None
+
+
+@_timed
+def get_open_positions_count() -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM positions WHERE status = 'OPEN'")
+    n = int(cur.fetchone()[0] or 0)
+    conn.close()
+    return n
+
+
+# ---------------- EXECUTED SIGNALS (IDEMPOTENCY + AUDIT) ----------------
+
+@_timed
+def signal_id_already_executed(signal_id: str) -> bool:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT 1 FROM executed_signals WHERE signal_id = ? LIMIT 1",
+        (str(signal_id),)
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row is not None
+
+
+@_timed
+def mark_signal_id_executed(
+    signal_id: str,
+    signal_hash: str = None,
+    action: str = None,
+    symbol: str = None
+):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO executed_signals
+        (signal_id, signal_hash, action, symbol, executed_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            str(signal_id),
+            str(signal_hash) if signal_hash is not None else None,
+            str(action) if action is not None else None,
+            str(symbol) if symbol is not None else None,
+            _utc_now()
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+# ---------------- DEMO LEDGER ----------------
+
+@_timed
+def record_demo_entry(
+    signal_id: str,
+    symbol: str,
+    side: str,
+    size: float,
+    price: float,
+    fee: float,
+    fee_asset: str,
+    tp_price: float = None,
+    sl_price: float = None,
+) -> tuple:
+    """
+    Opens a DEMO position and writes its entry fill in one transaction.
+    Returns (position_id, fill_id).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    now = _utc_now()
+    cur.execute(
+        """
+        INSERT INTO positions
+        (symbol, side, size, entry_price, status, opened_at, signal_id, tp_price, sl_price, entry_fee)
+        VALUES (?, ?, ?, ?, 'OPEN', ?, ?, ?, ?, ?)
+        """,
+        (
+            str(symbol), str(side), float(size), float(price), now,
+            str(signal_id) if signal_id is not None else None,
+            float(tp_price) if tp_price is not None else None,
+            float(sl_price) if sl_price is not None else None,
+            float(fee),
+        )
+    )
+    position_id = int(cur.lastrowid)
+    cur.execute(
+        """
+        INSERT INTO demo_fills
+        (signal_id, position_id, symbol, side, size, price, fee, fee_asset, pnl, reason, created_at)
+        VALUES (?, ?, ?, 'BUY', ?, ?, ?, ?, NULL, 'ENTRY', ?)
+        """,
+        (
+            str(signal_id) if signal_id is not None else None, position_id,
+            str(symbol), float(size), float(price), float(fee), str(fee_asset), now
+        )
+    )
+    fill_id = int(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    return position_id, fill_id
+
+
+@_timed
+def record_demo_exit(
+    position_id: int,
+    signal_id: str,
+    symbol: str,
+    size: float,
+    price: float,
+    fee: float,
+    fee_asset: str,
+    pnl: float,
+    reason: str,
+) -> int:
+    """
+    Closes a DEMO position and writes its exit fill in one transaction.
+    Returns fill_id.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    now = _utc_now()
+    cur.execute(
+        """
+        UPDATE positions
+        SET status='CLOSED', closed_at=?, pnl=?
+        WHERE id=?
+        """,
+        (now, float(pnl), int(position_id))
+    )
+    cur.execute(
+        """
+        INSERT INTO demo_fills
+        (signal_id, position_id, symbol, side, size, price, fee, fee_asset, pnl, reason, created_at)
+        VALUES (?, ?, ?, 'SELL', ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            str(signal_id) if signal_id is not None else None, int(position_id),
+            str(symbol), float(size), float(price), float(fee), str(fee_asset),
+            float(pnl), str(reason), now
+        )
+    )
+    fill_id = int(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    return fill_id
+
+
+@_timed
+def list_demo_fills_after(fill_id: int):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, signal_id, position_id, symbol, side, size, price, fee, fee_asset, pnl, reason, created_at
+        FROM demo_fills
+        WHERE id > ?
+        ORDER BY id ASC
+        """,
+        (int(fill_id),)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_timed
+def get_demo_wallet_checkpoint():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT balances_json, realized_pnl, fees_paid, last_fill_id, updated_at FROM demo_wallet WHERE id = 1"
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+@_timed
+def save_demo_wallet_checkpoint(balances_json: str, realized_pnl: float, fees_paid: float, last_fill_id: int):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO demo_wallet (id, balances_json, realized_pnl, fees_paid, last_fill_id, updated_at)
+        VALUES (1, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            balances_json=excluded.balances_json,
+            realized_pnl=excluded.realized_pnl,
+            fees_paid=excluded.fees_paid,
+            last_fill_id=excluded.last_fill_id,
+            updated_at=excluded.updated_at
+        """,
+        (str(balances_json), float(realized_pnl), float(fees_paid), int(last_fill_id), _utc_now())
+    )
+    conn.commit()
+    conn.close()
+
+
+# ---------------- PNL / RISK STATE ----------------
+
+@_timed
+def insert_pnl_event(
+    source: str,
+    ref: str,
+    symbol: str,
+    side: str,
+    qty: float,
+    price: float,
+    fee: float,
+    realized: float,
+    created_at: str = None,
+) -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO pnl_events (source, ref, symbol, side, qty, price, fee, realized, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            str(source), str(ref) if ref is not None else None, str(symbol), str(side),
+            float(qty), float(price), float(fee), float(realized),
+            str(created_at) if created_at else _utc_now(),
+        )
+    )
+    event_id = int(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    return event_id
+
+
+@_timed
+def list_pnl_events_after(event_id: int):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, source, ref, symbol, side, qty, price, fee, realized, created_at
+        FROM pnl_events
+        WHERE id > ?
+        ORDER BY id ASC
+        """,
+        (int(event_id),)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_timed
+def get_risk_state():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT daily_loss, daily_profit, max_daily_loss, current_drawdown, max_drawdown, updated_at,
+               day, realized_pnl, realized_today, peak_equity, day_start_equity, day_peak_equity,
+               start_equity, lots_json, last_event_id
+        FROM risk_state
+        WHERE id = 1
+        """
+    )
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+@_timed
+def save_risk_state(
+    daily_loss: float,
+    daily_profit: float,
+    max_daily_loss: float,
+    current_drawdown: float,
+    max_drawdown: float,
+    day: str,
+    realized_pnl: float,
+    realized_today: float,
+    peak_equity: float,
+    day_start_equity: float,
+    day_peak_equity: float,
+    start_equity: float,
+    lots_json: str,
+    last_event_id: int,
+):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO risk_state
+        (id, daily_loss, daily_profit, max_daily_loss, current_drawdown, max_drawdown, updated_at,
+         day, realized_pnl, realized_today, peak_equity, day_start_equity, day_peak_equity,
+         start_equity, lots_json, last_event_id)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            daily_loss=excluded.daily_loss,
+            daily_profit=excluded.daily_profit,
+            max_daily_loss=excluded.max_daily_loss,
+            current_drawdown=excluded.current_drawdown,
+            max_drawdown=excluded.max_drawdown,
+            updated_at=excluded.updated_at,
+            day=excluded.day,
+            realized_pnl=excluded.realized_pnl,
+            realized_today=excluded.realized_today,
+            peak_equity=excluded.peak_equity,
+            day_start_equity=excluded.day_start_equity,
+            day_peak_equity=excluded.day_peak_equity,
+            start_equity=excluded.start_equity,
+            lots_json=excluded.lots_json,
+            last_event_id=excluded.last_event_id
+        """,
+        (
+            float(daily_loss), float(daily_profit), float(max_daily_loss),
+            float(current_drawdown), float(max_drawdown), _utc_now(),
+            str(day), float(realized_pnl), float(realized_today), float(peak_equity),
+            float(day_start_equity), float(day_peak_equity), float(start_equity),
+            str(lots_json), int(last_event_id),
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def insert_signal_history(rows) -> int:
+    """rows: [(symbol, signal_id, source, created_ts), ...] in one transaction."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    conn = get_connection()
+    conn.executemany(
+        """
+        INSERT INTO signal_history (symbol, signal_id, source, created_ts, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                str(symbol), str(signal_id) if signal_id is not None else None, str(source), float(ts),
+                datetime.fromtimestamp(float(ts), timezone.utc).isoformat(),
+            )
+            for (symbol, signal_id, source, ts) in rows
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+@_timed
+def list_signal_history_since(since_ts: float):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT symbol, created_ts
+        FROM signal_history
+        WHERE created_ts >= ?
+        ORDER BY created_ts ASC
+        """,
+        (float(since_ts),)
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_timed
+def prune_signal_history(before_ts: float) -> int:
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM signal_history WHERE created_ts < ?", (float(before_ts),))
+    n = int(cur.rowcount or 0)
+    conn.commit()
+    conn.close()
+    return n
@@ -1,83 +1,148 @@
--- execution/db/schema.sql
-
-CREATE TABLE IF NOT EXISTS system_state (
-    id INTEGER PRIMARY KEY,
-    mode TEXT NOT NULL,
-    status TEXT NOT NULL,
-    kill_switch INTEGER NOT NULL,
-    startup_sync_ok INTEGER NOT NULL,
-    updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS positions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    symbol TEXT NOT NULL,
-    side TEXT NOT NULL,
-    size REAL NOT NULL,
-    entry_price REAL NOT NULL,
-    status TEXT NOT NULL,
-    opened_at TEXT NOT NULL,
-    closed_at TEXT,
-    pnl REAL
-);
-
-CREATE TABLE IF NOT EXISTS orders (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    symbol TEXT NOT NULL,
-    side TEXT NOT NULL,
-    size REAL NOT NULL,
-    price REAL,
-    status TEXT NOT NULL,
-    created_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS risk_state (
-    id INTEGER PRIMARY KEY,
-    daily_loss REAL NOT NULL,
-    daily_profit REAL NOT NULL,
-    max_daily_loss REAL NOT NULL,
-    current_drawdown REAL NOT NULL,
-    max_drawdown REAL NOT NULL,
-    updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS audit_log (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    event_type TEXT NOT NULL,
-    message TEXT NOT NULL,
-    created_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS oco_links (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    signal_id TEXT NOT NULL,
-    symbol TEXT NOT NULL,
-    base_asset TEXT,
-    tp_order_id TEXT,
-    sl_order_id TEXT,
-    tp_price REAL,
-    sl_stop_price REAL,
-    sl_limit_price REAL,
-    amount REAL,
-    status TEXT NOT NULL,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL
-);
-
--- ✅ Double Brain idempotency + audit trail
-CREATE TABLE IF NOT EXISTS executed_signals (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    signal_id TEXT NOT NULL UNIQUE,
-    signal_hash TEXT,
-    action TEXT,
-    symbol TEXT,
-    executed_at TEXT NOT NULL
-);
-
--- Indexes
-CREATE INDEX IF NOT EXISTS ix_audit_event_type ON audit_log(event_type);
-CREATE INDEX IF NOT EXISTS ix_positions_status ON positions(status);
-CREATE INDEX IF NOT EXISTS idx_oco_links_status ON oco_links(status);
-
-
-
+-- execution/db/schema.sql
+
+CREATE TABLE IF NOT EXISTS system_state (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    kill_switch INTEGER NOT NULL,
+    startup_sync_ok INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    profile_seconds INTEGER,
+    profile_target TEXT,
+    pause_reason TEXT
+);
+
+CREATE TABLE IF NOT EXISTS positions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    size REAL NOT NULL,
+    entry_price REAL NOT NULL,
+    status TEXT NOT NULL,
+    opened_at TEXT NOT NULL,
+    closed_at TEXT,
+    pnl REAL,
+    signal_id TEXT,
+    tp_price REAL,
+    sl_price REAL,
+    entry_fee REAL
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    size REAL NOT NULL,
+    price REAL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS risk_state (
+    id INTEGER PRIMARY KEY,
+    daily_loss REAL NOT NULL,
+    daily_profit REAL NOT NULL,
+    max_daily_loss REAL NOT NULL,
+    current_drawdown REAL NOT NULL,
+    max_drawdown REAL NOT NULL,
+    updated_at TEXT NOT NULL,
+    day TEXT,
+    realized_pnl REAL,
+    realized_today REAL,
+    peak_equity REAL,
+    day_start_equity REAL,
+    day_peak_equity REAL,
+    start_equity REAL,
+    lots_json TEXT,
+    last_event_id INTEGER
+);
+
+-- PnL engine input: every fill / close that changes realized PnL (append-only)
+CREATE TABLE IF NOT EXISTS pnl_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    ref TEXT,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    qty REAL NOT NULL,
+    price REAL NOT NULL,
+    fee REAL NOT NULL,
+    realized REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS audit_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS oco_links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signal_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    base_asset TEXT,
+    tp_order_id TEXT,
+    sl_order_id TEXT,
+    tp_price REAL,
+    sl_stop_price REAL,
+    sl_limit_price REAL,
+    amount REAL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- ✅ Double Brain idempotency + audit trail
+CREATE TABLE IF NOT EXISTS executed_signals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signal_id TEXT NOT NULL UNIQUE,
+    signal_hash TEXT,
+    action TEXT,
+    symbol TEXT,
+    executed_at TEXT NOT NULL
+);
+
+-- DEMO ledger: every simulated fill (append-only)
+CREATE TABLE IF NOT EXISTS demo_fills (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signal_id TEXT,
+    position_id INTEGER,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    size REAL NOT NULL,
+    price REAL NOT NULL,
+    fee REAL NOT NULL,
+    fee_asset TEXT NOT NULL,
+    pnl REAL,
+    reason TEXT,
+    created_at TEXT NOT NULL
+);
+
+-- DEMO ledger: periodic checkpoint of in-memory aggregates (single row id=1)
+CREATE TABLE IF NOT EXISTS demo_wallet (
+    id INTEGER PRIMARY KEY,
+    balances_json TEXT NOT NULL,
+    realized_pnl REAL NOT NULL,
+    fees_paid REAL NOT NULL,
+    last_fill_id INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- Generator signal history: cooldowns / per-symbol rate throttles survive restarts
+CREATE TABLE IF NOT EXISTS signal_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    signal_id TEXT,
+    source TEXT NOT NULL,
+    created_ts REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS ix_audit_event_type ON audit_log(event_type);
+CREATE INDEX IF NOT EXISTS ix_positions_status ON positions(status);
+CREATE INDEX IF NOT EXISTS idx_oco_links_status ON oco_links(status);
+CREATE INDEX IF NOT EXISTS idx_demo_fills_position ON demo_fills(position_id);
+CREATE INDEX IF NOT EXISTS idx_signal_history_symbol_ts ON signal_history(symbol, created_ts);
@@ -1,381 +1,577 @@
-import os
-import logging
-from typing import Any, Dict
-
-import ccxt
-
-from execution.db.repository import (
-    get_system_state,
-    log_event,
-    list_active_oco_links,
-    create_oco_link,
-    set_oco_status,
-    update_system_state,
-    signal_id_already_executed,
-    mark_signal_id_executed,
-)
-
-from execution.kill_switch import is_kill_switch_active
-from execution.virtual_wallet import simulate_market_entry
-
-logger = logging.getLogger("gbm")
-
-
-def _to_bool01(v: Any) -> bool:
-    if v is None:
-        return False
-    if isinstance(v, bool):
-        return v
-    if isinstance(v, (int, float)):
-        return int(v) != 0
-    if isinstance(v, str):
-        s = v.strip().lower()
-        return s in ("1", "true", "yes", "y", "on")
-    return False
-
-
-class ExecutionEngine:
-    def __init__(self):
-        self.mode = os.getenv("MODE", "DEMO").upper()
-        self.env_kill_switch = os.getenv("KILL_SWITCH", "false").lower() == "true"
-        self.live_confirmation = os.getenv("LIVE_CONFIRMATION", "false").lower() == "true"
-
-        self.price_feed = ccxt.binance({"enableRateLimit": True})
-
-        self.exchange = None
-        if self.mode in ("LIVE", "TESTNET"):
-            from execution.exchange_client import BinanceSpotClient
-            self.exchange = BinanceSpotClient()
-
-        self.state_debug = os.getenv("STATE_DEBUG", "false").lower() == "true"
-
-        self.tp_pct = float(os.getenv("TP_PCT", "0.30"))
-        self.sl_pct = float(os.getenv("SL_PCT", "1.00"))
-        self.sl_limit_gap_pct = float(os.getenv("SL_LIMIT_GAP_PCT", "0.10"))
-
-        self.sell_buffer = float(os.getenv("SELL_BUFFER", "0.999"))
-        self.sell_retry_buffer = float(os.getenv("SELL_RETRY_BUFFER", "0.995"))
-
-    def _load_system_state(self) -> Dict[str, Any]:
-        raw = get_system_state()
-        if self.state_debug:
-            logger.info(f"SYSTEM_STATE_RAW | type={type(raw)} value={raw}")
-
-        if isinstance(raw, (list, tuple)):
-            status = raw[1] if len(raw) > 1 else ""
-            sync = raw[2] if len(raw) > 2 else 0
-            kill = raw[3] if len(raw) > 3 else 0
-            return {
-                "status": str(status or "").upper(),
-                "startup_sync_ok": _to_bool01(sync),
-                "kill_switch": _to_bool01(kill),
-            }
-
-        if isinstance(raw, dict):
-            return {
-                "status": str(raw.get("status") or "").upper(),
-                "startup_sync_ok": _to_bool01(raw.get("startup_sync_ok")),
-                "kill_switch": _to_bool01(raw.get("kill_switch")),
-            }
-
-        return {"status": "", "startup_sync_ok": False, "kill_switch": False}
-
-    # ----------------------------
-    # OCO reconcile
-    # ----------------------------
-    def reconcile_oco(self) -> None:
-        if self.mode not in ("LIVE", "TESTNET"):
-            return
-        if self.exchange is None:
-            return
-
-        rows = list_active_oco_links(limit=50)
-        if not rows:
-            return
-
-        def _norm(s: Any) -> str:
-            return str(s or "").strip().lower()
-
-        CLOSED = {"closed", "filled"}
-        CANCELED = {"canceled", "cancelled", "expired", "rejected"}
-
-        for r in rows:
-            (
-                link_id, signal_id, symbol, base_asset,
-                tp_order_id, sl_order_id,
-                tp_price, sl_stop_price, sl_limit_price,
-                amount, status, created_at, updated_at
-            ) = r
-
-            if not tp_order_id or not sl_order_id:
-                logger.warning(f"OCO_RECONCILE_SKIP | link={link_id} missing order ids tp='{tp_order_id}' sl='{sl_order_id}'")
-                continue
-
-            try:
-                tp = self.exchange.fetch_order(tp_order_id, symbol)
-                sl = self.exchange.fetch_order(sl_order_id, symbol)
-
-                tp_status = _norm(tp.get("status"))
-                sl_status = _norm(sl.get("status"))
-
-                logger.info(
-                    f"OCO_RECONCILE | link={link_id} id={signal_id} symbol={symbol} "
-                    f"tp={tp_order_id}:{tp_status} sl={sl_order_id}:{sl_status}"
-                )
-
-                if sl_status in CLOSED:
-                    set_oco_status(link_id, "CLOSED_SL")
-                    log_event("OCO_CLOSED", f"{signal_id} SL_FILLED sl={sl_order_id} tp={tp_order_id} tp_status={tp_status}")
-                    continue
-
-                if tp_status in CLOSED:
-                    set_oco_status(link_id, "CLOSED_TP")
-                    log_event("OCO_CLOSED", f"{signal_id} TP_FILLED tp={tp_order_id} sl={sl_order_id} sl_status={sl_status}")
-                    continue
-
-                if (tp_status in CANCELED and sl_status == "open") or (sl_status in CANCELED and tp_status == "open"):
-                    continue
-
-                if tp_status in CANCELED and sl_status in CANCELED:
-                    set_oco_status(link_id, "FAILED")
-                    log_event("OCO_FAILED", f"{signal_id} tp={tp_order_id}:{tp_status} sl={sl_order_id}:{sl_status}")
-                    continue
-
-            except Exception as e:
-                logger.warning(f"OCO_RECONCILE_FAIL | link={link_id} symbol={symbol} err={e}")
-
-    # ----------------------------
-    # Main execution
-    # ----------------------------
-    def execute_signal(self, signal: Dict[str, Any]) -> None:
-        signal_id = str(signal.get("signal_id", "UNKNOWN"))
-        verdict = str(signal.get("final_verdict", "")).upper()
-
-        logger.info(f"EXEC_ENTER | id={signal_id} verdict={verdict} MODE={self.mode} ENV_KILL_SWITCH={self.env_kill_switch}")
-
-        # ✅ IDEMPOTENCY
-        try:
-            if signal_id_already_executed(signal_id):
-                logger.warning(f"EXEC_DEDUPED | duplicate ignored | id={signal_id}")
-                log_event("EXEC_DEDUPED", f"id={signal_id}")
-                return
-        except Exception as e:
-            logger.error(f"EXEC_BLOCKED | idempotency_check_failed | id={signal_id} err={e}")
-            log_event("EXEC_BLOCKED_IDEMPOTENCY_FAIL", f"{signal_id} err={e}")
-            return
-
-        state = self._load_system_state()
-        db_status = str(state.get("status") or "").upper()
-        db_kill = bool(state.get("kill_switch"))
-        sync_ok = bool(state.get("startup_sync_ok"))
-
-        if self.env_kill_switch or db_kill:
-            logger.warning(f"EXEC_BLOCKED | KILL_SWITCH=ON | id={signal_id}")
-            log_event("EXEC_BLOCKED_KILL_SWITCH", f"{signal_id}")
-            return
-
-        if not sync_ok or db_status not in ("ACTIVE", "RUNNING"):
-            logger.warning(f"EXEC_BLOCKED | system not ACTIVE/synced | id={signal_id} status={db_status} sync_ok={sync_ok}")
-            log_event("EXEC_BLOCKED_SYSTEM_STATE", f"{signal_id} status={db_status} sync_ok={sync_ok}")
-            return
-
-        if self.mode == "LIVE" and not self.live_confirmation:
-            logger.warning(f"EXEC_BLOCKED | LIVE_CONFIRMATION=OFF | id={signal_id}")
-            log_event("EXEC_BLOCKED_LIVE_CONFIRMATION", f"{signal_id}")
-            return
-
-        if signal.get("certified_signal") is not True:
-            log_event("REJECT_NOT_CERTIFIED", f"{signal_id}")
-            return
-
-        execution = signal.get("execution") or {}
-        symbol = execution.get("symbol")
-        direction = str(execution.get("direction", "")).upper()
-        entry = execution.get("entry") or {}
-        entry_type = str(entry.get("type", "")).upper()
-
-        position_size = execution.get("position_size")
-        quote_amount = execution.get("quote_amount")
-
-        if not symbol or direction != "LONG" or entry_type != "MARKET":
-            logger.warning(f"EXEC_REJECT | bad payload | id={signal_id} symbol={symbol} dir={direction} entry={entry_type}")
-            log_event("REJECT_BAD_PAYLOAD", f"{signal_id}")
-            return
-
-        signal_hash = signal.get("_fingerprint") or signal.get("signal_hash")
-
-        # DEMO
-        if self.mode == "DEMO":
-            last_price = float(self.price_feed.fetch_ticker(symbol)["last"])
-            base_size = float(position_size) if position_size is not None else float(quote_amount) / float(last_price)
-            resp = simulate_market_entry(symbol=symbol, side=direction, size=base_size, price=last_price)
-
-            log_event("TRADE_EXECUTED", f"{signal_id} DEMO {symbol} size={base_size} price={last_price}")
-            logger.info(f"EXEC_DEMO_OK | id={signal_id} resp={resp}")
-
-            mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="TRADE_DEMO", symbol=str(symbol))
-            return
-
-        # LIVE/TESTNET
-        if self.exchange is None:
-            log_event("EXEC_BLOCKED_NO_EXCHANGE", f"{signal_id}")
-            logger.warning(f"EXEC_BLOCKED | exchange client not wired | id={signal_id}")
-            return
-
-        # import these here (avoid circular)
-        from execution.exchange_client import LiveTradingBlocked
-
-        try:
-            if quote_amount is None:
-                last = self.exchange.fetch_last_price(symbol)
-                quote_amount = float(position_size) * float(last)
-            quote_amount = float(quote_amount)
-
-            # ✅ Binance NOTIONAL gate
-            min_notional = 0.0
-            try:
-                min_notional = float(self.exchange.get_min_notional(symbol))
-            except Exception:
-                min_notional = 0.0
-
-            if min_notional > 0 and quote_amount < min_notional:
-                msg = (
-                    f"EXEC_REJECT | MIN_NOTIONAL | id={signal_id} symbol={symbol} "
-                    f"quote={quote_amount:.8f} < min_notional={min_notional}"
-                )
-                logger.warning(msg)
-                log_event("EXEC_REJECT_MIN_NOTIONAL", msg)
-                mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="REJECT_MIN_NOTIONAL", symbol=str(symbol))
-                return
-
-            # ✅ last-millisecond kill switch
-            if is_kill_switch_active():
-                logger.error(f"KILL_SWITCH_ACTIVE_LAST_GATE | BUY_BLOCKED | id={signal_id}")
-                log_event("EXEC_BLOCKED_KILL_SWITCH_LAST_GATE", f"{signal_id} BUY_BLOCKED")
-                return
-
-            # BUY
-            buy = self.exchange.place_market_buy_by_quote(symbol=symbol, quote_amount=quote_amount)
-            buy_avg = float(buy.get("average") or buy.get("price") or 0.0) or self.exchange.fetch_last_price(symbol)
-
-            logger.info(f"EXEC_LIVE_BUY_OK | id={signal_id} symbol={symbol} quote={quote_amount} avg={buy_avg} order_id={buy.get('id')}")
-            log_event("TRADE_EXECUTED", f"{signal_id} LIVE BUY {symbol} quote={quote_amount} avg={buy_avg} order_id={buy.get('id')}")
-
-            mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="TRADE_LIVE_BUY", symbol=str(symbol))
-
-            base_asset = symbol.split("/")[0].upper()
-            free_base = float(self.exchange.fetch_balance_free(base_asset))
-
-            sell_amount = self.exchange.floor_amount(symbol, free_base * self.sell_buffer)
-            if sell_amount <= 0:
-                sell_amount = self.exchange.floor_amount(symbol, free_base * self.sell_retry_buffer)
-
-            if sell_amount <= 0:
-                msg = f"OCO_SKIP_NO_FREE_BASE | id={signal_id} free_{base_asset}={free_base}"
-                logger.warning(msg)
-                log_event("OCO_SKIP_NO_FREE_BASE", msg)
-                return
-
-            tp_price = self.exchange.floor_price(symbol, buy_avg * (1.0 + (self.tp_pct / 100.0)))
-            sl_stop_price = self.exchange.floor_price(symbol, buy_avg * (1.0 - (self.sl_pct / 100.0)))
-            sl_limit_price = self.exchange.floor_price(symbol, sl_stop_price * (1.0 - (self.sl_limit_gap_pct / 100.0)))
-
-            logger.info(
-                f"OCO_PREP | id={signal_id} free_{base_asset}={free_base} sell_amount={sell_amount} "
-                f"tp={tp_price} sl_stop={sl_stop_price} sl_limit={sl_limit_price}"
-            )
-
-            if is_kill_switch_active():
-                logger.error(f"KILL_SWITCH_ACTIVE_LAST_GATE | OCO_BLOCKED | id={signal_id}")
-                log_event("EXEC_BLOCKED_KILL_SWITCH_LAST_GATE", f"{signal_id} OCO_BLOCKED")
-                return
-
-            # OCO place
-            oco = self.exchange.place_oco_sell(
-                symbol=symbol,
-                base_amount=sell_amount,
-                tp_price=tp_price,
-                sl_stop_price=sl_stop_price,
-                sl_limit_price=sl_limit_price,
-            )
-
-            raw = oco.get("raw") or {}
-            order_reports = raw.get("orderReports") or []
-
-            tp_order_id = None
-            sl_order_id = None
-
-            def _otype(rep):
-                return str(rep.get("type") or rep.get("orderType") or "").upper()
-
-            for rep in order_reports:
-                oid = rep.get("orderId") or rep.get("order_id")
-                if not oid:
-                    continue
-                oid = str(oid)
-                typ = _otype(rep)
-                if "STOP" in typ:
-                    sl_order_id = sl_order_id or oid
-                else:
-                    tp_order_id = tp_order_id or oid
-
-            orders = raw.get("orders") or []
-            if (not tp_order_id or not sl_order_id) and len(orders) >= 2:
-                ids = []
-                for o in orders:
-                    oid = o.get("orderId") or o.get("order_id")
-                    if oid:
-                        ids.append(str(oid))
-                uniq = []
-                for x in ids:
-                    if x not in uniq:
-                        uniq.append(x)
-                if len(uniq) >= 2:
-                    tp_order_id = tp_order_id or uniq[0]
-                    sl_order_id = sl_order_id or uniq[1]
-
-            list_order_id = raw.get("listOrderId") or raw.get("orderListId") or raw.get("list_order_id")
-
-            logger.info(f"OCO_OK | id={signal_id} listOrderId={list_order_id} tp={tp_order_id} sl={sl_order_id}")
-            log_event("OCO_ARMED", f"{signal_id} symbol={symbol} listOrderId={list_order_id} tp={tp_order_id} sl={sl_order_id} amount={sell_amount}")
-
-            if (not list_order_id) or (not tp_order_id) or (not sl_order_id) or (str(tp_order_id) == str(sl_order_id)):
-                msg = (
-                    f"OCO_INVALID | id={signal_id} symbol={symbol} "
-                    f"listOrderId={list_order_id} tp={tp_order_id} sl={sl_order_id} -> PROTECTION_FAILED"
-                )
-                logger.error(msg)
-                log_event("OCO_INVALID", msg)
-
-                update_system_state(kill_switch=1)
-                logger.error("FAILSAFE | DB kill_switch=1 set due to OCO_INVALID")
-                log_event("FAILSAFE_KILL_SWITCH_SET", f"{signal_id} OCO_INVALID")
-                return
-
-            create_oco_link(
-                signal_id=signal_id,
-                symbol=symbol,
-                base_asset=base_asset,
-                tp_order_id=str(tp_order_id or ""),
-                sl_order_id=str(sl_order_id or ""),
-                tp_price=float(tp_price),
-                sl_stop_price=float(sl_stop_price),
-                sl_limit_price=float(sl_limit_price),
-                amount=float(sell_amount),
-            )
-
-            log_event("TRADE_LIVE_ARMED", f"{signal_id} {symbol} OCO_ARMED listOrderId={list_order_id}")
-
-        except LiveTradingBlocked as e:
-            # ✅ This is a controlled safety block, not a crash.
-            msg = f"EXEC_REJECT | LIVE_BLOCKED | id={signal_id} reason={e}"
-            logger.warning(msg)
-            log_event("EXEC_REJECT_LIVE_BLOCKED", msg)
-            # ✅ Mark to prevent endless retry spam
-            mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="REJECT_LIVE_BLOCKED", symbol=str(symbol))
-            return
-
-        except Exception as e:
-            logger.exception(f"EXEC_LIVE_ERROR | id={signal_id} err={e}")
-            log_event("EXEC_LIVE_ERROR", f"{signal_id} err={e}")
-            return
+import os
+import time
+import logging
+from typing import Any, Dict, Iterable, Tuple
+
+from execution.db.repository import (
+    get_system_state,
+    log_event,
+    list_active_oco_links,
+    create_oco_link,
+    set_oco_status,
+    update_system_state,
+    signal_id_already_executed,
+    mark_signal_id_executed,
+)
+
+from execution import clock
+from execution.cassette import wrap_exchange
+from execution.fake_exchange import create_exchange
+from execution.kill_switch import is_kill_switch_active
+from execution.virtual_wallet import simulate_market_entry, get_wallet, VirtualWalletError
+from execution.pnl_engine import get_pnl_engine
+from execution.signal_client import is_signal_expired, signal_expiry_ts, signal_created_ts
+from execution import tracing
+from execution.metrics import counter, histogram
+
+logger = logging.getLogger("gbm")
+
+EXEC_SECONDS = histogram("gbm_exec_seconds", "execute_signal duration (all outcomes)")
+EXEC_TOTAL = counter("gbm_exec_signals_total", "signals passed to execute_signal")
+
+
+def _to_bool01(v: Any) -> bool:
+    if v is None:
+        return False
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return int(v) != 0
+    if isinstance(v, str):
+        s = v.strip().lower()
+        return s in ("1", "true", "yes", "y", "on")
+    return False
+
+
+class ExecutionEngine:
+    def __init__(self):
+        self.mode = os.getenv("MODE", "DEMO").upper()
+        self.env_kill_switch = os.getenv("KILL_SWITCH", "false").lower() == "true"
+        self.live_confirmation = os.getenv("LIVE_CONFIRMATION", "false").lower() == "true"
+
+        self.price_feed = wrap_exchange(create_exchange({"enableRateLimit": True}), channel="price_feed")
+
+        self.exchange = None
+        if self.mode in ("LIVE", "TESTNET"):
+            from execution.exchange_client import BinanceSpotClient
+            self.exchange = BinanceSpotClient()
+
+        self.state_debug = os.getenv("STATE_DEBUG", "false").lower() == "true"
+
+        self.tp_pct = float(os.getenv("TP_PCT", "0.30"))
+        self.sl_pct = float(os.getenv("SL_PCT", "1.00"))
+        self.sl_limit_gap_pct = float(os.getenv("SL_LIMIT_GAP_PCT", "0.10"))
+
+        self.sell_buffer = float(os.getenv("SELL_BUFFER", "0.999"))
+        self.sell_retry_buffer = float(os.getenv("SELL_RETRY_BUFFER", "0.995"))
+
+        # DEMO price cache (entries + simulated TP/SL exits share one feed)
+        self.price_cache_ttl = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "2"))
+        self._price_cache: Dict[str, Tuple[float, float]] = {}
+
+    def _pnl_fill(self, **kwargs) -> None:
+        # risk accounting must never break execution
+        try:
+            get_pnl_engine().on_fill(**kwargs)
+        except Exception as e:
+            logger.warning("PNL_FILL_WARN | %s %s err=%s", kwargs.get("ref"), kwargs.get("symbol"), e)
+            try:
+                log_event("PNL_FILL_WARN", f"{kwargs.get('ref')} {kwargs.get('symbol')} err={e}")
+            except Exception:
+                pass
+
+    def _mark_open_lots(self, prices: Dict[str, float] = None) -> None:
+        try:
+            pnl = get_pnl_engine()
+            symbols = pnl.open_symbols()
+            if not symbols:
+                return
+            if prices is None:
+                prices = self._cached_prices(symbols)
+            for sym in symbols:
+                if sym in prices:
+                    pnl.mark(sym, prices[sym])
+        except Exception as e:
+            logger.warning("PNL_MARK_WARN | err=%s", e)
+
+    @staticmethod
+    def _order_fill(order: Dict[str, Any], fallback_qty: float, fallback_price: float, quote_asset: str) -> Tuple[float, float, float]:
+        """(qty, avg_price, quote_fee) from a ccxt order; base-asset fees reduce qty."""
+        qty = float(order.get("filled") or 0.0) or float(fallback_qty or 0.0)
+        price = float(order.get("average") or order.get("price") or 0.0) or float(fallback_price or 0.0)
+        fee_q = 0.0
+        fee = order.get("fee") or {}
+        cost = float(fee.get("cost") or 0.0)
+        cur = str(fee.get("currency") or "").upper()
+        if cost:
+            if cur == quote_asset:
+                fee_q = cost
+            elif cur and cur == str(order.get("symbol") or "").split("/")[0].upper():
+                qty = max(0.0, qty - cost)
+        return qty, price, fee_q
+
+    def _cached_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """
+        Last prices with a short TTL. Stale/missing symbols are refreshed with one
+        fetch_tickers call (or fetch_ticker for a single symbol).
+        """
+        now = clock.monotonic()
+        out: Dict[str, float] = {}
+        stale = []
+        for sym in symbols:
+            hit = self._price_cache.get(sym)
+            if hit is not None and now - hit[1] <= self.price_cache_ttl:
+                out[sym] = hit[0]
+            else:
+                stale.append(sym)
+
+        if len(stale) == 1:
+            tickers = {stale[0]: self.price_feed.fetch_ticker(stale[0])}
+        elif stale:
+            tickers = self.price_feed.fetch_tickers(stale)
+        else:
+            tickers = {}
+
+        for sym in stale:
+            t = tickers.get(sym) or {}
+            last = t.get("last")
+            if last is None:
+                continue
+            out[sym] = float(last)
+            self._price_cache[sym] = (float(last), now)
+        return out
+
+    def _load_system_state(self) -> Dict[str, Any]:
+        raw = get_system_state()
+        if self.state_debug:
+            logger.debug("SYSTEM_STATE_RAW | type=%s value=%s", type(raw), raw)
+
+        if isinstance(raw, (list, tuple)):
+            status = raw[1] if len(raw) > 1 else ""
+            sync = raw[2] if len(raw) > 2 else 0
+            kill = raw[3] if len(raw) > 3 else 0
+            return {
+                "status": str(status or "").upper(),
+                "startup_sync_ok": _to_bool01(sync),
+                "kill_switch": _to_bool01(kill),
+                "pause_reason": (raw[6] if len(raw) > 6 else None) or None,
+            }
+
+        if isinstance(raw, dict):
+            return {
+                "status": str(raw.get("status") or "").upper(),
+                "startup_sync_ok": _to_bool01(raw.get("startup_sync_ok")),
+                "kill_switch": _to_bool01(raw.get("kill_switch")),
+                "pause_reason": raw.get("pause_reason") or None,
+            }
+
+        return {"status": "", "startup_sync_ok": False, "kill_switch": False, "pause_reason": None}
+
+    # ----------------------------
+    # OCO reconcile
+    # ----------------------------
+    def reconcile_oco(self) -> None:
+        if self.mode == "DEMO":
+            self.reconcile_demo()
+            return
+        if self.mode not in ("LIVE", "TESTNET"):
+            return
+        if self.exchange is None:
+            return
+
+        self._mark_open_lots()
+
+        rows = list_active_oco_links(limit=50)
+        if not rows:
+            return
+
+        def _norm(s: Any) -> str:
+            return str(s or "").strip().lower()
+
+        CLOSED = {"closed", "filled"}
+        CANCELED = {"canceled", "cancelled", "expired", "rejected"}
+
+        for r in rows:
+            (
+                link_id, signal_id, symbol, base_asset,
+                tp_order_id, sl_order_id,
+                tp_price, sl_stop_price, sl_limit_price,
+                amount, status, created_at, updated_at
+            ) = r
+
+            if not tp_order_id or not sl_order_id:
+                logger.warning("OCO_RECONCILE_SKIP | link=%s missing order ids tp='%s' sl='%s'", link_id, tp_order_id, sl_order_id)
+                continue
+
+            try:
+                tp = self.exchange.fetch_order(tp_order_id, symbol)
+                sl = self.exchange.fetch_order(sl_order_id, symbol)
+
+                tp_status = _norm(tp.get("status"))
+                sl_status = _norm(sl.get("status"))
+
+                logger.info(
+                    "OCO_RECONCILE | link=%s id=%s symbol=%s tp=%s:%s sl=%s:%s",
+                    link_id, signal_id, symbol, tp_order_id, tp_status, sl_order_id, sl_status,
+                )
+
+                quote_asset = str(symbol).split("/")[-1].upper()
+
+                if sl_status in CLOSED:
+                    set_oco_status(link_id, "CLOSED_SL")
+                    log_event("OCO_CLOSED", f"{signal_id} SL_FILLED sl={sl_order_id} tp={tp_order_id} tp_status={tp_status}")
+                    qty, px, fee = self._order_fill(sl, amount, sl_limit_price, quote_asset)
+                    self._pnl_fill(symbol=symbol, side="SELL", qty=qty, price=px, fee=fee, source="OCO_SL", ref=signal_id)
+                    continue
+
+                if tp_status in CLOSED:
+                    set_oco_status(link_id, "CLOSED_TP")
+                    log_event("OCO_CLOSED", f"{signal_id} TP_FILLED tp={tp_order_id} sl={sl_order_id} sl_status={sl_status}")
+                    qty, px, fee = self._order_fill(tp, amount, tp_price, quote_asset)
+                    self._pnl_fill(symbol=symbol, side="SELL", qty=qty, price=px, fee=fee, source="OCO_TP", ref=signal_id)
+                    continue
+
+                if (tp_status in CANCELED and sl_status == "open") or (sl_status in CANCELED and tp_status == "open"):
+                    continue
+
+                if tp_status in CANCELED and sl_status in CANCELED:
+                    set_oco_status(link_id, "FAILED")
+                    log_event("OCO_FAILED", f"{signal_id} tp={tp_order_id}:{tp_status} sl={sl_order_id}:{sl_status}")
+                    continue
+
+            except Exception as e:
+                logger.warning("OCO_RECONCILE_FAIL | link=%s symbol=%s err=%s", link_id, symbol, e)
+
+    def reconcile_demo(self) -> None:
+        """DEMO: simulate TP/SL exits of open ledger positions against the cached price feed."""
+        wallet = get_wallet()
+        symbols = wallet.open_symbols()
+        if symbols:
+            prices = self._cached_prices(symbols)
+            self._mark_open_lots(prices)
+            for c in wallet.check_exits(prices):
+                self._on_demo_close(c)
+        wallet.maybe_checkpoint()
+
+    def close_demo_position(self, position_id: int, price: float, reason: str) -> Dict[str, Any]:
+        """DEMO exit at an externally simulated price (backtest fill model)."""
+        c = get_wallet().close(position_id, price, reason=reason)
+        self._on_demo_close(c)
+        return c
+
+    def _on_demo_close(self, c: Dict[str, Any]) -> None:
+        logger.info(
+            "DEMO_CLOSED | id=%s symbol=%s reason=%s price=%s pnl=%.8f",
+            c.get("signal_id"), c["symbol"], c["reason"], c["price"], c["pnl"],
+        )
+        log_event(
+            "DEMO_CLOSED",
+            f"{c.get('signal_id')} {c['symbol']} {c['reason']} pos={c['position_id']} "
+            f"price={c['price']} pnl={c['pnl']:.8f}"
+        )
+        self._pnl_fill(
+            symbol=c["symbol"], side="SELL", qty=c["size"], price=c["price"], fee=c["fee"],
+            source=f"DEMO_{c['reason']}", ref=c.get("signal_id"),
+        )
+
+    # ----------------------------
+    # Main execution
+    # ----------------------------
+    def execute_signal(self, signal: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        try:
+            with tracing.span(tracing.trace_id(signal), "execute"):
+                self._execute_signal(signal)
+        finally:
+            EXEC_TOTAL.inc()
+            EXEC_SECONDS.observe(time.perf_counter() - t0)
+            tracing.flush()
+
+    def _execute_signal(self, signal: Dict[str, Any]) -> None:
+        signal_id = str(signal.get("signal_id", "UNKNOWN"))
+        verdict = str(signal.get("final_verdict", "")).upper()
+        tid = tracing.trace_id(signal)
+
+        logger.info("EXEC_ENTER | id=%s verdict=%s MODE=%s ENV_KILL_SWITCH=%s", signal_id, verdict, self.mode, self.env_kill_switch)
+
+        # ✅ TTL: stale signals never reach the DB / price feed
+        if is_signal_expired(signal):
+            logger.warning("EXEC_REJECT | expired | id=%s expiry_ts=%s", signal_id, signal_expiry_ts(signal))
+            log_event("REJECT_EXPIRED", f"{signal_id}")
+            return
+
+        # ✅ IDEMPOTENCY
+        try:
+            with tracing.span(tid, "dedupe"):
+                executed = signal_id_already_executed(signal_id)
+            if executed:
+                logger.warning("EXEC_DEDUPED | duplicate ignored | id=%s", signal_id)
+                log_event("EXEC_DEDUPED", f"id={signal_id}")
+                return
+        except Exception as e:
+            logger.error("EXEC_BLOCKED | idempotency_check_failed | id=%s err=%s", signal_id, e)
+            log_event("EXEC_BLOCKED_IDEMPOTENCY_FAIL", f"{signal_id} err={e}")
+            return
+
+        gates_ts = time.time()
+        state = self._load_system_state()
+        db_status = str(state.get("status") or "").upper()
+        db_kill = bool(state.get("kill_switch"))
+        sync_ok = bool(state.get("startup_sync_ok"))
+
+        if self.env_kill_switch or db_kill:
+            logger.warning("EXEC_BLOCKED | KILL_SWITCH=ON | id=%s", signal_id)
+            log_event("EXEC_BLOCKED_KILL_SWITCH", f"{signal_id}")
+            return
+
+        # guard entry gate (limit breach): the worker stops popping, this catches a batch in flight
+        if state.get("pause_reason"):
+            logger.warning("EXEC_BLOCKED | ENTRIES_PAUSED | id=%s reason=%s", signal_id, state["pause_reason"])
+            log_event("EXEC_BLOCKED_PAUSED", f"{signal_id} reason={state['pause_reason']}")
+            return
+
+        if not sync_ok or db_status not in ("ACTIVE", "RUNNING"):
+            logger.warning("EXEC_BLOCKED | system not ACTIVE/synced | id=%s status=%s sync_ok=%s", signal_id, db_status, sync_ok)
+            log_event("EXEC_BLOCKED_SYSTEM_STATE", f"{signal_id} status={db_status} sync_ok={sync_ok}")
+            return
+
+        if self.mode == "LIVE" and not self.live_confirmation:
+            logger.warning("EXEC_BLOCKED | LIVE_CONFIRMATION=OFF | id=%s", signal_id)
+            log_event("EXEC_BLOCKED_LIVE_CONFIRMATION", f"{signal_id}")
+            return
+
+        if signal.get("certified_signal") is not True:
+            log_event("REJECT_NOT_CERTIFIED", f"{signal_id}")
+            return
+
+        execution = signal.get("execution") or {}
+        symbol = execution.get("symbol")
+        direction = str(execution.get("direction", "")).upper()
+        entry = execution.get("entry") or {}
+        entry_type = str(entry.get("type", "")).upper()
+
+        position_size = execution.get("position_size")
+        quote_amount = execution.get("quote_amount")
+
+        if not symbol or direction != "LONG" or entry_type != "MARKET":
+            logger.warning("EXEC_REJECT | bad payload | id=%s symbol=%s dir=%s entry=%s", signal_id, symbol, direction, entry_type)
+            log_event("REJECT_BAD_PAYLOAD", f"{signal_id}")
+            return
+
+        signal_hash = signal.get("_fingerprint") or signal.get("signal_hash")
+        tracing.record(tid, "gates", gates_ts, time.time())
+
+        # DEMO
+        if self.mode == "DEMO":
+            with tracing.span(tid, "price_fetch"):
+                # _cached_prices already skips tickers without a last price
+                last_price = self._cached_prices([symbol]).get(symbol)
+            if last_price is None:
+                logger.warning("EXEC_REJECT | no last price | id=%s symbol=%s", signal_id, symbol)
+                log_event("EXEC_REJECT_NO_PRICE", f"{signal_id} symbol={symbol}")
+                return
+            base_size = float(position_size) if position_size is not None else float(quote_amount) / float(last_price)
+
+            exits = execution.get("exits") or {}
+            tp_price = (exits.get("tp") or {}).get("price")
+            sl_price = (exits.get("sl") or {}).get("stop_price")
+            if tp_price is None:
+                tp_price = last_price * (1.0 + (self.tp_pct / 100.0))
+            if sl_price is None:
+                sl_price = last_price * (1.0 - (self.sl_pct / 100.0))
+
+            try:
+                with tracing.span(tid, "buy"):
+                    resp = simulate_market_entry(
+                        symbol=symbol, side=direction, size=base_size, price=last_price,
+                        signal_id=signal_id, tp_price=float(tp_price), sl_price=float(sl_price),
+                    )
+            except VirtualWalletError as e:
+                msg = f"EXEC_REJECT | DEMO_WALLET | id={signal_id} symbol={symbol} reason={e}"
+                logger.warning(msg)
+                log_event("EXEC_REJECT_DEMO_WALLET", msg)
+                mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="REJECT_DEMO_WALLET", symbol=str(symbol))
+                return
+
+            log_event("TRADE_EXECUTED", f"{signal_id} DEMO {symbol} size={base_size} price={last_price} pos={resp['position_id']} fee={resp['fee']:.8f}")
+            self._pnl_fill(symbol=symbol, side="BUY", qty=resp["size"], price=resp["price"], fee=resp["fee"], source="DEMO", ref=signal_id)
+            logger.info("EXEC_DEMO_OK | id=%s resp=%s", signal_id, resp)
+
+            with tracing.span(tid, "db_commit"):
+                mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="TRADE_DEMO", symbol=str(symbol))
+            tracing.record(tid, "e2e", signal_created_ts(signal), time.time())
+            return
+
+        # LIVE/TESTNET
+        if self.exchange is None:
+            log_event("EXEC_BLOCKED_NO_EXCHANGE", f"{signal_id}")
+            logger.warning("EXEC_BLOCKED | exchange client not wired | id=%s", signal_id)
+            return
+
+        # import these here (avoid circular)
+        from execution.exchange_client import LiveTradingBlocked
+
+        try:
+            with tracing.span(tid, "price_fetch"):
+                if quote_amount is None:
+                    last = self.exchange.fetch_last_price(symbol)
+                    quote_amount = float(position_size) * float(last)
+                quote_amount = float(quote_amount)
+
+                # ✅ Binance NOTIONAL gate
+                min_notional = 0.0
+                try:
+                    min_notional = float(self.exchange.get_min_notional(symbol))
+                except Exception:
+                    min_notional = 0.0
+
+            if min_notional > 0 and quote_amount < min_notional:
+                msg = (
+                    f"EXEC_REJECT | MIN_NOTIONAL | id={signal_id} symbol={symbol} "
+                    f"quote={quote_amount:.8f} < min_notional={min_notional}"
+                )
+                logger.warning(msg)
+                log_event("EXEC_REJECT_MIN_NOTIONAL", msg)
+                mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="REJECT_MIN_NOTIONAL", symbol=str(symbol))
+                return
+
+            # ✅ last-millisecond kill switch
+            if is_kill_switch_active():
+                logger.error("KILL_SWITCH_ACTIVE_LAST_GATE | BUY_BLOCKED | id=%s", signal_id)
+                log_event("EXEC_BLOCKED_KILL_SWITCH_LAST_GATE", f"{signal_id} BUY_BLOCKED")
+                return
+
+            # BUY
+            with tracing.span(tid, "buy"):
+                buy = self.exchange.place_market_buy_by_quote(symbol=symbol, quote_amount=quote_amount)
+                buy_avg = float(buy.get("average") or buy.get("price") or 0.0) or self.exchange.fetch_last_price(symbol)
+
+            logger.info("EXEC_LIVE_BUY_OK | id=%s symbol=%s quote=%s avg=%s order_id=%s", signal_id, symbol, quote_amount, buy_avg, buy.get("id"))
+            log_event("TRADE_EXECUTED", f"{signal_id} LIVE BUY {symbol} quote={quote_amount} avg={buy_avg} order_id={buy.get('id')}")
+
+            with tracing.span(tid, "db_commit"):
+                mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="TRADE_LIVE_BUY", symbol=str(symbol))
+
+            buy_qty, _px, buy_fee = self._order_fill(buy, quote_amount / buy_avg, buy_avg, symbol.split("/")[-1].upper())
+            self._pnl_fill(symbol=symbol, side="BUY", qty=buy_qty, price=buy_avg, fee=buy_fee, source="LIVE", ref=signal_id)
+
+            base_asset = symbol.split("/")[0].upper()
+            with tracing.span(tid, "balance_fetch"):
+                free_base = float(self.exchange.fetch_balance_free(base_asset))
+
+            sell_amount = self.exchange.floor_amount(symbol, free_base * self.sell_buffer)
+            if sell_amount <= 0:
+                sell_amount = self.exchange.floor_amount(symbol, free_base * self.sell_retry_buffer)
+
+            if sell_amount <= 0:
+                msg = f"OCO_SKIP_NO_FREE_BASE | id={signal_id} free_{base_asset}={free_base}"
+                logger.warning(msg)
+                log_event("OCO_SKIP_NO_FREE_BASE", msg)
+                return
+
+            tp_price = self.exchange.floor_price(symbol, buy_avg * (1.0 + (self.tp_pct / 100.0)))
+            sl_stop_price = self.exchange.floor_price(symbol, buy_avg * (1.0 - (self.sl_pct / 100.0)))
+            sl_limit_price = self.exchange.floor_price(symbol, sl_stop_price * (1.0 - (self.sl_limit_gap_pct / 100.0)))
+
+            logger.info(
+                "OCO_PREP | id=%s free_%s=%s sell_amount=%s tp=%s sl_stop=%s sl_limit=%s",
+                signal_id, base_asset, free_base, sell_amount, tp_price, sl_stop_price, sl_limit_price,
+            )
+
+            if is_kill_switch_active():
+                logger.error("KILL_SWITCH_ACTIVE_LAST_GATE | OCO_BLOCKED | id=%s", signal_id)
+                log_event("EXEC_BLOCKED_KILL_SWITCH_LAST_GATE", f"{signal_id} OCO_BLOCKED")
+                return
+
+            # OCO place
+            with tracing.span(tid, "oco_place"):
+                oco = self.exchange.place_oco_sell(
+                    symbol=symbol,
+                    base_amount=sell_amount,
+                    tp_price=tp_price,
+                    sl_stop_price=sl_stop_price,
+                    sl_limit_price=sl_limit_price,
+                )
+
+            raw = oco.get("raw") or {}
+            order_reports = raw.get("orderReports") or []
+
+            tp_order_id = None
+            sl_order_id = None
+
+            def _otype(rep):
+                return str(rep.get("type") or rep.get("orderType") or "").upper()
+
+            for rep in order_reports:
+                oid = rep.get("orderId") or rep.get("order_id")
+                if not oid:
+                    continue
+                oid = str(oid)
+                typ = _otype(rep)
+                if "STOP" in typ:
+                    sl_order_id = sl_order_id or oid
+                else:
+                    tp_order_id = tp_order_id or oid
+
+            orders = raw.get("orders") or []
+            if (not tp_order_id or not sl_order_id) and len(orders) >= 2:
+                ids = []
+                for o in orders:
+                    oid = o.get("orderId") or o.get("order_id")
+                    if oid:
+                        ids.append(str(oid))
+                uniq = []
+                for x in ids:
+                    if x not in uniq:
+                        uniq.append(x)
+                if len(uniq) >= 2:
+                    tp_order_id = tp_order_id or uniq[0]
+                    sl_order_id = sl_order_id or uniq[1]
+
+            list_order_id = raw.get("listOrderId") or raw.get("orderListId") or raw.get("list_order_id")
+
+            logger.info("OCO_OK | id=%s listOrderId=%s tp=%s sl=%s", signal_id, list_order_id, tp_order_id, sl_order_id)
+            log_event("OCO_ARMED", f"{signal_id} symbol={symbol} listOrderId={list_order_id} tp={tp_order_id} sl={sl_order_id} amount={sell_amount}")
+
+            if (not list_order_id) or (not tp_order_id) or (not sl_order_id) or (str(tp_order_id) == str(sl_order_id)):
+                msg = (
+                    f"OCO_INVALID | id={signal_id} symbol={symbol} "
+                    f"listOrderId={list_order_id} tp={tp_order_id} sl={sl_order_id} -> PROTECTION_FAILED"
+                )
+                logger.error(msg)
+                log_event("OCO_INVALID", msg)
+
+                update_system_state(kill_switch=1)
+                logger.error("FAILSAFE | DB kill_switch=1 set due to OCO_INVALID")
+                log_event("FAILSAFE_KILL_SWITCH_SET", f"{signal_id} OCO_INVALID")
+                return
+
+            with tracing.span(tid, "db_commit"):
+                create_oco_link(
+                    signal_id=signal_id,
+                    symbol=symbol,
+                    base_asset=base_asset,
+                    tp_order_id=str(tp_order_id or ""),
+                    sl_order_id=str(sl_order_id or ""),
+                    tp_price=float(tp_price),
+                    sl_stop_price=float(sl_stop_price),
+                    sl_limit_price=float(sl_limit_price),
+                    amount=float(sell_amount),
+                )
+
+            log_event("TRADE_LIVE_ARMED", f"{signal_id} {symbol} OCO_ARMED listOrderId={list_order_id}")
+            tracing.record(tid, "e2e", signal_created_ts(signal), time.time())
+
+        except LiveTradingBlocked as e:
+            # ✅ This is a controlled safety block, not a crash.
+            msg = f"EXEC_REJECT | LIVE_BLOCKED | id={signal_id} reason={e}"
+            logger.warning(msg)
+            log_event("EXEC_REJECT_LIVE_BLOCKED", msg)
+            # ✅ Mark to prevent endless retry spam
+            mark_signal_id_executed(signal_id, signal_hash=signal_hash, action="REJECT_LIVE_BLOCKED", symbol=str(symbol))
+            return
+
+        except Exception as e:
+            logger.exception("EXEC_LIVE_ERROR | id=%s err=%s", signal_id, e)
+            log_event("EXEC_LIVE_ERROR", f"{signal_id} err={e}")
+            return
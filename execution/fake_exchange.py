@@ -0,0 +1,336 @@
+# execution/fake_exchange.py
+"""
+Offline stand-in for ccxt.binance: benchmarks, load tests, local runs without network.
+
+  EXCHANGE_BACKEND=fake   create_exchange() returns a FakeExchange instead of ccxt.binance
+
+Covers the calls this repo makes: load_markets / market / market_id, amount_to_precision /
+price_to_precision, fetch_ticker(s), fetch_ohlcv, fetch_balance, create_order (market orders
+fill immediately at last, others rest), privatePostOrderOco, fetch_order, cancel_order.
+
+Prices are a seeded random walk per symbol (FAKE_EXCHANGE_VOLATILITY per price read, start
+FAKE_EXCHANGE_START_PRICE). Candles are a walk too, but each candle's return is a stable digest
+of (symbol, timeframe, open time), independent of PYTHONHASHSEED: closes are walked back from
+the live price at the current candle, so the same candle has the same values in every process
+and `since` pages (candle_store.fetch_range) line up with each other and with the latest window. Resting sell legs are checked on every price read: a TP leg fills
+when last >= price, a stop leg when last <= stopPrice; filling one OCO leg cancels the other.
+FAKE_EXCHANGE_LATENCY_MS sleeps per call (network stand-in). Single process, thread-safe.
+"""
+import os
+import time
+import zlib
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+import ccxt
+
+QUOTES = ("USDT", "USDC", "FDUSD", "BUSD", "BTC", "ETH", "BNB")
+
+
+class FakeExchange:
+    id = "binance"
+
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        start_price: float = 100.0,
+        volatility: float = 0.001,
+        latency_ms: float = 0.0,
+        start_quote: float = 100000.0,
+        fee_rate: float = 0.001,
+        seed: int = 7,
+    ):
+        self.config = dict(config or {})
+        self.urls: Dict[str, Any] = {"api": {}}
+        self.options: Dict[str, Any] = dict(self.config.get("options") or {})
+        self.start_price = float(start_price)
+        self.volatility = float(volatility)
+        self.latency_s = float(latency_ms) / 1000.0
+        self.fee_rate = float(fee_rate)
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._last: Dict[str, float] = {}
+        self._markets: Dict[str, Dict[str, Any]] = {}
+        self._by_id: Dict[str, str] = {}
+        self._balances: Dict[str, float] = {"USDT": float(start_quote)}
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._resting: Dict[str, List[str]] = {}  # symbol -> open order ids
+        self._oco_peer: Dict[str, str] = {}
+        self._next_id = 1000
+        self.calls: Dict[str, int] = {}
+
+    def _call(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    # ----------------------------
+    # markets / precision
+    # ----------------------------
+    def load_markets(self, reload: bool = False) -> Dict[str, Dict[str, Any]]:
+        return self._markets
+
+    def market(self, symbol: str) -> Dict[str, Any]:
+        m = self._markets.get(symbol)
+        if m is None:
+            if "/" not in symbol:
+                raise ccxt.BadSymbol(f"fake: unknown symbol {symbol}")
+            base, quote = symbol.split("/", 1)
+            m = {
+                "id": f"{base}{quote}",
+                "symbol": symbol,
+                "base": base,
+                "quote": quote,
+                "precision": {"amount": 5, "price": 2},
+                "limits": {"cost": {"min": 5.0}, "amount": {"min": 0.00001}},
+                "info": {"filters": [{"filterType": "NOTIONAL", "minNotional": "5.0"}]},
+            }
+            self._markets[symbol] = m
+            self._by_id[m["id"]] = symbol
+        return m
+
+    def market_id(self, symbol: str) -> str:
+        return self.market(symbol)["id"]
+
+    def _symbol_for_id(self, market_id: str) -> str:
+        symbol = self._by_id.get(market_id)
+        if symbol is None:
+            quote = next((q for q in QUOTES if market_id.endswith(q) and len(market_id) > len(q)), None)
+            if quote is None:
+                raise ccxt.BadSymbol(f"fake: unknown market id {market_id}")
+            symbol = self.market(f"{market_id[:-len(quote)]}/{quote}")["symbol"]
+        return symbol
+
+    def amount_to_precision(self, symbol: str, amount: float) -> str:
+        d = self.market(symbol)["precision"]["amount"]
+        q = 10 ** d
+        return f"{int(float(amount) * q + 1e-9) / q:.{d}f}"  # truncate, like Binance lot size
+
+    def price_to_precision(self, symbol: str, price: float) -> str:
+        d = self.market(symbol)["precision"]["price"]
+        return f"{round(float(price), d):.{d}f}"
+
+    # ----------------------------
+    # prices
+    # ----------------------------
+    def _price(self, symbol: str) -> float:
+        """Next random-walk price; fills resting legs it crosses."""
+        with self._lock:
+            self.market(symbol)
+            px = self._last.get(symbol, self.start_price)
+            px *= 1.0 + self._rng.gauss(0.0, self.volatility)
+            self._last[symbol] = px
+            self._match(symbol, px)
+            return px
+
+    def set_price(self, symbol: str, price: float) -> None:
+        with self._lock:
+            self.market(symbol)
+            self._last[symbol] = float(price)
+            self._match(symbol, float(price))
+
+    def _ticker(self, symbol: str) -> Dict[str, Any]:
+        px = self._price(symbol)
+        return {"symbol": symbol, "last": px, "bid": px * 0.9999, "ask": px * 1.0001, "timestamp": int(time.time() * 1000)}
+
+    def fetch_ticker(self, symbol: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._call("fetch_ticker")
+        return self._ticker(symbol)
+
+    def fetch_tickers(self, symbols: Optional[List[str]] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        self._call("fetch_tickers")
+        return {s: self._ticker(s) for s in (symbols or list(self._markets))}
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = "1m", since: Optional[int] = None, limit: Optional[int] = None, params=None) -> List[List[float]]:
+        """`limit` candles from `since` (rounded up to a candle open), else the latest `limit`; never past the current candle."""
+        self._call("fetch_ohlcv")
+        n = int(limit or 500)
+        step = int(self.parse_timeframe(timeframe) * 1000)
+        end = int(time.time() * 1000) // step * step
+        first = end - (n - 1) * step if since is None else -(-int(since) // step) * step
+        last = min(end, first + (n - 1) * step)
+        if last < first:
+            return []
+        key = f"{symbol}|{timeframe}"
+        px = self._last.get(symbol, self.start_price)
+        for ts in range(end, last, -step):
+            px /= 1.0 + self._candle_return(key, ts)
+        rows = []
+        for ts in range(last, first - step, -step):
+            c = px
+            o = px = c / (1.0 + self._candle_return(key, ts))
+            vol = 1.0 + 99.0 * zlib.crc32(f"{key}|{ts}|v".encode()) / 4294967296.0
+            rows.append([ts, o, max(o, c) * 1.0005, min(o, c) * 0.9995, c, vol])
+        rows.reverse()
+        return rows
+
+    def _candle_return(self, key: str, ts: int) -> float:
+        # uniform with the spread of gauss(0, 3 * volatility); crc32, not hash(): str hashes are salted per process
+        u = zlib.crc32(f"{key}|{ts}".encode()) / 4294967296.0
+        return (u - 0.5) * 3.4641016 * self.volatility * 3
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    # ----------------------------
+    # account / orders
+    # ----------------------------
+    def fetch_balance(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._call("fetch_balance")
+        with self._lock:
+            free = dict(self._balances)
+        return {"free": free, "total": dict(free)}
+
+    def _fill(self, order: Dict[str, Any], price: float) -> None:
+        m = self.market(order["symbol"])
+        qty = float(order["amount"])
+        cost = qty * price
+        fee = cost * self.fee_rate
+        if order["side"] == "buy":
+            self._balances[m["quote"]] = self._balances.get(m["quote"], 0.0) - cost - fee
+            self._balances[m["base"]] = self._balances.get(m["base"], 0.0) + qty
+        else:
+            self._balances[m["quote"]] = self._balances.get(m["quote"], 0.0) + cost - fee
+        order.update({
+            "status": "closed", "filled": qty, "remaining": 0.0, "average": price, "cost": cost,
+            "fee": {"cost": fee, "currency": m["quote"]},
+        })
+
+    def create_order(self, symbol: str, type: str, side: str, amount: Optional[float] = None, price: Optional[float] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._call("create_order")
+        params = params or {}
+        with self._lock:
+            m = self.market(symbol)
+            last = self._last.get(symbol) or self._price(symbol)
+            if amount is None and params.get("quoteOrderQty"):
+                amount = float(self.amount_to_precision(symbol, float(params["quoteOrderQty"]) / last))
+            if not amount or float(amount) <= 0:
+                raise ccxt.InvalidOrder("fake: amount required")
+            if side == "buy" and float(amount) * last > self._balances.get(m["quote"], 0.0):
+                raise ccxt.InsufficientFunds(f"fake: {m['quote']} balance too low")
+            order = {
+                "id": self._new_id(), "symbol": symbol, "type": str(type).lower(), "side": side,
+                "amount": float(amount), "price": price, "stopPrice": params.get("stopPrice"),
+                "status": "open", "filled": 0.0, "remaining": float(amount), "average": None,
+                "timestamp": int(time.time() * 1000),
+            }
+            self._orders[order["id"]] = order
+            if order["type"] == "market":
+                self._fill(order, last)
+            else:
+                self._rest(order)
+            return dict(order)
+
+    def _rest(self, order: Dict[str, Any]) -> None:
+        m = self.market(order["symbol"])
+        if order["side"] == "sell":
+            self._balances[m["base"]] = self._balances.get(m["base"], 0.0) - float(order["amount"])
+        self._resting.setdefault(order["symbol"], []).append(order["id"])
+
+    def _release(self, order: Dict[str, Any]) -> None:
+        m = self.market(order["symbol"])
+        if order["side"] == "sell":
+            self._balances[m["base"]] = self._balances.get(m["base"], 0.0) + float(order["amount"])
+
+    def _match(self, symbol: str, px: float) -> None:
+        ids = self._resting.get(symbol)
+        if not ids:
+            return
+        for oid in list(ids):
+            o = self._orders[oid]
+            if o["status"] != "open":
+                continue
+            stop = o.get("stopPrice")
+            hit = (stop is not None and px <= float(stop)) or (stop is None and o["price"] is not None and px >= float(o["price"]))
+            if not hit:
+                continue
+            self._fill(o, float(o["price"]) if stop is None else min(px, float(o["price"] or px)))
+            ids.remove(oid)
+            peer = self._oco_peer.get(oid)
+            if peer and self._orders[peer]["status"] == "open":
+                self._orders[peer]["status"] = "canceled"
+                if peer in ids:
+                    ids.remove(peer)
+
+    def privatePostOrderOco(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self._call("privatePostOrderOco")
+        with self._lock:
+            symbol = self._symbol_for_id(str(payload["symbol"]))
+            qty = float(payload["quantity"])
+            base = self.market(symbol)["base"]
+            if qty > self._balances.get(base, 0.0) + 1e-12:
+                raise ccxt.InsufficientFunds(f"fake: {base} balance too low for OCO")
+            now = int(time.time() * 1000)
+            tp = {"id": self._new_id(), "symbol": symbol, "type": "limit_maker", "side": "sell", "amount": qty,
+                  "price": float(payload["price"]), "stopPrice": None, "status": "open", "filled": 0.0,
+                  "remaining": qty, "average": None, "timestamp": now}
+            sl = {"id": self._new_id(), "symbol": symbol, "type": "stop_loss_limit", "side": "sell", "amount": qty,
+                  "price": float(payload["stopLimitPrice"]), "stopPrice": float(payload["stopPrice"]),
+                  "status": "open", "filled": 0.0, "remaining": qty, "average": None, "timestamp": now}
+            # one reserve for both legs: the filled leg consumes it, the other is just cancelled
+            self._balances[base] = self._balances.get(base, 0.0) - qty
+            for o in (tp, sl):
+                self._orders[o["id"]] = o
+                self._resting.setdefault(symbol, []).append(o["id"])
+            self._oco_peer[tp["id"]], self._oco_peer[sl["id"]] = sl["id"], tp["id"]
+            list_id = self._new_id()
+            return {
+                "orderListId": int(list_id),
+                "symbol": payload["symbol"],
+                "orders": [{"orderId": int(sl["id"])}, {"orderId": int(tp["id"])}],
+                "orderReports": [
+                    {"orderId": int(sl["id"]), "type": "STOP_LOSS_LIMIT", "status": "NEW"},
+                    {"orderId": int(tp["id"]), "type": "LIMIT_MAKER", "status": "NEW"},
+                ],
+            }
+
+    def fetch_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._call("fetch_order")
+        with self._lock:
+            o = self._orders.get(str(id))
+            if o is None:
+                raise ccxt.OrderNotFound(f"fake: order {id}")
+            if o["status"] == "open":
+                self._price(o["symbol"])
+            return dict(o)
+
+    def cancel_order(self, id: str, symbol: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._call("cancel_order")
+        with self._lock:
+            o = self._orders.get(str(id))
+            if o is None:
+                raise ccxt.OrderNotFound(f"fake: order {id}")
+            if o["status"] == "open":
+                # cancelling one OCO leg cancels the list (one reserve released)
+                ids = self._resting.get(o["symbol"], [])
+                for oid in (o["id"], self._oco_peer.get(o["id"])):
+                    if oid is not None and self._orders[oid]["status"] == "open":
+                        self._orders[oid]["status"] = "canceled"
+                        if oid in ids:
+                            ids.remove(oid)
+                self._release(o)
+            return dict(o)
+
+
+def fake_from_env(config: Optional[Dict[str, Any]] = None) -> FakeExchange:
+    return FakeExchange(
+        config,
+        start_price=float(os.getenv("FAKE_EXCHANGE_START_PRICE", "100")),
+        volatility=float(os.getenv("FAKE_EXCHANGE_VOLATILITY", "0.001")),
+        latency_ms=float(os.getenv("FAKE_EXCHANGE_LATENCY_MS", "0")),
+        start_quote=float(os.getenv("FAKE_EXCHANGE_START_USDT", "100000")),
+        seed=int(os.getenv("FAKE_EXCHANGE_SEED", "7")),
+    )
+
+
+def create_exchange(config: Dict[str, Any]):
+    """ccxt.binance(config), or a FakeExchange when EXCHANGE_BACKEND=fake."""
+    if os.getenv("EXCHANGE_BACKEND", "binance").strip().lower() == "fake":
+        return fake_from_env(config)
+    return ccxt.binance(config)
@@ -0,0 +1,529 @@
+# execution/indicators.py
+"""
+Rolling indicators with O(1) per-candle updates, kept per symbol.
+
+  SMA(n), STD(n)   ring buffer with running sum / sum of squares (resynced once per wrap)
+  EMA(n)           seeded with the SMA of the first n closes
+  RSI(n), ATR(n)   Wilder smoothing, seeded with the mean of the first n changes / true ranges
+
+Every indicator takes push(high, low, close) for a new candle and revise(high, low, close)
+for an update of the still-forming last candle (undo of the last push + push).
+
+IndicatorBank holds one IndicatorSet per symbol for a spec like
+  {"ma": ("sma", 20), "rsi": ("rsi", 14)}
+and can be initialised vectorised from a (symbols x candles) matrix, fed incrementally from
+OHLCV rows (only rows at/after the last seen timestamp are applied) and snapshotted to JSON
+so restarts resume without recomputing history.
+"""
+import os
+import json
+import math
+import time
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("gbm")
+
+TS, HIGH, LOW, CLOSE = 0, 2, 3, 4
+
+
+class _Indicator(ABC):
+    __slots__ = ("n",)
+    kind = ""
+
+    @abstractmethod
+    def push(self, high: float, low: float, close: float) -> None:
+        ...
+
+    @abstractmethod
+    def revise(self, high: float, low: float, close: float) -> None:
+        ...
+
+    @property
+    @abstractmethod
+    def value(self) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    def peek(self, high: float, low: float, close: float) -> Optional[float]:
+        """Value if the forming candle were revised to these prices; state is left untouched."""
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"kind": self.kind}
+        for cls in type(self).__mro__:
+            for s in getattr(cls, "__slots__", ()):
+                out[s] = getattr(self, s)
+        return out
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "_Indicator":
+        obj = cls(int(d["n"]))
+        for k, v in d.items():
+            if k != "kind":
+                setattr(obj, k, v)
+        return obj
+
+
+class _Window(_Indicator):
+    __slots__ = ("buf", "i", "count", "sum", "sumsq")
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError(f"period must be >= 1: {n}")
+        self.n = int(n)
+        self.buf = [0.0] * self.n
+        self.i = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+    def push(self, high: float, low: float, close: float) -> None:
+        old = self.buf[self.i]
+        if self.count == self.n:
+            self.sum -= old
+            self.sumsq -= old * old
+        else:
+            self.count += 1
+        self.buf[self.i] = close
+        self.sum += close
+        self.sumsq += close * close
+        self.i += 1
+        if self.i == self.n:
+            self.i = 0
+            # resync once per wrap: keeps float drift bounded, amortised O(1)
+            self.sum = math.fsum(self.buf)
+            self.sumsq = math.fsum(x * x for x in self.buf)
+
+    def revise(self, high: float, low: float, close: float) -> None:
+        if self.count == 0:
+            self.push(high, low, close)
+            return
+        j = self.i - 1 if self.i else self.n - 1
+        old = self.buf[j]
+        self.buf[j] = close
+        self.sum += close - old
+        self.sumsq += close * close - old * old
+
+    def peek(self, high: float, low: float, close: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        j = self.i - 1 if self.i else self.n - 1
+        old, s, sq = self.buf[j], self.sum, self.sumsq
+        self.revise(high, low, close)
+        v = self.value
+        self.buf[j], self.sum, self.sumsq = old, s, sq
+        return v
+
+
+class SMA(_Window):
+    __slots__ = ()
+    kind = "sma"
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.sum / self.n if self.count == self.n else None
+
+
+class STD(_Window):
+    """Population standard deviation (Bollinger convention)."""
+    __slots__ = ()
+    kind = "std"
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.count != self.n:
+            return None
+        mean = self.sum / self.n
+        return math.sqrt(max(0.0, self.sumsq / self.n - mean * mean))
+
+
+class _Recursive(_Indicator):
+    """Indicators whose state is a handful of scalars: revise = restore pre-push state + push."""
+    __slots__ = ("undo",)
+    fields: Tuple[str, ...] = ()
+
+    def _save(self) -> None:
+        self.undo = [getattr(self, f) for f in self.fields]
+
+    def revise(self, high: float, low: float, close: float) -> None:
+        if self.undo is None:
+            self.push(high, low, close)
+            return
+        for f, v in zip(self.fields, self.undo):
+            setattr(self, f, v)
+        self.push(high, low, close)
+
+    def peek(self, high: float, low: float, close: float) -> Optional[float]:
+        if self.undo is None:
+            return None
+        cur = [getattr(self, f) for f in self.fields]
+        undo = self.undo
+        self.revise(high, low, close)
+        v = self.value
+        for f, x in zip(self.fields, cur):
+            setattr(self, f, x)
+        self.undo = undo
+        return v
+
+
+class EMA(_Recursive):
+    __slots__ = ("count", "seed", "ema")
+    kind = "ema"
+    fields = ("count", "seed", "ema")
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError(f"period must be >= 1: {n}")
+        self.n = int(n)
+        self.count = 0
+        self.seed = 0.0
+        self.ema: Optional[float] = None
+        self.undo = None
+
+    def push(self, high: float, low: float, close: float) -> None:
+        self._save()
+        self.count += 1
+        if self.count < self.n:
+            self.seed += close
+        elif self.count == self.n:
+            self.seed += close
+            self.ema = self.seed / self.n
+        else:
+            self.ema += (2.0 / (self.n + 1)) * (close - self.ema)
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.ema
+
+
+class RSI(_Recursive):
+    __slots__ = ("prev", "count", "gain", "loss")
+    kind = "rsi"
+    fields = ("prev", "count", "gain", "loss")
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError(f"period must be >= 1: {n}")
+        self.n = int(n)
+        self.prev: Optional[float] = None
+        self.count = 0  # number of close-to-close changes seen
+        self.gain = 0.0  # seed sum until count == n, Wilder average afterwards
+        self.loss = 0.0
+        self.undo = None
+
+    def push(self, high: float, low: float, close: float) -> None:
+        self._save()
+        if self.prev is None:
+            self.prev = close
+            return
+        ch = close - self.prev
+        self.prev = close
+        g = ch if ch > 0 else 0.0
+        l = -ch if ch < 0 else 0.0
+        self.count += 1
+        if self.count < self.n:
+            self.gain += g
+            self.loss += l
+        elif self.count == self.n:
+            self.gain = (self.gain + g) / self.n
+            self.loss = (self.loss + l) / self.n
+        else:
+            self.gain = (self.gain * (self.n - 1) + g) / self.n
+            self.loss = (self.loss * (self.n - 1) + l) / self.n
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.count < self.n:
+            return None
+        if self.loss == 0.0:
+            return 100.0 if self.gain > 0 else 50.0
+        return 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+
+
+class ATR(_Recursive):
+    __slots__ = ("prev", "count", "atr")
+    kind = "atr"
+    fields = ("prev", "count", "atr")
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError(f"period must be >= 1: {n}")
+        self.n = int(n)
+        self.prev: Optional[float] = None
+        self.count = 0
+        self.atr = 0.0  # seed sum until count == n
+        self.undo = None
+
+    def push(self, high: float, low: float, close: float) -> None:
+        self._save()
+        if self.prev is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev), abs(low - self.prev))
+        self.prev = close
+        self.count += 1
+        if self.count < self.n:
+            self.atr += tr
+        elif self.count == self.n:
+            self.atr = (self.atr + tr) / self.n
+        else:
+            self.atr = (self.atr * (self.n - 1) + tr) / self.n
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.atr if self.count >= self.n else None
+
+
+KINDS = {c.kind: c for c in (SMA, STD, EMA, RSI, ATR)}
+
+
+# ----------------------------
+# vectorised initialisation (symbols x candles)
+# ----------------------------
+def _batch_states(kind: str, n: int, H: np.ndarray, L: np.ndarray, C: np.ndarray) -> List[_Indicator]:
+    """
+    State of `kind`(n) after every column of the (S, N) matrices, computed across all symbols
+    at once. Time is the only Python-level loop (recursive kinds); window kinds are O(n).
+    """
+    S, N = C.shape
+    cls = KINDS[kind]
+    out = [cls(n) for _ in range(S)]
+    if N == 0:
+        return out
+
+    if kind in ("sma", "std"):
+        k = min(N, n)
+        tail = C[:, N - k:]
+        sums = tail.sum(axis=1)
+        sqs = (tail * tail).sum(axis=1)
+        for s, ind in enumerate(out):
+            buf = tail[s].tolist() + [0.0] * (n - k)
+            ind.buf, ind.count, ind.i = buf, k, k % n
+            ind.sum, ind.sumsq = float(sums[s]), float(sqs[s])
+        return out
+
+    if kind == "ema":
+        k = min(N, n)
+        seed = C[:, :k].sum(axis=1)
+        ema = seed / n if N >= n else None
+        a = 2.0 / (n + 1)
+        for t in range(n, N):
+            ema = ema + a * (C[:, t] - ema)
+        for s, ind in enumerate(out):
+            ind.count, ind.seed = N, float(seed[s])
+            ind.ema = float(ema[s]) if ema is not None else None
+        return out
+
+    if kind == "rsi":
+        ch = np.diff(C, axis=1)
+        g = np.where(ch > 0, ch, 0.0)
+        l = np.where(ch < 0, -ch, 0.0)
+        m = ch.shape[1]
+        k = min(m, n)
+        gain, loss = g[:, :k].sum(axis=1), l[:, :k].sum(axis=1)
+        if m >= n:
+            gain, loss = gain / n, loss / n
+            for t in range(n, m):
+                gain = (gain * (n - 1) + g[:, t]) / n
+                loss = (loss * (n - 1) + l[:, t]) / n
+        for s, ind in enumerate(out):
+            ind.prev, ind.count = float(C[s, -1]), m
+            ind.gain, ind.loss = float(gain[s]), float(loss[s])
+        return out
+
+    if kind == "atr":
+        tr = H - L
+        if N > 1:
+            pc = C[:, :-1]
+            tr[:, 1:] = np.maximum(tr[:, 1:], np.maximum(np.abs(H[:, 1:] - pc), np.abs(L[:, 1:] - pc)))
+        k = min(N, n)
+        atr = tr[:, :k].sum(axis=1)
+        if N >= n:
+            atr = atr / n
+            for t in range(n, N):
+                atr = (atr * (n - 1) + tr[:, t]) / n
+        for s, ind in enumerate(out):
+            ind.prev, ind.count, ind.atr = float(C[s, -1]), N, float(atr[s])
+        return out
+
+    raise ValueError(f"unknown indicator: {kind}")
+
+
+class IndicatorSet:
+    __slots__ = ("ind", "last_ts")
+
+    def __init__(self, spec: Dict[str, Tuple[str, int]]):
+        self.ind: Dict[str, _Indicator] = {name: KINDS[k](n) for name, (k, n) in spec.items()}
+        self.last_ts: Optional[float] = None
+
+    def update(self, ts: float, high: float, low: float, close: float) -> bool:
+        """True = new candle, False = revision of the forming one (or an older candle, ignored)."""
+        if self.last_ts is None or ts > self.last_ts:
+            for i in self.ind.values():
+                i.push(high, low, close)
+            self.last_ts = ts
+            return True
+        if ts == self.last_ts:
+            for i in self.ind.values():
+                i.revise(high, low, close)
+        return False
+
+    def values(self) -> Dict[str, Optional[float]]:
+        return {name: i.value for name, i in self.ind.items()}
+
+    def peek(self, ts: float, high: float, low: float, close: float) -> Optional[Dict[str, Optional[float]]]:
+        """Values with the forming candle at ts revised (e.g. from a ticker); None if ts is not the forming candle."""
+        if self.last_ts is None or ts != self.last_ts:
+            return None
+        return {name: i.peek(high, low, close) for name, i in self.ind.items()}
+
+
+class IndicatorBank:
+    def __init__(self, spec: Dict[str, Tuple[str, int]]):
+        for name, (k, n) in spec.items():
+            if k not in KINDS:
+                raise ValueError(f"unknown indicator {name}: {k}")
+        self.spec = {name: (str(k), int(n)) for name, (k, n) in spec.items()}
+        self.sets: Dict[str, IndicatorSet] = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def get(self, symbol: str) -> IndicatorSet:
+        st = self.sets.get(symbol)
+        if st is None:
+            st = self.sets[symbol] = IndicatorSet(self.spec)
+        return st
+
+    def value(self, symbol: str, name: str) -> Optional[float]:
+        st = self.sets.get(symbol)
+        return st.ind[name].value if st is not None else None
+
+    def update(self, symbol: str, ts: float, high: float, low: float, close: float) -> bool:
+        self._dirty = True
+        return self.get(symbol).update(ts, high, low, close)
+
+    def feed(self, symbol: str, rows: Any) -> int:
+        """
+        Applies OHLCV rows ([ts, o, h, l, c, v], ascending). Rows older than the last seen
+        candle are skipped without being touched, so feeding the same window every loop
+        costs O(new candles). Returns number of new candles.
+        """
+        arr = rows if isinstance(rows, np.ndarray) else np.asarray(rows, dtype=np.float64)
+        if arr.shape[0] == 0:
+            return 0
+        st = self.get(symbol)
+        start = 0
+        if st.last_ts is not None:
+            start = int(np.searchsorted(arr[:, TS], st.last_ts, side="left"))
+        new = 0
+        for r in arr[start:].tolist():
+            new += st.update(r[TS], r[HIGH], r[LOW], r[CLOSE])
+        if start < arr.shape[0]:
+            self._dirty = True
+        return new
+
+    def init_matrix(self, symbols: Sequence[str], ts: Sequence[float], H: np.ndarray, L: np.ndarray, C: np.ndarray) -> None:
+        """
+        Vectorised warm-up from (S, N) high/low/close matrices (same candle count per symbol);
+        ts = last candle timestamp per symbol. The last column is applied with push() so it
+        stays revisable as the forming candle.
+        """
+        H, L, C = (np.asarray(x, dtype=np.float64) for x in (H, L, C))
+        if C.ndim != 2 or H.shape != C.shape or L.shape != C.shape or C.shape[0] != len(symbols):
+            raise ValueError("H/L/C must be (symbols, candles) matrices")
+        cols = C.shape[1]
+        if cols == 0:
+            return
+        per_name = {name: _batch_states(k, n, H[:, :-1], L[:, :-1], C[:, :-1]) for name, (k, n) in self.spec.items()}
+        for s, sym in enumerate(symbols):
+            st = IndicatorSet(self.spec)
+            for name in self.spec:
+                st.ind[name] = per_name[name][s]
+            st.update(float(ts[s]), float(H[s, -1]), float(L[s, -1]), float(C[s, -1]))
+            self.sets[sym] = st
+        self._dirty = True
+
+    def init_from(self, data: Dict[str, np.ndarray], depth: Optional[int] = None) -> None:
+        """Warm-up from {symbol: OHLCV array}; the last `depth` candles (default: common length)."""
+        if not data:
+            return
+        k = min(a.shape[0] for a in data.values())
+        if depth is not None:
+            k = min(k, int(depth))
+        if k == 0:
+            return
+        syms = list(data.keys())
+        block = np.stack([np.asarray(data[s][-k:], dtype=np.float64) for s in syms])
+        self.init_matrix(syms, block[:, -1, TS], block[:, :, HIGH], block[:, :, LOW], block[:, :, CLOSE])
+
+    # ----------------------------
+    # snapshots
+    # ----------------------------
+    def save(self, path: Path) -> None:
+        payload = {
+            "spec": self.spec,
+            "symbols": {
+                sym: {"ts": st.last_ts, "ind": {name: i.to_dict() for name, i in st.ind.items()}}
+                for sym, st in self.sets.items()
+            },
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def maybe_save(self, path: Path, every_s: float = 60.0) -> bool:
+        if self._dirty and time.monotonic() - self._last_save >= every_s:
+            self.save(path)
+            return True
+        return False
+
+    @classmethod
+    def load(cls, path: Path, spec: Dict[str, Tuple[str, int]]) -> "IndicatorBank":
+        """Snapshot for the same spec, else an empty bank (spec changes invalidate state)."""
+        bank = cls(spec)
+        path = Path(path)
+        if not path.exists():
+            return bank
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+            saved = {name: (k, int(n)) for name, (k, n) in (payload.get("spec") or {}).items()}
+            if saved != bank.spec:
+                logger.info("INDICATOR_SNAPSHOT_SPEC_CHANGED | path=%s", path)
+                return bank
+            for sym, blob in (payload.get("symbols") or {}).items():
+                st = IndicatorSet(bank.spec)
+                for name, d in blob["ind"].items():
+                    st.ind[name] = KINDS[d["kind"]].from_dict(d)
+                st.last_ts = blob.get("ts")
+                bank.sets[sym] = st
+        except Exception as e:
+            logger.warning("INDICATOR_SNAPSHOT_LOAD_FAIL | path=%s err=%s", path, e)
+            return cls(spec)
+        return bank
+
+
+_banks: Dict[str, IndicatorBank] = {}
+
+
+def get_indicator_bank(spec: Dict[str, Tuple[str, int]], name: str = "default") -> IndicatorBank:
+    """
+    Process-wide bank per name, restored from INDICATOR_STATE_DIR/{name}.json on first use
+    (or whenever the spec changes, e.g. MA_PERIOD edited in brain.xlsx).
+    """
+    spec = {k: (str(v[0]), int(v[1])) for k, v in spec.items()}
+    bank = _banks.get(name)
+    if bank is None or bank.spec != spec:
+        bank = _banks[name] = IndicatorBank.load(indicator_state_path(name), spec)
+    return bank
+
+
+def indicator_state_path(name: str = "default") -> Path:
+    return Path(os.getenv("INDICATOR_STATE_DIR", "/var/data/indicators")) / f"{name}.json"
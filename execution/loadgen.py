@@ -0,0 +1,484 @@
+# execution/loadgen.py
+"""
+Synthetic end-to-end load for the execution worker (capacity planning).
+
+  python -m execution.loadgen [--mode DEMO|TESTNET] [--rates 5,10,20,50] [--step-seconds 30]
+                              [--symbols BTC/USDT:5,ETH/USDT:3,SOL/USDT:2] [--dup-share 0.1]
+                              [--invalid-share 0.05] [--env K=V ...] [--workdir DIR] [--out report.json]
+
+Starts `python -m execution.main` as a subprocess on a private DB / outbox / trace file in
+--workdir (EXCHANGE_BACKEND=fake: no network, no /var/data), then offers certified signals
+through append_signal at each rate of --rates for --step-seconds:
+
+  unique      fresh signal_id, symbol drawn from the --symbols weights, position_size jittered
+              so the outbox soft dedupe (fingerprint of symbol + size) only sees real repeats
+  duplicate   exact resend of a recently offered signal (--dup-share): caught by the outbox
+              soft dedupe while the original is queued, by executed_signals once it ran
+  invalid     payload that fails validate_signal (--invalid-share): rejected at append
+
+Report (stdout, --out JSON):
+  per step    offered rate, rejects, worker throughput (execute spans), e2e and
+              queue p50 / p95 / p99, outbox depth start / end / slope, diverged
+  divergence  first rate whose outbox depth keeps growing (slope > max(0.5, 5% of the offered
+              rate) signals/s over the second half of the step); later steps are skipped
+              unless --keep-going. max_sustained_rate is the offered rate of the last step
+              before it
+  dedupe      duplicates offered, outbox soft hits, executed_signals hits, missed (still
+              queued at the end, or executed twice)
+  latency     tracing.summarize over the whole run
+  db          file size (incl. WAL) before / after, bytes per processed signal, rows per table
+
+Worker knobs are the usual env vars (LOOP_SLEEP_SECONDS, WORKER_BATCH_MAX, ...); the defaults
+here only shorten the loop sleep. --env overrides anything passed to the worker.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import signal
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+INVALID_KINDS = ("not_certified", "bad_direction", "missing_symbol", "bad_size", "bad_verdict")
+
+
+def _parse_symbols(raw: str) -> List[Tuple[str, float]]:
+    out = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        sym, _, w = part.partition(":")
+        out.append((sym.strip().upper(), float(w or 1)))
+    if not out:
+        raise ValueError("empty symbol mix")
+    return out
+
+
+def _pct(sorted_ms: List[float], p: float) -> Optional[float]:
+    if not sorted_ms:
+        return None
+    # nearest rank, as tracing.summarize
+    k = max(0, min(len(sorted_ms) - 1, math.ceil(p / 100.0 * len(sorted_ms)) - 1))
+    return round(sorted_ms[k], 3)
+
+
+def _slope(points: List[Tuple[float, int]]) -> float:
+    """Least-squares depth growth in signals/s."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mt = sum(t for t, _ in points) / n
+    md = sum(d for _, d in points) / n
+    var = sum((t - mt) ** 2 for t, _ in points)
+    if var <= 0:
+        return 0.0
+    return sum((t - mt) * (d - md) for t, d in points) / var
+
+
+class SignalFactory:
+    def __init__(self, symbols: List[Tuple[str, float]], size: float, dup_share: float, invalid_share: float, seed: int):
+        self.symbols = [s for s, _ in symbols]
+        self.weights = [w for _, w in symbols]
+        self.size = float(size)
+        self.dup_share = float(dup_share)
+        self.invalid_share = float(invalid_share)
+        self.rng = random.Random(seed)
+        self.recent: List[Dict[str, Any]] = []
+        self.seq = 0
+
+    def _fresh(self) -> Dict[str, Any]:
+        self.seq += 1
+        return {
+            "signal_id": f"load-{self.seq}-{self.rng.getrandbits(32):08x}",
+            "final_verdict": "TRADE",
+            "certified_signal": True,
+            "created_at_utc": datetime.now(timezone.utc).isoformat(),
+            "execution": {
+                "symbol": self.rng.choices(self.symbols, self.weights)[0],
+                "direction": "LONG",
+                "entry": {"type": "MARKET"},
+                "position_size": round(self.size * (1.0 + self.rng.random() * 0.1), 8),
+            },
+        }
+
+    def _invalid(self) -> Tuple[str, Dict[str, Any]]:
+        kind = self.rng.choice(INVALID_KINDS)
+        sig = self._fresh()
+        if kind == "not_certified":
+            sig["certified_signal"] = False
+        elif kind == "bad_direction":
+            sig["execution"]["direction"] = "SHORT"
+        elif kind == "missing_symbol":
+            sig["execution"].pop("symbol")
+        elif kind == "bad_size":
+            sig["execution"]["position_size"] = 0
+        else:
+            sig["final_verdict"] = "MAYBE"
+        return kind, sig
+
+    def next(self) -> Tuple[str, Dict[str, Any]]:
+        """(kind, signal) with kind in unique / duplicate / invalid:<reason>."""
+        r = self.rng.random()
+        if r < self.invalid_share:
+            kind, sig = self._invalid()
+            return f"invalid:{kind}", sig
+        if r < self.invalid_share + self.dup_share and self.recent:
+            orig = self.rng.choice(self.recent)
+            return "duplicate", json.loads(json.dumps(orig))
+        sig = self._fresh()
+        # copy before append_signal adds _fingerprint / trace_id / _appended_ts
+        self.recent.append(json.loads(json.dumps(sig)))
+        if len(self.recent) > 20:
+            self.recent.pop(0)
+        return "unique", sig
+
+
+# ----------------------------
+# worker process
+# ----------------------------
+def _worker_env(mode: str, work: Path, symbols: List[str], overrides: Dict[str, str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "MODE": mode,
+        "EXCHANGE_BACKEND": "fake",
+        "DB_PATH": str(work / "load.db"),
+        "SIGNAL_OUTBOX_PATH": str(work / "outbox.json"),
+        "TRACE_ENABLED": "true",
+        "TRACE_PATH": str(work / "trace.tsv"),
+        "GENIUS_STATE_MMAP_PATH": str(work / "genius_state.bin"),
+        "GENIUS_STATE_JSON_MIRROR": "false",
+        "PROFILER_DIR": str(work / "profiles"),
+        "WORKER_GENERATOR_ENABLED": "false",
+        "LOOP_SLEEP_SECONDS": "0.05",
+        "METRICS_PORT": "0",
+        "KILL_SWITCH": "false",
+        "VIRTUAL_START_BALANCE": "1000000000",
+        "FAKE_EXCHANGE_START_USDT": "1000000000",
+        "SYMBOL_WHITELIST": ",".join(symbols),
+        "MAX_QUOTE_PER_TRADE": "1000",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if mode != "DEMO":
+        env.setdefault("BINANCE_API_KEY", "loadgen")
+        env.setdefault("BINANCE_API_SECRET", "loadgen")
+    env.update(overrides)
+    return env
+
+
+def _start_worker(env: Dict[str, str], work: Path, ready_timeout_s: float = 60.0) -> subprocess.Popen:
+    log = open(work / "worker.log", "ab")
+    proc = subprocess.Popen([sys.executable, "-m", "execution.main"], env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    # the worker publishes its state once it has wired the DB, exchange and PnL engine
+    state = Path(env["GENIUS_STATE_MMAP_PATH"])
+    deadline = time.monotonic() + ready_timeout_s
+    while not state.exists():
+        if proc.poll() is not None:
+            raise RuntimeError(f"worker exited with {proc.returncode} during startup, see {work / 'worker.log'}")
+        if time.monotonic() > deadline:
+            _stop_worker(proc)
+            raise RuntimeError(f"worker not ready after {ready_timeout_s:.0f}s, see {work / 'worker.log'}")
+        time.sleep(0.1)
+    return proc
+
+
+def _stop_worker(proc: subprocess.Popen, timeout_s: float = 15.0) -> None:
+    if proc.poll() is not None:
+        return
+    # SIGINT: KeyboardInterrupt -> atexit flushes traces and the log queue
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout_s)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ----------------------------
+# measurements
+# ----------------------------
+def _db_bytes(db_path: Path) -> int:
+    return sum(p.stat().st_size for p in (db_path, Path(f"{db_path}-wal")) if p.exists())
+
+
+def _db_counts(db_path: Path) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """(rows per table, audit_log rows per event_type)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        rows = {t: int(conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0]) for t in sorted(tables)}
+        events = {str(e): int(n) for e, n in conn.execute("SELECT event_type, COUNT(*) FROM audit_log GROUP BY event_type")}
+    finally:
+        conn.close()
+    return rows, events
+
+
+def _read_spans(path: Path, since_ts: float) -> Dict[str, List[Tuple[float, float]]]:
+    """stage -> [(start_ts, dur_ms)]"""
+    out: Dict[str, List[Tuple[float, float]]] = {}
+    if not path.exists():
+        return out
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 5:
+                continue
+            try:
+                start_ts, dur_ms = float(parts[2]), float(parts[3])
+            except ValueError:
+                continue
+            if start_ts >= since_ts:
+                out.setdefault(parts[1], []).append((start_ts, dur_ms))
+    return out
+
+
+def _window(spans: List[Tuple[float, float]], t0: float, t1: float, by_end: bool = False) -> List[float]:
+    # e2e / queue spans are attributed to the step in which they ended
+    return sorted(ms for ts, ms in spans if t0 <= (ts + ms / 1000.0 if by_end else ts) < t1)
+
+
+# ----------------------------
+# run
+# ----------------------------
+def _offer(factory: SignalFactory, outbox: str, counts: Dict[str, int]) -> None:
+    from execution.signal_client import append_signal
+
+    kind, sig = factory.next()
+    counts["offered"] += 1
+    if kind.startswith("invalid:"):
+        counts["invalid"] += 1
+    elif kind == "duplicate":
+        counts["duplicates"] += 1
+    try:
+        append_signal(sig, outbox)
+    except ValueError as e:
+        counts["rejected"] += 1
+        reason = f"rejected:{e}"
+        counts[reason] = counts.get(reason, 0) + 1
+        if not kind.startswith("invalid:"):
+            counts["rejected_valid"] += 1
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    symbols = _parse_symbols(args.symbols)
+    rates = [float(r) for r in args.rates.split(",") if r.strip()]
+    overrides = dict(kv.split("=", 1) for kv in args.env)
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="gbm_load_"))
+    work.mkdir(parents=True, exist_ok=True)
+    env = _worker_env(args.mode.upper(), work, [s for s, _ in symbols], overrides)
+    outbox = env["SIGNAL_OUTBOX_PATH"]
+    db_path = Path(env["DB_PATH"])
+    trace_path = Path(env["TRACE_PATH"])
+
+    # this process shares the DB / trace file with the worker; its own log lines go to the workdir
+    os.environ["TRACE_PATH"] = env["TRACE_PATH"]
+    os.environ["TRACE_ENABLED"] = "true"
+    from execution.logger import setup_logging
+    setup_logging(fmt="text", stream=open(work / "loadgen.log", "a", encoding="utf-8"))
+    from execution.db import db
+    from execution.db.repository import update_system_state
+    from execution.signal_client import DEDUPED, outbox_depth
+
+    db.DB_PATH = db_path
+    db.init_db()
+    update_system_state(status="RUNNING", startup_sync_ok=1, kill_switch=0)
+    db_bytes_start = _db_bytes(db_path)
+
+    factory = SignalFactory(symbols, args.size, args.dup_share, args.invalid_share, args.seed)
+    counts = {"offered": 0, "invalid": 0, "duplicates": 0, "rejected": 0, "rejected_valid": 0}
+    deduped_start = DEDUPED.value
+    steps: List[Dict[str, Any]] = []
+    diverged_at: Optional[float] = None
+
+    print(f"workdir={work} mode={args.mode.upper()} rates={rates} step={args.step_seconds:.0f}s", file=sys.stderr)
+    proc = _start_worker(env, work)
+    t_run = time.time()
+    try:
+        for rate in rates:
+            before = dict(counts)
+            depth: List[Tuple[float, int]] = []
+            t0 = time.time()
+            m0 = time.monotonic()
+            sent = 0
+            next_sample = m0
+            while True:
+                now = time.monotonic()
+                elapsed = now - m0
+                if elapsed >= args.step_seconds:
+                    break
+                if proc.poll() is not None:
+                    raise RuntimeError(f"worker exited with {proc.returncode}, see {work / 'worker.log'}")
+                if now >= next_sample:
+                    depth.append((elapsed, outbox_depth(outbox)))
+                    next_sample += args.sample_seconds
+                due = int(elapsed * rate) - sent
+                for _ in range(max(0, due)):
+                    # a slow append must not stretch the step or starve the depth sampling
+                    if time.monotonic() >= min(next_sample, m0 + args.step_seconds):
+                        break
+                    _offer(factory, outbox, counts)
+                    sent += 1
+                if due <= 0:
+                    time.sleep(min(1.0 / rate, max(0.001, next_sample - time.monotonic()), 0.05))
+            t1 = time.time()
+            depth.append((time.monotonic() - m0, outbox_depth(outbox)))
+
+            offered_per_s = (counts["offered"] - before["offered"]) / (t1 - t0)
+            tail = [p for p in depth if p[0] >= args.step_seconds / 2]
+            slope = _slope(tail)
+            diverged = slope > max(0.5, 0.05 * offered_per_s) and depth[-1][1] > depth[0][1]
+            step = {
+                "rate": rate,
+                "seconds": round(t1 - t0, 2),
+                "offered": counts["offered"] - before["offered"],
+                "offered_per_s": round(offered_per_s, 2),
+                # append_signal itself slows down with the outbox depth
+                "producer_bound": offered_per_s < 0.9 * rate,
+                "rejected": counts["rejected"] - before["rejected"],
+                "depth_start": depth[0][1],
+                "depth_end": depth[-1][1],
+                "depth_max": max(d for _, d in depth),
+                "depth_slope_per_s": round(slope, 3),
+                "diverged": diverged,
+                "_window": (t0, t1),
+            }
+            steps.append(step)
+            print(
+                f"rate={rate:8.1f}/s offered={step['offered_per_s']:8.1f}/s depth {step['depth_start']:6d} -> "
+                f"{step['depth_end']:6d} slope={slope:8.2f}/s{'  PRODUCER_BOUND' if step['producer_bound'] else ''}"
+                f"{'  DIVERGED' if diverged else ''}",
+                file=sys.stderr,
+            )
+            if diverged and diverged_at is None:
+                diverged_at = rate
+                if not args.keep_going:
+                    break
+
+        # drain: how long the worker needs for what is left
+        t_drain = time.monotonic()
+        while outbox_depth(outbox) and time.monotonic() - t_drain < args.drain_seconds and proc.poll() is None:
+            time.sleep(args.sample_seconds)
+        drain = {"seconds": round(time.monotonic() - t_drain, 2), "depth_left": outbox_depth(outbox)}
+    finally:
+        _stop_worker(proc)
+
+    spans = _read_spans(trace_path, t_run)
+    for step in steps:
+        t0, t1 = step.pop("_window")
+        executed = _window(spans.get("execute", []), t0, t1)
+        e2e = _window(spans.get("e2e", []), t0, t1, by_end=True)
+        queue = _window(spans.get("queue", []), t0, t1, by_end=True)
+        step["processed_per_s"] = round(len(executed) / max(1e-9, t1 - t0), 2)
+        step["armed_per_s"] = round(len(e2e) / max(1e-9, t1 - t0), 2)
+        step["e2e_ms"] = {"p50": _pct(e2e, 50), "p95": _pct(e2e, 95), "p99": _pct(e2e, 99)}
+        step["queue_ms"] = {"p50": _pct(queue, 50), "p95": _pct(queue, 95), "p99": _pct(queue, 99)}
+
+    from execution.tracing import summarize
+
+    rows, events = _db_counts(db_path)
+    db_bytes_end = _db_bytes(db_path)
+    processed = len(spans.get("execute", []))
+    soft = int(DEDUPED.value - deduped_start)
+    hard = events.get("EXEC_DEDUPED", 0)
+    sustained = None
+    for s in steps:
+        if s["diverged"]:
+            break
+        sustained = s["offered_per_s"]
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "mode": args.mode.upper(),
+            "workdir": str(work),
+            "symbols": dict(symbols),
+            "rates": rates,
+            "step_seconds": args.step_seconds,
+            "dup_share": args.dup_share,
+            "invalid_share": args.invalid_share,
+            "worker_env": {k: env[k] for k in sorted(env) if k in overrides or k in ("LOOP_SLEEP_SECONDS", "WORKER_BATCH_MAX")},
+        },
+        "steps": steps,
+        "diverged_at_rate": diverged_at,
+        "max_sustained_rate": sustained,
+        "drain": drain,
+        "offered": counts,
+        "dedupe": {
+            "duplicates_offered": counts["duplicates"],
+            "outbox_soft_hits": soft,
+            "executed_signals_hits": hard,
+            "missed": max(0, counts["duplicates"] - soft - hard),
+            "hit_rate": round((soft + hard) / counts["duplicates"], 4) if counts["duplicates"] else None,
+        },
+        "latency_ms": summarize(str(trace_path), t_run) if trace_path.exists() else {},
+        "db": {
+            "bytes_start": db_bytes_start,
+            "bytes_end": db_bytes_end,
+            "bytes_per_processed_signal": round((db_bytes_end - db_bytes_start) / processed, 1) if processed else None,
+            "rows": rows,
+            "audit_events": events,
+        },
+    }
+
+
+def _print_report(rep: Dict[str, Any]) -> None:
+    print(f"{'rate':>8s} {'offered/s':>10s} {'proc/s':>8s} {'armed/s':>8s} {'depth_end':>9s} {'slope/s':>8s} "
+          f"{'e2e_p50':>9s} {'e2e_p95':>9s} {'e2e_p99':>9s}")
+    for s in rep["steps"]:
+        e = s["e2e_ms"]
+        cells = " ".join(f"{v:9.1f}" if v is not None else f"{'-':>9s}" for v in (e["p50"], e["p95"], e["p99"]))
+        print(f"{s['rate']:8.1f} {s['offered_per_s']:10.1f} {s['processed_per_s']:8.1f} {s['armed_per_s']:8.1f} "
+              f"{s['depth_end']:9d} {s['depth_slope_per_s']:8.2f} {cells}{'  DIVERGED' if s['diverged'] else ''}")
+    print(f"diverged_at_rate={rep['diverged_at_rate']} max_sustained_rate={rep['max_sustained_rate']} "
+          f"drain={rep['drain']['seconds']}s depth_left={rep['drain']['depth_left']}")
+    d = rep["dedupe"]
+    print(f"dedupe: duplicates={d['duplicates_offered']} outbox_soft={d['outbox_soft_hits']} "
+          f"executed_signals={d['executed_signals_hits']} missed={d['missed']} hit_rate={d['hit_rate']}")
+    o = rep["offered"]
+    print(f"offered={o['offered']} invalid={o['invalid']} rejected={o['rejected']} rejected_valid={o['rejected_valid']}")
+    db = rep["db"]
+    print(f"db: {db['bytes_start']} -> {db['bytes_end']} bytes ({db['bytes_per_processed_signal']} B/signal) rows={db['rows']}")
+    for stage, s in rep["latency_ms"].items():
+        print(f"  {stage:14s} n={s['n']:7d} p50={s['p50']:10.3f} p95={s['p95']:10.3f} p99={s['p99']:10.3f} ms")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m execution.loadgen")
+    ap.add_argument("--mode", default="DEMO", choices=("DEMO", "TESTNET", "demo", "testnet"))
+    ap.add_argument("--rates", default="5,10,20,50", help="comma separated signals/s, one step each")
+    ap.add_argument("--step-seconds", type=float, default=30.0)
+    ap.add_argument("--symbols", default="BTC/USDT:5,ETH/USDT:3,SOL/USDT:2", help="SYMBOL:weight,...")
+    ap.add_argument("--size", type=float, default=0.1, help="base position_size (jittered up to +10%%)")
+    ap.add_argument("--dup-share", type=float, default=0.1)
+    ap.add_argument("--invalid-share", type=float, default=0.05)
+    ap.add_argument("--sample-seconds", type=float, default=0.25, help="outbox depth sampling interval")
+    ap.add_argument("--drain-seconds", type=float, default=30.0, help="max wait for the outbox to empty after the last step")
+    ap.add_argument("--keep-going", action="store_true", help="run the remaining rates after the backlog diverged")
+    ap.add_argument("--env", action="append", default=[], metavar="K=V", help="worker env override (repeatable)")
+    ap.add_argument("--workdir", default=None, help="DB / outbox / traces / worker.log (default: new temp dir, kept)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    args = ap.parse_args(argv)
+
+    if any("=" not in kv for kv in args.env):
+        ap.error("--env expects K=V")
+    if args.dup_share + args.invalid_share >= 1.0:
+        ap.error("--dup-share + --invalid-share must be < 1")
+
+    report = run(args)
+    _print_report(report)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,193 @@
-print("LOGGER MODULE LOADED", flush=True)
-# execution/logger.py
-from datetime import datetime
-
-def log_info(message: str) -> None:
-    print(f"[INFO] {datetime.utcnow().isoformat()}Z - {message}", flush=True)
-
-def log_warning(message: str) -> None:
-    print(f"[WARN] {datetime.utcnow().isoformat()}Z - {message}", flush=True)
-
-def log_error(message: str) -> None:
-    print(f"[ERROR] {datetime.utcnow().isoformat()}Z - {message}", flush=True)
-
+# execution/logger.py
+"""
+Logging pipeline for the long-running processes (worker, generator daemon).
+
+  setup_logging()   root logger -> one QueueHandler (caller side: filter + enqueue, never blocks)
+                    QueueListener thread -> format (JSON or text) -> stderr
+
+Caller side cost is a filter and a put_nowait(): no formatting, no I/O, no flush. Records are
+formatted in the listener thread, so use lazy %-style args on hot paths
+(logger.info("EXEC_ENTER | id=%s", signal_id)); args must not be mutated after the call.
+A full queue (LOG_QUEUE_MAX) drops the record; the next record that gets through carries
+dropped=N.
+
+Filters apply to DEBUG/INFO only: WARNING and above always pass (breaches, rejects and
+failures are never sampled away). The event key is the message text before " |" (the repo's
+"EVENT | k=v" convention), taken from the unformatted template:
+  LOG_SAMPLE="Worker alive:30"   keep 1 in N records per event prefix (comma separated)
+  LOG_RATE_LIMIT="50/10"         at most 50 records per event per 10 s; the first record after
+                                 the window carries suppressed=N. "0" disables.
+
+LOG_FORMAT=json (default) | text, LOG_LEVEL=INFO.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+TEXT_FORMAT = '[%(levelname)s] %(asctime)s - %(message)s'
+
+_log = logging.getLogger("gbm")
+
+
+def log_info(message: str, *args) -> None:
+    _log.info(message, *args)
+
+
+def log_warning(message: str, *args) -> None:
+    _log.warning(message, *args)
+
+
+def log_error(message: str, *args) -> None:
+    _log.error(message, *args)
+
+
+def _event(record: logging.LogRecord) -> str:
+    msg = record.msg if isinstance(record.msg, str) else str(record.msg)
+    return msg.split(" |", 1)[0].strip()[:64]
+
+
+def _parse_sample(raw: str) -> List[Tuple[str, int]]:
+    out = []
+    for part in raw.split(","):
+        if ":" in part:
+            prefix, n = part.rsplit(":", 1)
+            if prefix.strip() and int(n) > 1:
+                out.append((prefix.strip(), int(n)))
+    return out
+
+
+def _parse_rate(raw: str) -> Tuple[int, float]:
+    raw = raw.strip()
+    if not raw or raw == "0":
+        return 0, 0.0
+    n, _, window = raw.partition("/")
+    return int(n), float(window or 1)
+
+
+class SampleFilter(logging.Filter):
+    """1-in-N sampling per event prefix + per-event rate limit; WARNING and above always pass."""
+
+    def __init__(self, sample: List[Tuple[str, int]], rate_n: int = 0, rate_window_s: float = 0.0):
+        super().__init__()
+        self.sample = sample
+        self.rate_n = int(rate_n)
+        self.rate_window_s = float(rate_window_s)
+        self._seen: Dict[str, int] = {}
+        self._windows: Dict[str, List[float]] = {}  # event -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = _event(record)
+        with self._lock:
+            for prefix, n in self.sample:
+                if key.startswith(prefix):
+                    seen = self._seen.get(prefix, 0)
+                    self._seen[prefix] = seen + 1
+                    if seen % n:
+                        return False
+                    break
+            if self.rate_n <= 0:
+                return True
+            w = self._windows.get(key)
+            if w is None or record.created - w[0] >= self.rate_window_s:
+                suppressed = int(w[2]) if w is not None else 0
+                self._windows[key] = [record.created, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if w[1] >= self.rate_n:
+                w[2] += 1
+                return False
+            w[1] += 1
+            return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting happens in the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if getattr(record, "dropped", 0):
+            self.dropped = 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": _event(record),
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for extra in ("suppressed", "dropped"):
+            if getattr(record, extra, 0):
+                out[extra] = getattr(record, extra)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        s = super().format(record)
+        for extra in ("suppressed", "dropped"):
+            if getattr(record, extra, 0):
+                s += f" {extra}={getattr(record, extra)}"
+        return s
+
+
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None) -> None:
+    """Installs the queue pipeline on the root logger (once per process; again after a fork)."""
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).strip().lower()
+
+    out = logging.StreamHandler(stream or sys.stderr)
+    out.setFormatter(TextFormatter(TEXT_FORMAT) if fmt == "text" else JsonFormatter())
+
+    q: "queue.Queue" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_MAX", "10000")))
+    qh = _NonBlockingQueueHandler(q)
+    qh.addFilter(SampleFilter(
+        _parse_sample(os.getenv("LOG_SAMPLE", "Worker alive:30")),
+        *_parse_rate(os.getenv("LOG_RATE_LIMIT", "50/10")),
+    ))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(qh)
+    root.setLevel(level)
+
+    _listener = QueueListener(q, out)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
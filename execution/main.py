@@ -1,179 +1,303 @@
-# execution/main.py
-import os
-import time
-import logging
-from typing import Optional, Dict, Any
-
-from execution.db.db import init_db
-from execution.db.repository import (
-    get_system_state,
-    update_system_state,
-    log_event,
-    get_open_positions_count,
-)
-from execution.execution_engine import ExecutionEngine
-from execution.signal_client import pop_next_signal
-from execution.kill_switch import is_kill_switch_active
-from execution.shared_state import write_genius_state
-
-logger = logging.getLogger("gbm")
-
-
-def _bootstrap_state_if_needed() -> None:
-    """
-    Dual-brain rule:
-    - We do NOT auto self-heal to RUNNING here.
-    - Guard + DB gates control when system runs.
-    This function only logs the current DB state for visibility.
-    """
-    raw = get_system_state()
-    if not isinstance(raw, (list, tuple)) or len(raw) < 5:
-        logger.warning("BOOTSTRAP_STATE | system_state row missing or invalid -> skip")
-        return
-
-    status = str(raw[1] or "").upper()
-    startup_sync_ok = int(raw[2] or 0)
-    kill_switch_db = int(raw[3] or 0)
-
-    env_kill = os.getenv("KILL_SWITCH", "false").lower() == "true"
-
-    logger.info(
-        f"BOOTSTRAP_STATE | status={status} startup_sync_ok={startup_sync_ok} "
-        f"kill_db={kill_switch_db} env_kill={env_kill}"
-    )
-
-
-def _try_import_generator():
-    """
-    Optional: Excel-based generator. If missing or broken, worker still runs (consumer-only).
-    Must expose: execution/signal_generator.py -> run_once(outbox_path) -> bool
-    """
-    try:
-        from execution.signal_generator import run_once as generate_once  # type: ignore
-        logger.info("SIGNAL_GENERATOR | loaded execution.signal_generator.run_once")
-        return generate_once
-    except Exception as e:
-        logger.warning(f"GENERATOR_IMPORT_FAIL | err={e} -> generator disabled (consumer-only)")
-        try:
-            log_event("GENERATOR_IMPORT_FAIL", f"err={e}")
-        except Exception:
-            pass
-        return None
-
-
-def _safe_pop_next_signal(outbox_path: str) -> Optional[Dict[str, Any]]:
-    try:
-        return pop_next_signal(outbox_path)
-    except Exception as e:
-        logger.exception(f"OUTBOX_POP_FAIL | path={outbox_path} err={e}")
-        try:
-            log_event("OUTBOX_POP_FAIL", f"path={outbox_path} err={e}")
-        except Exception:
-            pass
-        return None
-
-
-def _write_shared_state(mode: str, worker_status: str, last_signal_id: str = None) -> None:
-    """
-    Guard reads this file. Keep it simple and always update.
-    """
-    try:
-        state = {
-            "mode": mode,
-            "worker_status": worker_status,
-            "open_positions": get_open_positions_count(),
-            "daily_drawdown": 0.0,  # TODO later: compute from wallet/orders
-        }
-        if last_signal_id:
-            state["last_signal_id"] = last_signal_id
-        write_genius_state(state)
-    except Exception as e:
-        logger.warning(f"STATE_WRITE_WARN | err={e}")
-
-
-def main():
-    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(asctime)s - %(message)s')
-
-    mode = os.getenv("MODE", "DEMO").upper()
-    outbox_path = os.getenv("SIGNAL_OUTBOX_PATH", "/var/data/signal_outbox.json")
-    sleep_s = float(os.getenv("LOOP_SLEEP_SECONDS", "10"))
-
-    init_db()
-    _bootstrap_state_if_needed()
-
-    engine = ExecutionEngine()
-
-    # initial reconcile (best-effort)
-    try:
-        engine.reconcile_oco()
-    except Exception as e:
-        logger.warning(f"OCO_RECONCILE_START_WARN | err={e}")
-
-    # optional generator (Excel-based)
-    generate_once = _try_import_generator()
-
-    logger.info(f"GENIUS BOT MAN worker starting | MODE={mode}")
-    logger.info(f"OUTBOX_PATH={outbox_path}")
-    logger.info(f"LOOP_SLEEP_SECONDS={sleep_s}")
-
-    # initial shared state
-    _write_shared_state(mode=mode, worker_status="RUNNING")
-
-    while True:
-        last_signal_id = None
-        try:
-            # 0) ABSOLUTE KILL SWITCH (before everything)
-            if is_kill_switch_active():
-                logger.warning("KILL_SWITCH_ACTIVE | worker will not generate/pop/execute signals")
-                try:
-                    log_event("WORKER_KILL_SWITCH_ACTIVE", "blocked before loop actions")
-                except Exception:
-                    pass
-
-                _write_shared_state(mode=mode, worker_status="KILL_SWITCH_ACTIVE")
-                time.sleep(sleep_s)
-                continue
-
-            # 1) reconcile OCO (best-effort)
-            try:
-                engine.reconcile_oco()
-            except Exception as e:
-                logger.warning(f"OCO_RECONCILE_LOOP_WARN | err={e}")
-
-            # 2) optional generator step (Excel -> outbox)
-            if generate_once is not None:
-                try:
-                    created = generate_once(outbox_path)
-                    if created:
-                        logger.info("SIGNAL_GENERATOR | signal created")
-                except Exception as e:
-                    logger.exception(f"SIGNAL_GENERATOR_FAIL | err={e}")
-                    try:
-                        log_event("SIGNAL_GENERATOR_FAIL", f"err={e}")
-                    except Exception:
-                        pass
-
-            # 3) pop + execute
-            sig = _safe_pop_next_signal(outbox_path)
-            if sig:
-                last_signal_id = str(sig.get("signal_id") or "")
-                logger.info(f"Signal received | id={last_signal_id} | verdict={sig.get('final_verdict')}")
-                engine.execute_signal(sig)
-            else:
-                logger.info("Worker alive, waiting for SIGNAL_OUTBOX...")
-
-        except Exception as e:
-            logger.exception(f"WORKER_LOOP_ERROR | err={e}")
-            try:
-                log_event("WORKER_LOOP_ERROR", f"err={e}")
-            except Exception:
-                pass
-
-        # 4) update shared state every loop
-        _write_shared_state(mode=mode, worker_status="RUNNING", last_signal_id=last_signal_id)
-
-        time.sleep(sleep_s)
-
-
-if __name__ == "__main__":
-    main()
+# execution/main.py
+import os
+import logging
+from typing import Optional, Dict, Any
+
+from execution import clock
+from execution.config import PNL_QUOTE_ASSET
+from execution.db.db import init_db
+from execution.db.repository import (
+    get_system_state,
+    get_pause_reason,
+    update_system_state,
+    log_event,
+    get_open_positions_count,
+)
+from execution.execution_engine import ExecutionEngine
+from execution.signal_client import pop_next_signal, signal_lane, lane_stats, EXPEDITED_LANES, LANES
+from execution.kill_switch import is_kill_switch_active
+from execution.shared_state import write_genius_state
+from execution.pnl_engine import get_pnl_engine
+from execution.watchdog import get_watchdog
+from execution.metrics import collector, gauge, histogram, start_metrics_server
+from execution.logger import setup_logging
+from execution.profiler import install_profiler
+
+logger = logging.getLogger("gbm")
+
+LOOP_SECONDS = histogram("gbm_loop_seconds", "worker loop iteration (excluding sleep)")
+OPEN_POSITIONS = gauge("gbm_open_positions", "open positions (last state write)")
+DAILY_DRAWDOWN = gauge("gbm_daily_drawdown", "daily drawdown fraction (last state write)")
+
+
+def _bootstrap_state_if_needed() -> None:
+    """
+    Dual-brain rule:
+    - We do NOT auto self-heal to RUNNING here.
+    - Guard + DB gates control when system runs.
+    This function only logs the current DB state for visibility.
+    """
+    raw = get_system_state()
+    if not isinstance(raw, (list, tuple)) or len(raw) < 5:
+        logger.warning("BOOTSTRAP_STATE | system_state row missing or invalid -> skip")
+        return
+
+    status = str(raw[1] or "").upper()
+    startup_sync_ok = int(raw[2] or 0)
+    kill_switch_db = int(raw[3] or 0)
+
+    env_kill = os.getenv("KILL_SWITCH", "false").lower() == "true"
+
+    logger.info(
+        "BOOTSTRAP_STATE | status=%s startup_sync_ok=%s kill_db=%s env_kill=%s",
+        status, startup_sync_ok, kill_switch_db, env_kill,
+    )
+
+
+def _pause_reason() -> Optional[str]:
+    """system_state.pause_reason (guard entry gate); unreadable = paused (fail-closed)."""
+    try:
+        return get_pause_reason()
+    except Exception as e:
+        logger.error("PAUSE_READ_FAIL | err=%s -> assume PAUSED", e)
+        return f"pause_reason unreadable: {e}"
+
+
+def _try_import_generator():
+    """
+    Optional: Excel-based generator. If missing or broken, worker still runs (consumer-only).
+    Must expose: execution/signal_generator.py -> run_once(outbox_path) -> int (signals written)
+    WORKER_GENERATOR_ENABLED=false: the root signal_generator.py daemon produces instead.
+    """
+    if os.getenv("WORKER_GENERATOR_ENABLED", "true").strip().lower() not in ("1", "true", "yes", "y"):
+        logger.info("SIGNAL_GENERATOR | disabled in worker (WORKER_GENERATOR_ENABLED=false) -> consumer-only")
+        return None
+    try:
+        from execution.signal_generator import run_once as generate_once  # type: ignore
+        logger.info("SIGNAL_GENERATOR | loaded execution.signal_generator.run_once")
+        return generate_once
+    except Exception as e:
+        logger.warning("GENERATOR_IMPORT_FAIL | err=%s -> generator disabled (consumer-only)", e)
+        try:
+            log_event("GENERATOR_IMPORT_FAIL", f"err={e}")
+        except Exception:
+            pass
+        return None
+
+
+def _safe_pop_next_signal(outbox_path: str, lanes=None) -> Optional[Dict[str, Any]]:
+    try:
+        return pop_next_signal(outbox_path, lanes=lanes)
+    except Exception as e:
+        logger.exception("OUTBOX_POP_FAIL | path=%s err=%s", outbox_path, e)
+        try:
+            log_event("OUTBOX_POP_FAIL", f"path={outbox_path} err={e}")
+        except Exception:
+            pass
+        return None
+
+
+def _init_pnl_engine(engine: ExecutionEngine) -> None:
+    """
+    Rebuild PnL/drawdown state (risk_state snapshot + newer pnl_events).
+    LIVE/TESTNET without a snapshot: start equity = free PNL_QUOTE_ASSET on the exchange.
+    """
+    start_equity = None
+    if engine.exchange is not None and not os.getenv("PNL_START_EQUITY"):
+        try:
+            start_equity = float(engine.exchange.fetch_balance_free(PNL_QUOTE_ASSET))
+        except Exception as e:
+            logger.warning("PNL_START_EQUITY_WARN | err=%s", e)
+    try:
+        pnl = get_pnl_engine(start_equity=start_equity)
+        logger.info("PNL_ENGINE_READY | %s", pnl.state())
+    except Exception as e:
+        logger.exception("PNL_ENGINE_INIT_FAIL | err=%s", e)
+        try:
+            log_event("PNL_ENGINE_INIT_FAIL", f"err={e}")
+        except Exception:
+            pass
+
+
+def _daily_drawdown() -> float:
+    pnl = get_pnl_engine()
+    pnl.tick()
+    pnl.maybe_snapshot()
+    return float(pnl.daily_drawdown)
+
+
+def _register_outbox_gauges(outbox_path: str) -> None:
+    """Queue depth gauges: one parse of the outbox file per /metrics scrape (live signals only)."""
+    depth = gauge("gbm_outbox_depth", "live signals waiting in the outbox")
+    lane_depth = gauge("gbm_outbox_lane_depth", "live signals waiting per lane", ["lane"])
+    lane_oldest = gauge("gbm_outbox_lane_oldest_wait_seconds", "age of the oldest live signal per lane", ["lane"])
+
+    def collect() -> None:
+        stats = lane_stats(outbox_path)
+        depth.set(sum(st["depth"] for st in stats.values()))
+        for lane in LANES:
+            lane_depth.labels(lane=lane).set(stats[lane]["depth"])
+            lane_oldest.labels(lane=lane).set(stats[lane]["oldest_wait_s"])
+
+    collector(collect)
+
+
+def _write_shared_state(mode: str, worker_status: str, last_signal_id: str = None) -> None:
+    """
+    Guard reads this file. Keep it simple and always update.
+    """
+    try:
+        state = {
+            "mode": mode,
+            "worker_status": worker_status,
+            "open_positions": get_open_positions_count(),
+            "daily_drawdown": _daily_drawdown(),
+        }
+        if last_signal_id:
+            state["last_signal_id"] = last_signal_id
+        OPEN_POSITIONS.set(state["open_positions"])
+        DAILY_DRAWDOWN.set(state["daily_drawdown"])
+        write_genius_state(state)
+    except Exception as e:
+        logger.warning("STATE_WRITE_WARN | err=%s", e)
+
+
+def main():
+    # JSON through a queue: the loop never waits on stdout
+    setup_logging()
+
+    mode = os.getenv("MODE", "DEMO").upper()
+    outbox_path = os.getenv("SIGNAL_OUTBOX_PATH", "/var/data/signal_outbox.json")
+    sleep_s = float(os.getenv("LOOP_SLEEP_SECONDS", "10"))
+    # signals executed per loop: up to BATCH_MAX within BATCH_BUDGET; expedited lanes ignore both
+    batch_max = int(os.getenv("WORKER_BATCH_MAX", "20"))
+    batch_budget_s = float(os.getenv("WORKER_BATCH_BUDGET_SECONDS", "5"))
+
+    init_db()
+    _bootstrap_state_if_needed()
+
+    # local /metrics endpoint (METRICS_PORT, off by default)
+    start_metrics_server()
+    _register_outbox_gauges(outbox_path)
+    # SIGUSR1 / system_state.profile_seconds -> sampled stacks in PROFILER_DIR
+    install_profiler("worker")
+
+    engine = ExecutionEngine()
+    _init_pnl_engine(engine)
+
+    # initial reconcile (best-effort)
+    try:
+        engine.reconcile_oco()
+    except Exception as e:
+        logger.warning("OCO_RECONCILE_START_WARN | err=%s", e)
+
+    # optional generator (Excel-based)
+    generate_once = _try_import_generator()
+
+    logger.info("GENIUS BOT MAN worker starting | MODE=%s", mode)
+    logger.info("OUTBOX_PATH=%s", outbox_path)
+    logger.info("LOOP_SLEEP_SECONDS=%s", sleep_s)
+
+    # initial shared state
+    _write_shared_state(mode=mode, worker_status="RUNNING")
+
+    # stage heartbeats: stack dump on a stall, kill switch if the loop stays stuck
+    wd = get_watchdog().start()
+
+    paused: Optional[str] = None
+    while True:
+        last_signal_id = None
+        t_loop = clock.monotonic()
+        try:
+            # 0) ABSOLUTE KILL SWITCH (before everything)
+            if is_kill_switch_active():
+                logger.warning("KILL_SWITCH_ACTIVE | worker will not generate/pop/execute signals")
+                try:
+                    log_event("WORKER_KILL_SWITCH_ACTIVE", "blocked before loop actions")
+                except Exception:
+                    pass
+
+                with wd.stage("state_write"):
+                    _write_shared_state(mode=mode, worker_status="KILL_SWITCH_ACTIVE")
+                wd.beat("loop")
+                LOOP_SECONDS.observe(clock.monotonic() - t_loop)
+                clock.sleep(sleep_s)
+                continue
+
+            # 1) reconcile OCO (best-effort)
+            try:
+                with wd.stage("reconcile"):
+                    engine.reconcile_oco()
+            except Exception as e:
+                logger.warning("OCO_RECONCILE_LOOP_WARN | err=%s", e)
+
+            # entry gate (guard, limit breach): reconcile / OCO exits / state writes keep running,
+            # nothing is generated or popped; queued signals wait (or expire on their TTL)
+            pause_reason = _pause_reason()
+            if pause_reason != paused:
+                if pause_reason:
+                    logger.warning("ENTRIES_PAUSED | reason=%s", pause_reason)
+                else:
+                    logger.warning("ENTRIES_RESUMED")
+                paused = pause_reason
+            if pause_reason:
+                with wd.stage("state_write"):
+                    _write_shared_state(mode=mode, worker_status="PAUSED")
+                wd.beat("loop")
+                LOOP_SECONDS.observe(clock.monotonic() - t_loop)
+                clock.sleep(sleep_s)
+                continue
+
+            # 2) optional generator step (Excel -> outbox)
+            if generate_once is not None:
+                try:
+                    with wd.stage("generator"):
+                        created = generate_once(outbox_path)
+                    if created:
+                        logger.info("SIGNAL_GENERATOR | signals created=%d", int(created))
+                except Exception as e:
+                    logger.exception("SIGNAL_GENERATOR_FAIL | err=%s", e)
+                    try:
+                        log_event("SIGNAL_GENERATOR_FAIL", f"err={e}")
+                    except Exception:
+                        pass
+
+            # 3) pop + execute (batch; lanes picked by the outbox scheduler)
+            t_batch = clock.monotonic()
+            popped = 0
+            while True:
+                over_budget = popped >= batch_max or clock.monotonic() - t_batch >= batch_budget_s
+                with wd.stage("pop"):
+                    sig = _safe_pop_next_signal(outbox_path, lanes=EXPEDITED_LANES if over_budget else None)
+                if not sig:
+                    break
+                popped += 1
+                last_signal_id = str(sig.get("signal_id") or "")
+                logger.info(
+                    "Signal received | id=%s | verdict=%s | lane=%s", last_signal_id, sig.get("final_verdict"), signal_lane(sig)
+                )
+                with wd.stage("execute"):
+                    engine.execute_signal(sig)
+            if not popped:
+                logger.info("Worker alive, waiting for SIGNAL_OUTBOX...")
+            else:
+                logger.info("OUTBOX_BATCH | popped=%d ms=%.0f", popped, (clock.monotonic() - t_batch) * 1000)
+
+        except Exception as e:
+            logger.exception("WORKER_LOOP_ERROR | err=%s", e)
+            try:
+                log_event("WORKER_LOOP_ERROR", f"err={e}")
+            except Exception:
+                pass
+
+        # 4) update shared state every loop
+        with wd.stage("state_write"):
+            _write_shared_state(mode=mode, worker_status="RUNNING", last_signal_id=last_signal_id)
+        wd.beat("loop")
+        LOOP_SECONDS.observe(clock.monotonic() - t_loop)
+
+        clock.sleep(sleep_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# execution/metrics.py
+"""
+In-process metrics: counters, gauges, fixed-bucket histograms + Prometheus text endpoint.
+
+  LOOP_SECONDS = histogram("gbm_loop_seconds", "worker loop iteration")
+  LOOP_SECONDS.observe(dt)                      ~0.3 us: bisect + two adds, no lock
+  EXCHANGE_SECONDS.labels(method="fetch_ticker").observe(dt)
+  gauge_fn("gbm_outbox_depth", "signals waiting", lambda: outbox_depth(path))   evaluated per scrape
+  collector(fn)                                 fn() runs once per scrape before rendering (one
+                                                expensive read feeding several gauges)
+
+Updates are unsynchronised (GIL-protected single bytecode stores): a concurrent scrape may see
+a histogram mid-update, and racing increments from threads can rarely drop one. Good enough
+for monitoring, never used for control decisions.
+
+METRICS_PORT (default 0 = off) serves GET /metrics on METRICS_BIND (default 127.0.0.1) from a
+daemon thread.
+"""
+import os
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("gbm")
+
+# seconds: 100us .. 60s
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **kv: str) -> "_Metric":
+        key = tuple(str(kv[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> "_Metric":
+        ...
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        if self.labelnames:
+            return list(self._children.items())
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, m in self._series():
+            lines.extend(m._render_one(self.name, self.labelnames, values))
+        return lines
+
+    @abstractmethod
+    def _render_one(self, name: str, names: Sequence[str], values: Sequence[str]) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_: str = "", labelnames: Sequence[str] = ()):
+        super().__init__(name, help_, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name)
+
+    def inc(self, n: float = 1.0) -> None:
+        self.value += n
+
+    def _render_one(self, name, names, values):
+        return [f"{name}{_fmt_labels(names, values)} {_fmt(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_: str = "", labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_, labelnames)
+        self.value = 0.0
+        self.fn = fn
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name)
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+    def inc(self, n: float = 1.0) -> None:
+        self.value += n
+
+    def _render_one(self, name, names, values):
+        v = self.value
+        if self.fn is not None:
+            try:
+                v = float(self.fn())
+            except Exception:
+                return []
+        return [f"{name}{_fmt_labels(names, values)} {_fmt(v)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str = "", labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # counts[i]: observations in (buckets[i-1], buckets[i]]; last slot = +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, buckets=self.buckets)
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _render_one(self, name, names, values):
+        out = []
+        acc = 0
+        for b, c in zip(self.buckets + (float("inf"),), self.counts):
+            acc += c
+            le = 'le="%s"' % _fmt(b)
+            out.append(f"{name}_bucket{_fmt_labels(names, values, le)} {acc}")
+        out.append(f"{name}_sum{_fmt_labels(names, values)} {_fmt(self.sum)}")
+        out.append(f"{name}_count{_fmt_labels(names, values)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs) -> _Metric:
+        m = self._metrics.get(name)
+        if m is None:
+            with self._lock:
+                m = self._metrics.get(name)
+                if m is None:
+                    m = self._metrics[name] = cls(name, *args, **kwargs)
+        if not isinstance(m, cls):
+            raise ValueError(f"metric {name} already registered as {m.kind}")
+        return m
+
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception as e:
+                logger.debug("METRICS_COLLECTOR_FAIL | err=%s", e)
+        lines: List[str] = []
+        for m in list(self._metrics.values()):
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_: str = "", labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY._get(Counter, name, help_, labelnames)
+
+
+def gauge(name: str, help_: str = "", labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY._get(Gauge, name, help_, labelnames)
+
+
+def gauge_fn(name: str, help_: str, fn: Callable[[], float]) -> Gauge:
+    """Gauge computed at scrape time (e.g. queue depth read from disk)."""
+    g = REGISTRY._get(Gauge, name, help_)
+    g.fn = fn
+    return g
+
+
+def collector(fn: Callable[[], None]) -> None:
+    """Runs fn() at the start of every scrape (sets gauges from one shared read)."""
+    REGISTRY.add_collector(fn)
+
+
+def histogram(name: str, help_: str = "", labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY._get(Histogram, name, help_, labelnames, buckets)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None, bind: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """Starts the /metrics endpoint once per process; port 0 (default) = disabled."""
+    global _server
+    if _server is not None:
+        return _server
+    port = int(os.getenv("METRICS_PORT", "0")) if port is None else int(port)
+    if port <= 0:
+        return None
+    bind = os.getenv("METRICS_BIND", "127.0.0.1") if bind is None else bind
+    try:
+        _server = ThreadingHTTPServer((bind, port), _Handler)
+    except OSError as e:
+        logger.warning("METRICS_SERVER_FAIL | bind=%s port=%s err=%s", bind, port, e)
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("METRICS_SERVER_START | bind=%s port=%s", bind, port)
+    return _server
@@ -0,0 +1,193 @@
+# execution/outbox_lock.py
+"""
+Advisory cross-process lock for the signal outbox (fcntl.flock on <outbox>.lock).
+
+  with outbox_lock(path):                 exclusive: swap in a rewritten outbox
+  with outbox_lock(path, shared=True):    shared: take a consistent (revision, open file) pair
+
+Critical sections are O(1) (flock + an 8-byte read/write + a rename), independent of outbox
+depth. The sidecar lock file also holds the outbox revision, bumped by every committed
+rewrite. Writers are optimistic (signal_client): under the shared lock they read the revision
+and open the outbox, then parse, modify, serialise and fsync a temp file with no lock held; the
+exclusive section only checks the revision is unchanged and os.replace()s the temp file in
+(otherwise the work is redone on the new outbox). Readers (outbox_depth, lane_stats,
+pending_entries) use the same shared snapshot and parse after releasing it.
+
+The lock lives on a sidecar file because the outbox itself is replaced atomically
+(os.replace -> new inode). One descriptor per thread per path is kept open, so taking the
+lock is a single flock() syscall; flock locks belong to the open file description, so
+separate descriptors also exclude threads of the same process from each other (and a forked
+child opens its own).
+Re-entrant per thread: a nested acquire on the same path only bumps a depth counter, the
+flock is released when the outermost block exits. A nested exclusive acquire inside a shared
+block raises RuntimeError (flock would convert the lock non-atomically).
+
+Acquire: non-blocking attempt first, then a short backoff poll until OUTBOX_LOCK_TIMEOUT_SECONDS
+(OutboxLockTimeout). Wait / hold times are tracked per path (lock_stats()); holds longer than
+OUTBOX_LOCK_SLOW_MS are logged.
+"""
+import os
+import time
+import fcntl
+import errno
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from execution.metrics import counter, histogram
+
+logger = logging.getLogger("gbm")
+
+LOCK_WAIT_SECONDS = histogram("gbm_outbox_lock_wait_seconds", "time to acquire the outbox lock")
+LOCK_HOLD_SECONDS = histogram("gbm_outbox_lock_hold_seconds", "outbox lock hold time")
+LOCK_TIMEOUTS = counter("gbm_outbox_lock_timeouts_total", "outbox lock acquisitions that timed out")
+
+DEFAULT_TIMEOUT_S = float(os.getenv("OUTBOX_LOCK_TIMEOUT_SECONDS", "5"))
+SLOW_MS = float(os.getenv("OUTBOX_LOCK_SLOW_MS", "100"))
+
+
+class OutboxLockTimeout(TimeoutError):
+    pass
+
+
+class _Stats:
+    __slots__ = ("acquired", "contended", "timeouts", "wait_s", "wait_max_s", "hold_s", "hold_max_s")
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_s = 0.0
+        self.wait_max_s = 0.0
+        self.hold_s = 0.0
+        self.hold_max_s = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        n = max(1, self.acquired)
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "timeouts": self.timeouts,
+            "wait_avg_us": self.wait_s / n * 1e6,
+            "wait_max_us": self.wait_max_s * 1e6,
+            "hold_avg_us": self.hold_s / n * 1e6,
+            "hold_max_us": self.hold_max_s * 1e6,
+        }
+
+
+_local = threading.local()
+_stats: Dict[str, _Stats] = {}
+_stats_lock = threading.Lock()
+
+
+def _fd(lock_path: str) -> int:
+    fds = getattr(_local, "fds", None)
+    if fds is None or _local.pid != os.getpid():
+        # a forked child must not reuse the parent's descriptors: flock locks belong to the open
+        # file description, which a fork shares, so parent and child would never exclude each other
+        _local.pid = os.getpid()
+        fds = _local.fds = {}
+        _local.depth = {}
+        _local.shared = {}
+    fd = fds.get(lock_path)
+    if fd is None:
+        os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+        fd = fds[lock_path] = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    return fd
+
+
+def _stats_for(lock_path: str) -> _Stats:
+    st = _stats.get(lock_path)
+    if st is None:
+        with _stats_lock:
+            st = _stats.setdefault(lock_path, _Stats())
+    return st
+
+
+@contextmanager
+def outbox_lock(outbox_path: str, shared: bool = False, timeout: Optional[float] = None) -> Iterator[None]:
+    lock_path = str(outbox_path) + ".lock"
+    timeout = DEFAULT_TIMEOUT_S if timeout is None else float(timeout)
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    fd = _fd(lock_path)
+    depth = _local.depth
+    if depth.get(lock_path):
+        # already held by this thread: a second flock() on the same fd would be a no-op and the
+        # inner unlock would release the outer block's lock
+        if _local.shared.get(lock_path) and not shared:
+            raise RuntimeError(f"exclusive outbox lock requested inside a shared block: {lock_path}")
+        depth[lock_path] += 1
+        try:
+            yield
+        finally:
+            depth[lock_path] -= 1
+        return
+    st = _stats_for(lock_path)
+
+    t0 = time.perf_counter()
+    try:
+        fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        contended = False
+    except OSError as e:
+        if e.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
+            raise
+        contended = True
+        delay = 0.0001
+        while True:
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                break
+            except OSError as e2:
+                if e2.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+            if time.perf_counter() - t0 >= timeout:
+                st.timeouts += 1
+                LOCK_TIMEOUTS.inc()
+                logger.warning("OUTBOX_LOCK_TIMEOUT | path=%s shared=%s timeout_s=%s", lock_path, shared, timeout)
+                raise OutboxLockTimeout(f"outbox lock not acquired within {timeout}s: {lock_path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.001)
+
+    t1 = time.perf_counter()
+    depth[lock_path] = 1
+    _local.shared[lock_path] = shared
+    try:
+        yield
+    finally:
+        depth[lock_path] = 0
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        t2 = time.perf_counter()
+        wait, hold = t1 - t0, t2 - t1
+        # counters are advisory: unsynchronised increments may drop a count under heavy threading
+        st.acquired += 1
+        st.contended += int(contended)
+        st.wait_s += wait
+        st.hold_s += hold
+        LOCK_WAIT_SECONDS.observe(wait)
+        LOCK_HOLD_SECONDS.observe(hold)
+        if wait > st.wait_max_s:
+            st.wait_max_s = wait
+        if hold > st.hold_max_s:
+            st.hold_max_s = hold
+        if hold * 1000 >= SLOW_MS:
+            logger.warning("OUTBOX_LOCK_SLOW | path=%s shared=%s hold_ms=%.1f wait_ms=%.1f", lock_path, shared, hold * 1000, wait * 1000)
+
+
+def outbox_revision(outbox_path: str) -> int:
+    """Revision of the outbox (0 before the first commit). Meaningful under the lock."""
+    raw = os.pread(_fd(str(outbox_path) + ".lock"), 8, 0)
+    return struct.unpack("<Q", raw)[0] if len(raw) == 8 else 0
+
+
+def bump_outbox_revision(outbox_path: str) -> int:
+    """Call under the exclusive lock, right after the rewritten outbox has been swapped in."""
+    rev = outbox_revision(outbox_path) + 1
+    os.pwrite(_fd(str(outbox_path) + ".lock"), struct.pack("<Q", rev), 0)
+    return rev
+
+
+def lock_stats() -> Dict[str, Dict[str, Any]]:
+    """Per lock file: acquisitions, contention, timeouts, wait / hold times (microseconds)."""
+    return {path: st.to_dict() for path, st in list(_stats.items())}
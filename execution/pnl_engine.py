@@ -0,0 +1,316 @@
+# execution/pnl_engine.py
+"""
+Incremental PnL / drawdown engine.
+
+Inputs (each O(1)):
+  - on_fill(...)  : entry fills (DEMO ledger / LIVE market buy) and exits (DEMO TP/SL, LIVE OCO close)
+  - mark(...)     : last price of a symbol with an open lot (unrealized PnL)
+
+Every fill is appended to pnl_events; the aggregates are snapshotted to risk_state
+periodically. rebuild() = last snapshot + replay of newer events only.
+
+risk_state mapping:
+  daily_profit / daily_loss -> gross realized profit / loss of the current UTC day
+  current_drawdown          -> (day peak equity - equity) / day peak equity
+  max_daily_loss            -> worst current_drawdown seen today (what guard enforces)
+  max_drawdown              -> worst drawdown from the all-time equity peak
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from execution import clock
+from execution.db.repository import (
+    insert_pnl_event,
+    list_pnl_events_after,
+    get_risk_state,
+    save_risk_state,
+)
+
+logger = logging.getLogger("gbm")
+
+
+def _utc_dt(ts: Any = None) -> datetime:
+    if ts is None:
+        return datetime.fromtimestamp(clock.now(), timezone.utc)
+    if isinstance(ts, datetime):
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+
+
+class PnLEngine:
+    def __init__(self, start_equity: float, snapshot_seconds: float = 30.0):
+        self.start_equity = float(start_equity)
+        self.snapshot_seconds = float(snapshot_seconds)
+
+        self.realized_total = 0.0
+        self.realized_today = 0.0
+        self.daily_profit = 0.0
+        self.daily_loss = 0.0
+
+        # symbol -> [qty, cost]  (cost = average cost incl. entry fees)
+        self.lots: Dict[str, List[float]] = {}
+        self._marks: Dict[str, float] = {}
+        self._unrealized_by_symbol: Dict[str, float] = {}
+        self.unrealized = 0.0
+
+        self.day = ""
+        self.day_start_equity = self.start_equity
+        self.day_peak_equity = self.start_equity
+        self.peak_equity = self.start_equity
+
+        self.current_drawdown = 0.0
+        self.daily_drawdown = 0.0  # worst of today (sticky until the UTC day rolls)
+        self.max_drawdown = 0.0
+
+        self._last_event_id = 0
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+
+    # ----------------------------
+    # derived
+    # ----------------------------
+    @property
+    def equity(self) -> float:
+        return self.start_equity + self.realized_total + self.unrealized
+
+    def open_symbols(self) -> List[str]:
+        return list(self.lots.keys())
+
+    def _roll_day(self, dt: datetime) -> None:
+        day = dt.strftime("%Y-%m-%d")
+        if day == self.day:
+            return
+        eq = self.equity
+        self.day = day
+        self.realized_today = 0.0
+        self.daily_profit = 0.0
+        self.daily_loss = 0.0
+        self.day_start_equity = eq
+        self.day_peak_equity = eq
+        self.current_drawdown = 0.0
+        self.daily_drawdown = 0.0
+        self._dirty = True
+
+    def _update_equity(self) -> None:
+        eq = self.equity
+        if eq > self.day_peak_equity:
+            self.day_peak_equity = eq
+        if eq > self.peak_equity:
+            self.peak_equity = eq
+
+        dd = (self.day_peak_equity - eq) / self.day_peak_equity if self.day_peak_equity > 0 else 0.0
+        self.current_drawdown = max(0.0, dd)
+        if self.current_drawdown > self.daily_drawdown:
+            self.daily_drawdown = self.current_drawdown
+
+        total_dd = (self.peak_equity - eq) / self.peak_equity if self.peak_equity > 0 else 0.0
+        if total_dd > self.max_drawdown:
+            self.max_drawdown = total_dd
+
+    def _dd_state(self) -> Tuple[float, ...]:
+        return (self.daily_drawdown, self.current_drawdown, self.max_drawdown, self.day_peak_equity, self.peak_equity)
+
+    def _set_unrealized(self, symbol: str) -> None:
+        lot = self.lots.get(symbol)
+        px = self._marks.get(symbol)
+        new = (lot[0] * px - lot[1]) if (lot is not None and px is not None) else 0.0
+        old = self._unrealized_by_symbol.pop(symbol, 0.0)
+        if lot is not None and px is not None:
+            self._unrealized_by_symbol[symbol] = new
+        self.unrealized += new - old
+
+    # ----------------------------
+    # events
+    # ----------------------------
+    def _apply(self, symbol: str, side: str, qty: float, price: float, fee: float, dt: datetime) -> float:
+        self._roll_day(dt)
+        realized = 0.0
+        lot = self.lots.get(symbol)
+
+        if side == "BUY":
+            if lot is None:
+                lot = self.lots[symbol] = [0.0, 0.0]
+            lot[0] += qty
+            lot[1] += qty * price + fee
+        else:
+            if lot is not None and lot[0] > 0:
+                take = min(qty, lot[0])
+                cost = lot[1] * (take / lot[0])
+                lot[0] -= take
+                lot[1] -= cost
+                # part of the sell with no known lot is booked at cost = proceeds
+                realized = take * price - cost - fee
+                if lot[0] <= 1e-12:
+                    self.lots.pop(symbol, None)
+            else:
+                realized = -fee
+
+            self.realized_total += realized
+            self.realized_today += realized
+            if realized >= 0:
+                self.daily_profit += realized
+            else:
+                self.daily_loss += -realized
+
+        if symbol in self.lots:
+            self._marks[symbol] = price
+        else:
+            self._marks.pop(symbol, None)
+        self._set_unrealized(symbol)
+        self._update_equity()
+        self._dirty = True
+        return realized
+
+    def on_fill(
+        self,
+        symbol: str,
+        side: str,
+        qty: float,
+        price: float,
+        fee: float = 0.0,
+        source: str = "EXEC",
+        ref: Optional[str] = None,
+        ts: Any = None,
+    ) -> float:
+        """Applies a fill, appends it to pnl_events and returns the realized PnL of this fill."""
+        side = str(side).upper()
+        if side not in ("BUY", "SELL"):
+            raise ValueError(f"invalid side: {side}")
+        dt = _utc_dt(ts)
+        realized = self._apply(str(symbol), side, float(qty), float(price), float(fee or 0.0), dt)
+        self._last_event_id = insert_pnl_event(
+            source=source, ref=ref, symbol=symbol, side=side, qty=qty, price=price,
+            fee=float(fee or 0.0), realized=realized, created_at=dt.isoformat(),
+        )
+        return realized
+
+    def mark(self, symbol: str, price: float, ts: Any = None) -> None:
+        if symbol not in self.lots:
+            return
+        self._roll_day(_utc_dt(ts))
+        self._marks[symbol] = float(price)
+        self._set_unrealized(symbol)
+        before = self._dd_state()
+        self._update_equity()
+        # drawdown from marks alone must survive a restart (rebuild() replays fills only)
+        if self._dd_state() != before:
+            self._dirty = True
+
+    def tick(self, ts: Any = None) -> None:
+        """Day roll without a fill (called from the worker loop)."""
+        self._roll_day(_utc_dt(ts))
+
+    # ----------------------------
+    # persistence
+    # ----------------------------
+    def snapshot(self) -> None:
+        save_risk_state(
+            daily_loss=self.daily_loss,
+            daily_profit=self.daily_profit,
+            max_daily_loss=self.daily_drawdown,
+            current_drawdown=self.current_drawdown,
+            max_drawdown=self.max_drawdown,
+            day=self.day,
+            realized_pnl=self.realized_total,
+            realized_today=self.realized_today,
+            peak_equity=self.peak_equity,
+            day_start_equity=self.day_start_equity,
+            day_peak_equity=self.day_peak_equity,
+            start_equity=self.start_equity,
+            lots_json=json.dumps({"lots": self.lots, "marks": self._marks}, separators=(",", ":")),
+            last_event_id=self._last_event_id,
+        )
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+
+    def maybe_snapshot(self) -> bool:
+        if self._dirty and time.monotonic() - self._last_snapshot >= self.snapshot_seconds:
+            self.snapshot()
+            return True
+        return False
+
+    def rebuild(self) -> "PnLEngine":
+        row = get_risk_state()
+        if row and row[14] is not None:
+            (daily_loss, daily_profit, max_daily_loss, current_dd, max_dd, _updated_at,
+             day, realized, realized_today, peak, day_start, day_peak,
+             start_equity, lots_json, last_event_id) = row
+            self.daily_loss = float(daily_loss or 0.0)
+            self.daily_profit = float(daily_profit or 0.0)
+            self.daily_drawdown = float(max_daily_loss or 0.0)
+            self.current_drawdown = float(current_dd or 0.0)
+            self.max_drawdown = float(max_dd or 0.0)
+            self.day = str(day or "")
+            self.realized_total = float(realized or 0.0)
+            self.realized_today = float(realized_today or 0.0)
+            self.peak_equity = float(peak or self.start_equity)
+            self.day_start_equity = float(day_start or self.start_equity)
+            self.day_peak_equity = float(day_peak or self.start_equity)
+            if start_equity is not None:
+                self.start_equity = float(start_equity)
+            blob = json.loads(lots_json or "{}")
+            self.lots = {k: [float(v[0]), float(v[1])] for k, v in (blob.get("lots") or {}).items()}
+            self._marks = {k: float(v) for k, v in (blob.get("marks") or {}).items()}
+            self._last_event_id = int(last_event_id or 0)
+            self.unrealized = 0.0
+            self._unrealized_by_symbol = {}
+            for sym in self.lots:
+                self._set_unrealized(sym)
+
+        replayed = 0
+        for (event_id, _source, _ref, symbol, side, qty, price, fee, _realized, created_at) in list_pnl_events_after(self._last_event_id):
+            self._apply(str(symbol), str(side), float(qty), float(price), float(fee), _utc_dt(created_at))
+            self._last_event_id = int(event_id)
+            replayed += 1
+
+        self._roll_day(_utc_dt())
+        logger.info(
+            "PNL_REBUILD | replayed=%s equity=%.8f realized=%.8f daily_dd=%.6f open_lots=%s",
+            replayed, self.equity, self.realized_total, self.daily_drawdown, len(self.lots),
+        )
+        if replayed or self._dirty:
+            self.snapshot()
+        return self
+
+    def state(self) -> Dict[str, float]:
+        return {
+            "equity": self.equity,
+            "realized_pnl": self.realized_total,
+            "realized_today": self.realized_today,
+            "unrealized_pnl": self.unrealized,
+            "peak_equity": self.peak_equity,
+            "daily_drawdown": self.daily_drawdown,
+            "current_drawdown": self.current_drawdown,
+            "max_drawdown": self.max_drawdown,
+        }
+
+
+_engine: Optional[PnLEngine] = None
+
+
+def set_pnl_engine(engine: Optional[PnLEngine]) -> None:
+    """Install a pre-configured engine (backtests); None -> rebuilt from DB on next use."""
+    global _engine
+    _engine = engine
+
+
+def get_pnl_engine(start_equity: Optional[float] = None) -> PnLEngine:
+    """
+    Process-wide engine, rebuilt from risk_state + pnl_events on first use.
+    start_equity: PNL_START_EQUITY env > argument > VIRTUAL_START_BALANCE (only used before the first snapshot).
+    """
+    global _engine
+    if _engine is None:
+        env_eq = os.getenv("PNL_START_EQUITY", "").strip()
+        if env_eq:
+            start_equity = float(env_eq)
+        if start_equity is None:
+            from execution.config import VIRTUAL_START_BALANCE
+            start_equity = VIRTUAL_START_BALANCE
+        snapshot_s = float(os.getenv("PNL_SNAPSHOT_SECONDS", "30"))
+        _engine = PnLEngine(start_equity=float(start_equity), snapshot_seconds=snapshot_s).rebuild()
+    return _engine
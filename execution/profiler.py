@@ -0,0 +1,238 @@
+# execution/profiler.py
+"""
+On-demand sampling profiler for the live worker / generator daemon.
+
+Triggers (no redeploy):
+  kill -USR1 <pid>                                   start a window (again: stop it early)
+  UPDATE system_state SET profile_seconds=60         start a 60 s window in one process
+  UPDATE system_state SET profile_seconds=60,        ... in the generator daemon only
+         profile_target='generator'                  (role "worker" / "generator", or a pid)
+
+The DB request is polled every PROFILER_DB_POLL_SECONDS and claimed atomically (compare-and-set
+back to 0): with the worker and the generator daemon both polling, exactly one of them profiles.
+
+While a window is open a sampler thread reads the main thread's stack through
+sys._current_frames() PROFILER_HZ times per second (PROFILER_ALL_THREADS=true: every thread,
+thread name as the root frame). At the end it writes to PROFILER_DIR:
+
+  profile-<pid>-<utc>.collapsed   "frame;frame;frame count" lines (flamegraph.pl / speedscope)
+  profile-<pid>-<utc>.top.txt     top-N functions by self and inclusive samples
+
+Off = one thread blocked on an Event (woken every PROFILER_DB_POLL_SECONDS for the DB flag),
+nothing on the profiled thread. Windows are capped at PROFILER_MAX_WINDOW_SECONDS.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("gbm")
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        out_dir: str,
+        hz: float = 100.0,
+        window_s: float = 30.0,
+        max_window_s: float = 300.0,
+        top_n: int = 25,
+        db_poll_s: float = 10.0,
+        all_threads: bool = False,
+        role: str = "worker",
+    ):
+        self.out_dir = out_dir
+        self.role = role
+        self.interval_s = 1.0 / max(1.0, float(hz))
+        self.window_s = float(window_s)
+        self.max_window_s = float(max_window_s)
+        self.top_n = int(top_n)
+        self.db_poll_s = float(db_poll_s)
+        self.all_threads = all_threads
+        self.target_ident = threading.main_thread().ident
+        self._wake = threading.Event()
+        self._requested: Optional[float] = None  # window length asked for
+        self._running = False
+        self._cancel = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------------
+    # triggers
+    # ----------------------------
+    def request(self, seconds: Optional[float] = None) -> None:
+        """Starts a window (or stops the running one early). Safe from a signal handler."""
+        if self._running:
+            self._cancel = True
+        else:
+            self._requested = min(float(seconds or self.window_s), self.max_window_s)
+        self._wake.set()
+
+    def _on_signal(self, signum, frame) -> None:
+        self.request()
+
+    def install(self) -> "SamplingProfiler":
+        if self._thread is not None:
+            return self
+        if hasattr(signal, "SIGUSR1"):
+            try:
+                signal.signal(signal.SIGUSR1, self._on_signal)
+            except ValueError:
+                # not the main thread: DB trigger only
+                logger.warning("PROFILER_NO_SIGNAL | SIGUSR1 handler needs the main thread")
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        logger.info("PROFILER_READY | role=%s pid=%s dir=%s hz=%.0f", self.role, os.getpid(), self.out_dir, 1.0 / self.interval_s)
+        return self
+
+    def _poll_db(self) -> None:
+        try:
+            from execution.db.repository import claim_profile_request
+            seconds = claim_profile_request(self.role, os.getpid())
+            if seconds > 0:
+                self.request(seconds)
+        except Exception as e:
+            logger.debug("PROFILER_DB_POLL_FAIL | err=%s", e)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.db_poll_s if self.db_poll_s > 0 else None)
+            self._wake.clear()
+            if self._requested is None and self.db_poll_s > 0:
+                self._poll_db()
+            seconds, self._requested = self._requested, None
+            if seconds is None:
+                continue
+            try:
+                self._profile(seconds)
+            except Exception as e:
+                logger.warning("PROFILER_FAIL | err=%s", e)
+
+    # ----------------------------
+    # sampling
+    # ----------------------------
+    def _profile(self, seconds: float) -> None:
+        self._running, self._cancel = True, False
+        logger.warning("PROFILER_START | seconds=%.0f hz=%.0f", seconds, 1.0 / self.interval_s)
+        counts: Dict[Tuple, int] = {}
+        names: Dict[int, str] = {}
+        own = threading.get_ident()
+        samples = 0
+        # the sampler only runs when the profiled thread drops the GIL: switch more often than we
+        # sample so short calls aren't hidden behind the next blocking call (restored afterwards)
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch, self.interval_s / 4))
+        t0 = time.monotonic()
+        deadline = t0 + seconds
+        nxt = t0
+        try:
+            while not self._cancel:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                frames = sys._current_frames()
+                if self.all_threads:
+                    items = [(i, f) for i, f in frames.items() if i != own]
+                else:
+                    f = frames.get(self.target_ident)
+                    items = [(self.target_ident, f)] if f is not None else []
+                for ident, f in items:
+                    stack = []
+                    while f is not None:
+                        stack.append(f.f_code)
+                        f = f.f_back
+                    if self.all_threads:
+                        stack.append(ident)
+                    key = tuple(stack)
+                    counts[key] = counts.get(key, 0) + 1
+                samples += 1
+                del frames, items
+                nxt += self.interval_s
+                delay = nxt - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    nxt = time.monotonic()
+            if self.all_threads:
+                names = {t.ident: t.name for t in threading.enumerate()}
+        finally:
+            sys.setswitchinterval(switch)
+            self._running = False
+        self._write(counts, names, samples, time.monotonic() - t0)
+
+    def _collapse(self, counts: Dict[Tuple, int], names: Dict[int, str]) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for stack, n in counts.items():
+            parts = []
+            for item in reversed(stack):  # root first
+                parts.append(f"thread:{names.get(item, item)}" if isinstance(item, int) else _frame_name(item))
+            line = ";".join(parts)
+            out[line] = out.get(line, 0) + n
+        return out
+
+    def _top(self, collapsed: Dict[str, int], total: int) -> List[str]:
+        self_n: Dict[str, int] = {}
+        incl_n: Dict[str, int] = {}
+        for line, n in collapsed.items():
+            frames = line.split(";")
+            self_n[frames[-1]] = self_n.get(frames[-1], 0) + n
+            for fr in set(frames):
+                incl_n[fr] = incl_n.get(fr, 0) + n
+        total = max(1, total)
+        lines = [f"samples={total}", "", "SELF"]
+        for fr, n in sorted(self_n.items(), key=lambda kv: -kv[1])[: self.top_n]:
+            lines.append(f"{100.0 * n / total:6.1f}% {n:7d}  {fr}")
+        lines += ["", "INCLUSIVE"]
+        for fr, n in sorted(incl_n.items(), key=lambda kv: -kv[1])[: self.top_n]:
+            lines.append(f"{100.0 * n / total:6.1f}% {n:7d}  {fr}")
+        return lines
+
+    def _write(self, counts: Dict[Tuple, int], names: Dict[int, str], samples: int, elapsed: float) -> None:
+        collapsed = self._collapse(counts, names)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        base = os.path.join(self.out_dir, f"profile-{os.getpid()}-{stamp}")
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for line, n in sorted(collapsed.items()):
+                f.write(f"{line} {n}\n")
+        with open(base + ".top.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(self._top(collapsed, sum(collapsed.values()))) + "\n")
+        logger.warning("PROFILER_DONE | samples=%s seconds=%.1f out=%s.collapsed", samples, elapsed, base)
+        try:
+            from execution.db.repository import log_event
+            log_event("PROFILER_DONE", f"samples={samples} seconds={elapsed:.1f} out={base}")
+        except Exception:
+            pass
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler(role: str = "worker") -> SamplingProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(
+            out_dir=os.getenv("PROFILER_DIR", "/var/data/profiles"),
+            hz=float(os.getenv("PROFILER_HZ", "100")),
+            window_s=float(os.getenv("PROFILER_WINDOW_SECONDS", "30")),
+            max_window_s=float(os.getenv("PROFILER_MAX_WINDOW_SECONDS", "300")),
+            top_n=int(os.getenv("PROFILER_TOP_N", "25")),
+            db_poll_s=float(os.getenv("PROFILER_DB_POLL_SECONDS", "10")),
+            all_threads=os.getenv("PROFILER_ALL_THREADS", "false").strip().lower() in ("1", "true", "yes", "y"),
+            role=role,
+        )
+    return _profiler
+
+
+def install_profiler(role: str = "worker") -> Optional[SamplingProfiler]:
+    """role: which profile_target requests this process answers. PROFILER_ENABLED=false: no handler, no thread."""
+    if os.getenv("PROFILER_ENABLED", "true").strip().lower() not in ("1", "true", "yes", "y"):
+        return None
+    return get_profiler(role).install()
@@ -0,0 +1,60 @@
+# execution/rate_limiter.py
+"""
+Thread-safe token bucket shared by concurrent REST callers.
+
+Binance spot: 6000 request weight / minute per IP. Defaults leave headroom for the
+execution engine (orders, OCO, tickers) on the same IP.
+"""
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: float):
+        if rate_per_s <= 0 or burst <= 0:
+            raise ValueError("rate_per_s and burst must be > 0")
+        self.rate = float(rate_per_s)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def acquire(self, weight: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Blocks until `weight` tokens are available. False on timeout."""
+        weight = min(float(weight), self.burst)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return True
+                wait = (weight - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            self.waited_s += wait
+            time.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(name: str = "binance_rest") -> TokenBucket:
+    """Process-wide bucket (RATE_LIMIT_RPS / RATE_LIMIT_BURST, request weight per second)."""
+    with _buckets_lock:
+        b = _buckets.get(name)
+        if b is None:
+            b = _buckets[name] = TokenBucket(
+                rate_per_s=float(os.getenv("RATE_LIMIT_RPS", "50")),
+                burst=float(os.getenv("RATE_LIMIT_BURST", "300")),
+            )
+        return b
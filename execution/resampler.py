@@ -0,0 +1,207 @@
+# execution/resampler.py
+"""
+Higher timeframes derived from one 1m stream per symbol.
+
+Alignment matches Binance klines: open time = floor(ts / tf) * tf from the Unix epoch
+(m / h / d), weeks start Monday 00:00 UTC. Candles:
+  open = first 1m open, high = max, low = min, close = last 1m close, volume = sum
+
+  resample(arr_1m, "1h")       NumPy (reduceat) over a whole array: backfill / backtests
+  SymbolResampler.update(row)  O(1) per 1m row; the forming 1m candle may be revised in place
+  Resampler.feed(symbol, rows) rows at/after the last seen 1m timestamp only (like IndicatorBank)
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from execution.candle_store import timeframe_ms, TS, OPEN, HIGH, LOW, CLOSE, VOLUME
+
+BASE_TF = "1m"
+BASE_MS = 60_000
+# 1970-01-01 was a Thursday; Binance weekly candles open on Monday
+_WEEK_OFFSET_MS = 4 * 86_400_000
+
+
+def bucket_offset(tf: str) -> int:
+    return _WEEK_OFFSET_MS if str(tf).strip().endswith("w") else 0
+
+
+def bucket_start(ts: np.ndarray, tf: str) -> np.ndarray:
+    step = timeframe_ms(tf)
+    off = bucket_offset(tf)
+    t = np.asarray(ts, dtype=np.int64)
+    return ((t - off) // step) * step + off
+
+
+def resample(arr: np.ndarray, tf: str) -> np.ndarray:
+    """(n, 6) 1m OHLCV (ascending) -> (k, 6) candles of tf; the last one may be incomplete."""
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.shape[0] == 0:
+        return np.empty((0, 6), dtype=np.float64)
+    b = bucket_start(arr[:, TS], tf)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(b)) + 1))
+    ends = np.concatenate((starts[1:], [arr.shape[0]])) - 1
+    out = np.empty((starts.shape[0], 6), dtype=np.float64)
+    out[:, TS] = b[starts]
+    out[:, OPEN] = arr[starts, OPEN]
+    out[:, HIGH] = np.maximum.reduceat(arr[:, HIGH], starts)
+    out[:, LOW] = np.minimum.reduceat(arr[:, LOW], starts)
+    out[:, CLOSE] = arr[ends, CLOSE]
+    out[:, VOLUME] = np.add.reduceat(arr[:, VOLUME], starts)
+    return out
+
+
+class _Series:
+    """Closed candles of one timeframe (bounded) + aggregate of the closed 1m rows of the forming one."""
+
+    __slots__ = ("tf", "step", "off", "closed", "maxlen", "acc")
+
+    def __init__(self, tf: str, maxlen: int):
+        self.tf = tf
+        self.step = timeframe_ms(tf)
+        self.off = bucket_offset(tf)
+        self.closed: List[List[float]] = []
+        self.maxlen = int(maxlen)
+        self.acc: Optional[List[float]] = None  # [ts, o, h, l, c, v] of closed 1m rows in the forming bucket
+
+    def bucket(self, ts: float) -> float:
+        return float((int(ts) - self.off) // self.step * self.step + self.off)
+
+    def fold(self, row: Sequence[float]) -> None:
+        """A 1m candle has closed: add it to the forming bucket (closing the previous bucket if needed)."""
+        b = self.bucket(row[TS])
+        acc = self.acc
+        if acc is not None and acc[TS] != b:
+            self.closed.append(acc)
+            if len(self.closed) > self.maxlen * 2:
+                del self.closed[: len(self.closed) - self.maxlen]
+            acc = None
+        if acc is None:
+            self.acc = [b, row[OPEN], row[HIGH], row[LOW], row[CLOSE], row[VOLUME]]
+            return
+        if row[HIGH] > acc[HIGH]:
+            acc[HIGH] = row[HIGH]
+        if row[LOW] < acc[LOW]:
+            acc[LOW] = row[LOW]
+        acc[CLOSE] = row[CLOSE]
+        acc[VOLUME] += row[VOLUME]
+
+    def forming(self, cur: Optional[List[float]]) -> Optional[List[float]]:
+        """acc with the still-open 1m candle applied on top (not stored)."""
+        if cur is None:
+            return list(self.acc) if self.acc is not None else None
+        b = self.bucket(cur[TS])
+        acc = self.acc
+        if acc is None or acc[TS] != b:
+            return [b, cur[OPEN], cur[HIGH], cur[LOW], cur[CLOSE], cur[VOLUME]]
+        return [b, acc[OPEN], max(acc[HIGH], cur[HIGH]), min(acc[LOW], cur[LOW]), cur[CLOSE], acc[VOLUME] + cur[VOLUME]]
+
+    def candles(self, cur: Optional[List[float]], n: int) -> np.ndarray:
+        rows = list(self.closed[-n:]) if n > 0 else list(self.closed)
+        f = self.forming(cur)
+        # the open 1m candle may already belong to the next bucket: acc is then complete
+        if self.acc is not None and (f is None or f[TS] != self.acc[TS]):
+            rows.append(self.acc)
+        if f is not None:
+            rows.append(f)
+        if n > 0:
+            rows = rows[-n:]
+        return np.array(rows, dtype=np.float64).reshape(-1, 6)
+
+
+class SymbolResampler:
+    def __init__(self, tfs: Iterable[str], maxlen: int = 1000):
+        self.series: Dict[str, _Series] = {tf: _Series(tf, maxlen) for tf in tfs if tf != BASE_TF}
+        self.cur: Optional[List[float]] = None  # last (possibly forming) 1m candle
+        self.maxlen = int(maxlen)
+
+    def add_timeframe(self, tf: str, base_rows: Optional[np.ndarray] = None) -> None:
+        if tf == BASE_TF or tf in self.series:
+            return
+        s = self.series[tf] = _Series(tf, self.maxlen)
+        if base_rows is not None and base_rows.shape[0]:
+            self._backfill_series(s, base_rows)
+
+    def _backfill_series(self, s: _Series, closed_1m: np.ndarray) -> None:
+        agg = resample(closed_1m, s.tf)
+        if agg.shape[0] == 0:
+            return
+        s.closed = agg[:-1][-s.maxlen:].tolist()
+        s.acc = agg[-1].tolist()
+
+    def backfill(self, rows: np.ndarray) -> None:
+        """NumPy initialisation from 1m history; the last row is treated as the forming candle."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.shape[0] == 0:
+            return
+        for s in self.series.values():
+            self._backfill_series(s, rows[:-1])
+        self.cur = rows[-1].tolist()
+
+    def update(self, row: Sequence[float]) -> bool:
+        """One 1m candle (new or revision of the forming one). True if a new 1m candle started."""
+        row = [float(x) for x in row[:6]]
+        cur = self.cur
+        if cur is None or row[TS] > cur[TS]:
+            if cur is not None:
+                for s in self.series.values():
+                    s.fold(cur)
+            self.cur = row
+            return True
+        if row[TS] == cur[TS]:
+            self.cur = row
+        return False
+
+    def candles(self, tf: str, n: int) -> np.ndarray:
+        if tf == BASE_TF:
+            raise ValueError("1m comes from the candle store directly")
+        return self.series[tf].candles(self.cur, n)
+
+
+class Resampler:
+    """Per-symbol SymbolResampler registry; thread-safe across symbols (one worker per symbol)."""
+
+    def __init__(self, maxlen: int = 1000):
+        self.maxlen = int(maxlen)
+        self._syms: Dict[str, SymbolResampler] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str) -> Optional[SymbolResampler]:
+        return self._syms.get(symbol)
+
+    def feed(self, symbol: str, rows: np.ndarray, tfs: Iterable[str]) -> SymbolResampler:
+        """
+        Applies 1m rows; a symbol seen for the first time (or a new timeframe) is initialised
+        vectorised from the rows given, later calls only apply rows from the last seen ts on.
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        tfs = [tf for tf in tfs if tf != BASE_TF]
+        with self._lock:
+            sr = self._syms.get(symbol)
+            if sr is None:
+                sr = self._syms[symbol] = SymbolResampler(tfs, self.maxlen)
+                sr.backfill(rows)
+                return sr
+        for tf in tfs:
+            if tf not in sr.series:
+                closed = rows[rows[:, TS] < sr.cur[TS]] if (sr.cur is not None and rows.shape[0]) else None
+                sr.add_timeframe(tf, closed)
+        if rows.shape[0] == 0:
+            return sr
+        start = 0
+        if sr.cur is not None:
+            start = int(np.searchsorted(rows[:, TS], sr.cur[TS], side="left"))
+        for r in rows[start:].tolist():
+            sr.update(r)
+        return sr
+
+
+_resampler: Optional[Resampler] = None
+
+
+def get_resampler() -> Resampler:
+    global _resampler
+    if _resampler is None:
+        _resampler = Resampler()
+    return _resampler
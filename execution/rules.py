@@ -0,0 +1,259 @@
+# execution/rules.py
+"""
+RULES sheet of brain.xlsx -> vectorised evaluators.
+
+Sheet layout (header row 1):
+  NAME | TYPE | EXPRESSION | WEIGHT | ENABLED
+
+  TYPE = FILTER      boolean; every enabled FILTER must hold
+         CONFIDENCE  confidence = sum(WEIGHT * value); booleans count as 0 / 1
+         SCORE       ranking score = sum(WEIGHT * value)
+
+A symbol qualifies when all FILTERs hold and confidence >= MIN_CONF; qualifying symbols
+are ranked by score.
+
+Expressions (Python syntax, parsed with ast and checked against a whitelist):
+  prices      last, open, high, low, close, volume   (last = close of the forming candle)
+  indicators  sma(n), ema(n), rsi(n), atr(n), std(n)  (n = integer literal)
+              ma = sma(MA_PERIOD), sd = std(MA_PERIOD)
+  functions   abs, min, max, sqrt, log, clip(x, lo, hi), div(a, b) (0 where b == 0)
+  operators   + - * / % **, comparisons (chains allowed), and / or / not
+
+Each expression compiles once into a tree of NumPy closures evaluated over arrays of
+all symbols at once; a missing indicator value (not warmed up) is NaN and fails every
+comparison.
+"""
+import ast
+import operator
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+RULE_TYPES = ("FILTER", "CONFIDENCE", "SCORE")
+INDICATORS = ("sma", "ema", "rsi", "atr", "std")
+PRICES = ("last", "open", "high", "low", "close", "volume")
+
+# the hard-coded rule this sheet replaces: BUY if last > MA, confidence 0.75 / 0.50
+DEFAULT_RULES: Tuple[Tuple[str, str, str, float, bool], ...] = (
+    ("above_ma", "FILTER", "last > ma", 1.0, True),
+    ("base", "CONFIDENCE", "1", 0.50, True),
+    ("above_ma_conf", "CONFIDENCE", "last > ma", 0.25, True),
+    ("distance", "SCORE", "div(last - ma, sd)", 1.0, True),
+)
+
+Evaluator = Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+
+class RuleError(ValueError):
+    pass
+
+
+def _div(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    out = np.zeros(a.shape, dtype=np.float64)
+    np.divide(a, b, out=out, where=(b != 0) & ~np.isnan(b))
+    return np.where(np.isnan(a) | np.isnan(b), np.nan, out)
+
+
+_FUNCS: Dict[str, Tuple[Callable[..., Any], int, int]] = {
+    # name: (fn, min args, max args)
+    "abs": (np.abs, 1, 1),
+    "min": (lambda *a: np.minimum.reduce(np.broadcast_arrays(*a)), 2, 8),
+    "max": (lambda *a: np.maximum.reduce(np.broadcast_arrays(*a)), 2, 8),
+    "sqrt": (np.sqrt, 1, 1),
+    "log": (np.log, 1, 1),
+    "clip": (np.clip, 3, 3),
+    "div": (_div, 2, 2),
+}
+
+_BINOPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+}
+_CMPOPS = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less,
+    ast.LtE: np.less_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+
+
+def indicator_key(kind: str, n: int) -> str:
+    return f"{kind}_{int(n)}"
+
+
+class _Compiler:
+    def __init__(self, ma_period: int):
+        self.ma_period = int(ma_period)
+        self.needs: Dict[str, Tuple[str, int]] = {}
+        self.prices: Set[str] = set()
+
+    def _need(self, kind: str, n: int) -> str:
+        if n < 1:
+            raise RuleError(f"{kind}({n}): period must be >= 1")
+        key = indicator_key(kind, n)
+        self.needs[key] = (kind, int(n))
+        return key
+
+    def compile(self, expr: str) -> Evaluator:
+        try:
+            tree = ast.parse(str(expr).strip(), mode="eval")
+        except SyntaxError as e:
+            raise RuleError(f"syntax error: {e.msg}")
+        return self._node(tree.body)
+
+    def _node(self, node: ast.AST) -> Evaluator:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+            # np.float64, not float: constant-only arithmetic (10.0 ** 400, 9 ** 9 ** 9) overflows to
+            # inf under evaluate()'s errstate instead of raising OverflowError / hanging on big ints
+            try:
+                v = np.float64(float(node.value))
+            except OverflowError:
+                raise RuleError(f"numeric literal out of range: {str(node.value)[:20]}...")
+            return lambda env: v
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in PRICES:
+                self.prices.add(name)
+                return lambda env: env[name]
+            if name == "ma":
+                key = self._need("sma", self.ma_period)
+                return lambda env: env[key]
+            if name == "sd":
+                key = self._need("std", self.ma_period)
+                return lambda env: env[key]
+            raise RuleError(f"unknown name: {name}")
+
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise RuleError("only plain function calls are allowed")
+            fname = node.func.id
+            if fname in INDICATORS:
+                if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, int):
+                    raise RuleError(f"{fname}() takes one integer period")
+                key = self._need(fname, node.args[0].value)
+                return lambda env: env[key]
+            if fname not in _FUNCS:
+                raise RuleError(f"unknown function: {fname}")
+            fn, lo, hi = _FUNCS[fname]
+            if not lo <= len(node.args) <= hi:
+                raise RuleError(f"{fname}() takes {lo}..{hi} arguments")
+            args = [self._node(a) for a in node.args]
+            return lambda env: fn(*[a(env) for a in args])
+
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in _BINOPS:
+                raise RuleError(f"operator not allowed: {type(node.op).__name__}")
+            op = _BINOPS[type(node.op)]
+            left, right = self._node(node.left), self._node(node.right)
+            if op is operator.truediv:
+                return lambda env: _div(left(env), right(env))
+            return lambda env: op(left(env), right(env))
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._node(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda env: -operand(env)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if isinstance(node.op, ast.Not):
+                return lambda env: np.logical_not(_truth(operand(env)))
+
+        if isinstance(node, ast.BoolOp):
+            parts = [self._node(v) for v in node.values]
+            red = np.logical_and.reduce if isinstance(node.op, ast.And) else np.logical_or.reduce
+            return lambda env: red([_truth(p(env)) for p in parts])
+
+        if isinstance(node, ast.Compare):
+            for op in node.ops:
+                if type(op) not in _CMPOPS:
+                    raise RuleError(f"comparison not allowed: {type(op).__name__}")
+            terms = [self._node(node.left)] + [self._node(c) for c in node.comparators]
+            ops = [_CMPOPS[type(op)] for op in node.ops]
+
+            def _cmp(env, terms=terms, ops=ops):
+                vals = [t(env) for t in terms]
+                with np.errstate(invalid="ignore"):
+                    res = [op(vals[i], vals[i + 1]) for i, op in enumerate(ops)]
+                return np.logical_and.reduce(res) if len(res) > 1 else res[0]
+
+            return _cmp
+
+        raise RuleError(f"not allowed: {type(node).__name__}")
+
+
+def _truth(x) -> np.ndarray:
+    a = np.asarray(x)
+    if a.dtype == bool:
+        return a
+    return np.nan_to_num(a.astype(np.float64), nan=0.0) != 0
+
+
+class RuleSet:
+    def __init__(self, rules: Sequence[Tuple[str, str, Evaluator, float]], needs: Dict[str, Tuple[str, int]],
+                 prices: Set[str], ma_period: int):
+        self.rules = list(rules)
+        self.needs = dict(needs)
+        self.prices = frozenset(prices)
+        self.ma_period = int(ma_period)
+        self.ma_key = indicator_key("sma", ma_period)
+        self.sd_key = indicator_key("std", ma_period)
+        # ma / sd always available for signal meta
+        self.needs.setdefault(self.ma_key, ("sma", int(ma_period)))
+        self.needs.setdefault(self.sd_key, ("std", int(ma_period)))
+
+    def indicator_spec(self) -> Dict[str, Tuple[str, int]]:
+        return dict(self.needs)
+
+    def needs_candle(self) -> bool:
+        """True if a rule reads open / high / low / volume or ATR (a ticker price alone can't decide it)."""
+        return bool(self.prices - {"last", "close"}) or any(k == "atr" for k, _n in self.needs.values())
+
+    def evaluate(self, env: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """env: name -> array over symbols. Returns (filters_ok, confidence, score) arrays."""
+        n = len(env["last"])
+        ok = np.ones(n, dtype=bool)
+        conf = np.zeros(n, dtype=np.float64)
+        score = np.zeros(n, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            for _name, rtype, fn, weight in self.rules:
+                v = np.broadcast_to(fn(env), (n,))
+                if rtype == "FILTER":
+                    ok &= _truth(v)
+                else:
+                    val = np.nan_to_num(np.asarray(v, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+                    if rtype == "CONFIDENCE":
+                        conf += weight * val
+                    else:
+                        score += weight * val
+        return ok, conf, score
+
+
+def validate_rows(rows: Sequence[Sequence[Any]], ma_period: int) -> List[str]:
+    """Human-readable problems for every invalid row (empty list = valid)."""
+    errors: List[str] = []
+    for i, row in enumerate(rows):
+        name, rtype, expr, weight, _enabled = row
+        c = _Compiler(ma_period)
+        try:
+            if rtype not in RULE_TYPES:
+                raise RuleError(f"TYPE must be one of {', '.join(RULE_TYPES)}")
+            if not str(expr).strip():
+                raise RuleError("empty EXPRESSION")
+            float(weight)
+            c.compile(expr)
+        except (RuleError, ValueError, TypeError) as e:
+            errors.append(f"row {i + 2} {name}: {e}")
+    return errors
+
+
+@lru_cache(maxsize=16)
+def compile_rules(rows: Tuple[Tuple[str, str, str, float, bool], ...], ma_period: int) -> RuleSet:
+    """rows as stored in GeneratorConfig.rules (empty -> DEFAULT_RULES). Raises RuleError."""
+    rows = rows or DEFAULT_RULES
+    errors = validate_rows(rows, ma_period)
+    if errors:
+        raise RuleError("RULES invalid: " + "; ".join(errors))
+    c = _Compiler(ma_period)
+    compiled = [(name, rtype, c.compile(expr), float(weight)) for (name, rtype, expr, weight, enabled) in rows if enabled]
+    return RuleSet(compiled, c.needs, c.prices, ma_period)
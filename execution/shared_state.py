@@ -1,13 +1,23 @@
 # execution/shared_state.py
+import os
 import json
+import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+from execution.state_channel import get_state_writer
+
+logger = logging.getLogger("gbm")
 
 PRIMARY_PATH = Path("shared/genius_state.json")
 FALLBACK_PATH = Path("shared/genius-state.json")  # your current name (kept for compatibility)
 
+# JSON copy of the state channel for humans / older guards, rewritten only when a value changes
+JSON_MIRROR = os.getenv("GENIUS_STATE_JSON_MIRROR", "true").strip().lower() in ("1", "true", "yes", "y")
+
+_mirrored: Optional[Dict[str, Any]] = None
+
 
 def _pick_path() -> Path:
     # Prefer underscore version; if only hyphen exists, write there too
@@ -18,17 +28,37 @@ def _pick_path() -> Path:
 
 def write_genius_state(state: Dict[str, Any]) -> None:
     """
-    Writes shared genius state atomically (safe on crashes/restarts).
-    Guard reads this file.
+    Publishes the worker state for guard: memory-mapped state channel (every call doubles
+    as the heartbeat) + JSON mirror written atomically only when the values change.
     """
+    global _mirrored
+    try:
+        get_state_writer().write(
+            mode=state.get("mode"),
+            worker_status=state.get("worker_status"),
+            open_positions=state.get("open_positions"),
+            daily_drawdown=state.get("daily_drawdown"),
+            last_signal_id=state.get("last_signal_id"),
+        )
+    except Exception as e:
+        logger.warning("STATE_CHANNEL_WRITE_WARN | err=%s", e)
+
+    if not JSON_MIRROR:
+        return
+    # last_signal_id is sticky: a loop without a signal doesn't count as a change
+    merged = {**(_mirrored or {}), **{k: v for k, v in state.items() if v is not None}}
+    if merged == _mirrored:
+        return
+
     path = _pick_path()
     path.parent.mkdir(parents=True, exist_ok=True)
 
     payload = {
-        **state,
+        **merged,
         "updated_at_utc": datetime.utcnow().isoformat() + "Z",
     }
 
     tmp = path.with_suffix(".tmp")
     tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
     tmp.replace(path)
+    _mirrored = merged
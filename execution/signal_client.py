@@ -1,124 +1,448 @@
-# execution/signal_client.py
-import json
-import os
-import hashlib
-import logging
-from typing import Any, Dict, List, Optional
-from tempfile import NamedTemporaryFile
-
-logger = logging.getLogger("gbm")
-
-
-def _safe_float(x: Any) -> Optional[float]:
-    try:
-        if x is None:
-            return None
-        return float(x)
-    except Exception:
-        return None
-
-
-def _fingerprint(signal: Dict[str, Any]) -> str:
-    """
-    Stable fingerprint for idempotency.
-    IMPORTANT: do NOT use uuid/signal_id inside hash.
-    """
-    verdict = str(signal.get("final_verdict") or "").upper().strip()
-
-    execution = signal.get("execution") or {}
-    symbol = str(execution.get("symbol") or "").upper().strip()
-    direction = str(execution.get("direction") or "").upper().strip()
-    entry_type = str((execution.get("entry") or {}).get("type") or "").upper().strip()
-    pos_size = _safe_float(execution.get("position_size"))
-
-    base = f"v1:{verdict}:{symbol}:{direction}:{entry_type}:{pos_size}"
-    return hashlib.sha256(base.encode("utf-8")).hexdigest()
-
-
-def validate_signal(signal: Dict[str, Any]) -> None:
-    if not isinstance(signal, dict):
-        raise ValueError("SIGNAL_NOT_DICT")
-
-    verdict = str(signal.get("final_verdict") or "").upper().strip()
-    if verdict not in ("TRADE", "HOLD"):
-        raise ValueError("INVALID_VERDICT")
-
-    if signal.get("certified_signal") is not True:
-        raise ValueError("NOT_CERTIFIED")
-
-    execution = signal.get("execution") or {}
-    symbol = execution.get("symbol")
-    direction = str(execution.get("direction") or "").upper().strip()
-    entry = execution.get("entry") or {}
-    entry_type = str(entry.get("type") or "").upper().strip()
-
-    if not symbol:
-        raise ValueError("MISSING_EXEC_SYMBOL")
-    if direction != "LONG":
-        raise ValueError("INVALID_DIRECTION")
-    if entry_type != "MARKET":
-        raise ValueError("INVALID_ENTRY_TYPE")
-
-    ps = _safe_float(execution.get("position_size"))
-    if ps is None or ps <= 0:
-        raise ValueError("INVALID_POSITION_SIZE")
-
-
-def _read_outbox(path: str) -> Dict[str, Any]:
-    if not os.path.exists(path):
-        return {"signals": []}
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, dict):
-        return {"signals": []}
-    if "signals" not in data or not isinstance(data["signals"], list):
-        data["signals"] = []
-    return data
-
-
-def _atomic_write_json(path: str, data: Dict[str, Any]) -> None:
-    d = os.path.dirname(path) or "."
-    os.makedirs(d, exist_ok=True)
-
-    with NamedTemporaryFile("w", delete=False, dir=d, encoding="utf-8") as tf:
-        json.dump(data, tf, ensure_ascii=False, indent=2)
-        tf.flush()
-        os.fsync(tf.fileno())
-        tmp = tf.name
-
-    os.replace(tmp, path)
-
-
-def append_signal(signal: Dict[str, Any], outbox_path: str) -> None:
-    validate_signal(signal)
-
-    fp = _fingerprint(signal)
-    signal["_fingerprint"] = fp
-
-    data = _read_outbox(outbox_path)
-    signals: List[Dict[str, Any]] = data.get("signals", [])
-
-    # soft dedupe in outbox (DB dedupe is the real safety net)
-    if any((s.get("_fingerprint") == fp) for s in signals[-50:]):
-        logger.info(f"OUTBOX_DEDUPED | fingerprint={fp}")
-        return
-
-    signals.append(signal)
-    data["signals"] = signals
-    _atomic_write_json(outbox_path, data)
-
-
-def pop_next_signal(outbox_path: str) -> Optional[Dict[str, Any]]:
-    """
-    Pops FIFO: takes the oldest signal from outbox.
-    Atomic rewrite.
-    """
-    data = _read_outbox(outbox_path)
-    signals: List[Dict[str, Any]] = data.get("signals", [])
-    if not signals:
-        return None
-
-    sig = signals.pop(0)
-    data["signals"] = signals
-    _atomic_write_json(outbox_path, data)
-    return sig
+# execution/signal_client.py
+import json
+import os
+import time
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from tempfile import NamedTemporaryFile
+
+from execution import clock
+from execution.outbox_lock import DEFAULT_TIMEOUT_S, OutboxLockTimeout, bump_outbox_revision, outbox_lock, outbox_revision
+from execution.metrics import counter
+from execution import tracing
+
+logger = logging.getLogger("gbm")
+
+APPENDED = counter("gbm_outbox_appended_total", "signals appended to the outbox")
+DEDUPED = counter("gbm_outbox_deduped_total", "signals skipped by the outbox soft dedupe")
+POPPED = counter("gbm_outbox_popped_total", "signals popped from the outbox", ["lane"])
+EXPIRED = counter("gbm_outbox_expired_total", "expired signals dropped from the outbox")
+CONFLICTS = counter("gbm_outbox_write_conflicts_total", "outbox rewrites redone because another writer committed first")
+
+# default lifetime of a signal without its own expires_at (from created_at_utc); 0 = no default expiry
+SIGNAL_TTL_SECONDS = float(os.getenv("SIGNAL_TTL_SECONDS", "300"))
+
+# Priority lanes (signal["priority"]; default: HOLD -> LOW, everything else -> NORMAL).
+# CRITICAL (exits / risk reduction) is strict priority and bypasses the worker's batch time
+# budget; the other lanes share pops by weight (smooth weighted round-robin), FIFO within a lane.
+# No producer sets a priority yet (the generator only emits LONG entries and the worker executes
+# no exit signals), so today everything rides NORMAL / LOW; CRITICAL is the slot exit and
+# risk-reduce producers are expected to use.
+LANES = ("CRITICAL", "HIGH", "NORMAL", "LOW")
+EXPEDITED_LANES = ("CRITICAL",)
+
+
+def _lane_weights(raw: str) -> Dict[str, int]:
+    weights = {"HIGH": 4, "NORMAL": 2, "LOW": 1}
+    for part in raw.split(","):
+        if ":" in part:
+            lane, w = part.split(":", 1)
+            lane = lane.strip().upper()
+            if lane in weights:
+                weights[lane] = max(1, int(w))
+    return weights
+
+
+LANE_WEIGHTS = _lane_weights(os.getenv("OUTBOX_LANE_WEIGHTS", ""))
+
+
+def _safe_float(x: Any) -> Optional[float]:
+    try:
+        if x is None:
+            return None
+        return float(x)
+    except Exception:
+        return None
+
+
+def _fingerprint(signal: Dict[str, Any]) -> str:
+    """
+    Stable fingerprint for idempotency.
+    IMPORTANT: do NOT use uuid/signal_id inside hash.
+    """
+    verdict = str(signal.get("final_verdict") or "").upper().strip()
+
+    execution = signal.get("execution") or {}
+    symbol = str(execution.get("symbol") or "").upper().strip()
+    direction = str(execution.get("direction") or "").upper().strip()
+    entry_type = str((execution.get("entry") or {}).get("type") or "").upper().strip()
+    pos_size = _safe_float(execution.get("position_size"))
+
+    base = f"v1:{verdict}:{symbol}:{direction}:{entry_type}:{pos_size}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+def _parse_ts(v: Any) -> Optional[float]:
+    """Epoch seconds from an ISO-8601 string (naive = UTC) or a number."""
+    if v is None or v == "":
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        dt = datetime.fromisoformat(str(v).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def signal_created_ts(signal: Dict[str, Any]) -> Optional[float]:
+    return _parse_ts(signal.get("created_at_utc"))
+
+
+def signal_expiry_ts(signal: Dict[str, Any]) -> Optional[float]:
+    """expires_at if set, else created_at_utc + SIGNAL_TTL_SECONDS; None = never expires."""
+    exp = _parse_ts(signal.get("expires_at"))
+    if exp is not None:
+        return exp
+    if SIGNAL_TTL_SECONDS <= 0:
+        return None
+    created = _parse_ts(signal.get("created_at_utc"))
+    return created + SIGNAL_TTL_SECONDS if created is not None else None
+
+
+def is_signal_expired(signal: Dict[str, Any], now: Optional[float] = None) -> bool:
+    exp = signal_expiry_ts(signal)
+    if exp is None:
+        return False
+    return (clock.now() if now is None else now) >= exp
+
+
+def signal_lane(signal: Dict[str, Any]) -> str:
+    lane = str(signal.get("priority") or "").upper().strip()
+    if lane in LANES:
+        return lane
+    return "LOW" if str(signal.get("final_verdict") or "").upper().strip() == "HOLD" else "NORMAL"
+
+
+class _LaneScheduler:
+    """Consumer-side dequeue order across lanes + per-lane wait-time stats (in-process)."""
+
+    def __init__(self, weights: Dict[str, int]):
+        self.weights = dict(weights)
+        self.current = {lane: 0 for lane in weights}
+        self.popped = {lane: 0 for lane in LANES}
+        self.wait_s = {lane: 0.0 for lane in LANES}
+        self.wait_max_s = {lane: 0.0 for lane in LANES}
+
+    def pick(self, ready: List[str]) -> str:
+        for lane in EXPEDITED_LANES:
+            if lane in ready:
+                return lane
+        total = 0
+        for lane in ready:
+            self.current[lane] += self.weights[lane]
+            total += self.weights[lane]
+        best = max(ready, key=lambda l: self.current[l])
+        self.current[best] -= total
+        return best
+
+    def record(self, lane: str, wait_s: Optional[float]) -> None:
+        self.popped[lane] += 1
+        if wait_s is not None:
+            self.wait_s[lane] += wait_s
+            if wait_s > self.wait_max_s[lane]:
+                self.wait_max_s[lane] = wait_s
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            lane: {
+                "popped": self.popped[lane],
+                "wait_avg_s": self.wait_s[lane] / max(1, self.popped[lane]),
+                "wait_max_s": self.wait_max_s[lane],
+            }
+            for lane in LANES
+        }
+
+
+_scheduler = _LaneScheduler(LANE_WEIGHTS)
+
+
+def validate_signal(signal: Dict[str, Any]) -> None:
+    if not isinstance(signal, dict):
+        raise ValueError("SIGNAL_NOT_DICT")
+
+    verdict = str(signal.get("final_verdict") or "").upper().strip()
+    if verdict not in ("TRADE", "HOLD"):
+        raise ValueError("INVALID_VERDICT")
+
+    if signal.get("certified_signal") is not True:
+        raise ValueError("NOT_CERTIFIED")
+
+    execution = signal.get("execution") or {}
+    symbol = execution.get("symbol")
+    direction = str(execution.get("direction") or "").upper().strip()
+    entry = execution.get("entry") or {}
+    entry_type = str(entry.get("type") or "").upper().strip()
+
+    if not symbol:
+        raise ValueError("MISSING_EXEC_SYMBOL")
+    if direction != "LONG":
+        raise ValueError("INVALID_DIRECTION")
+    if entry_type != "MARKET":
+        raise ValueError("INVALID_ENTRY_TYPE")
+
+    ps = _safe_float(execution.get("position_size"))
+    if ps is None or ps <= 0:
+        raise ValueError("INVALID_POSITION_SIZE")
+
+    if signal.get("priority") is not None and str(signal["priority"]).upper().strip() not in LANES:
+        raise ValueError("INVALID_PRIORITY")
+
+
+def _read_snapshot(path: str) -> Tuple[int, Dict[str, Any]]:
+    """
+    (revision, outbox). The revision and the open file are taken together under the shared lock
+    (O(1)); the parse runs after it is released: the open descriptor keeps the old inode
+    readable even if a writer swaps the outbox meanwhile.
+    """
+    with outbox_lock(path, shared=True):
+        rev = outbox_revision(path)
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return rev, {"signals": []}
+    with f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        return rev, {"signals": []}
+    if "signals" not in data or not isinstance(data["signals"], list):
+        data["signals"] = []
+    return rev, data
+
+
+def _read_outbox(path: str) -> Dict[str, Any]:
+    return _read_snapshot(path)[1]
+
+
+def _write_temp(path: str, data: Dict[str, Any]) -> str:
+    """Serialised + fsynced next to the outbox, no lock held. Returns the temp path."""
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+
+    # one write() of the serialised blob: json.dump to a file issues a write per chunk
+    blob = json.dumps(data, ensure_ascii=False, indent=2)
+    with NamedTemporaryFile("w", delete=False, dir=d, encoding="utf-8") as tf:
+        tf.write(blob)
+        tf.flush()
+        os.fsync(tf.fileno())
+        return tf.name
+
+
+def _commit(path: str, rev: int, tmp: str) -> bool:
+    """Swaps tmp in if the outbox is still at `rev` (the only work under the exclusive lock)."""
+    with outbox_lock(path):
+        ok = outbox_revision(path) == rev
+        if ok:
+            os.replace(tmp, path)
+            bump_outbox_revision(path)
+    if not ok:
+        os.unlink(tmp)
+        CONFLICTS.inc()
+    return ok
+
+
+def _atomic_write_json(path: str, data: Dict[str, Any]) -> None:
+    """Unconditional rewrite (fixtures / tools); the append / pop paths go through _commit."""
+    tmp = _write_temp(path, data)
+    with outbox_lock(path):
+        os.replace(tmp, path)
+        bump_outbox_revision(path)
+
+
+def _check_deadline(path: str, t0: float) -> None:
+    # optimistic retries are bounded like a lock wait
+    if time.perf_counter() - t0 >= DEFAULT_TIMEOUT_S:
+        raise OutboxLockTimeout(f"outbox rewrite kept conflicting for {DEFAULT_TIMEOUT_S}s: {path}")
+
+
+def outbox_depth(outbox_path: str) -> int:
+    """Signals waiting in the outbox (shared snapshot, parsed outside the lock)."""
+    try:
+        return len(_read_outbox(outbox_path).get("signals", []))
+    except Exception:
+        return 0
+
+
+def pending_entries(outbox_path: str) -> int:
+    """Live (not expired) TRADE signals waiting in the outbox: entries that will open positions."""
+    now = clock.now()
+    try:
+        signals = _read_outbox(outbox_path).get("signals", [])
+    except Exception:
+        return 0
+    return sum(
+        1 for s in signals
+        if str(s.get("final_verdict") or "").upper().strip() == "TRADE" and not is_signal_expired(s, now)
+    )
+
+
+def append_signal(signal: Dict[str, Any], outbox_path: str) -> None:
+    append_signals([signal], outbox_path)
+
+
+def append_signals(batch: List[Dict[str, Any]], outbox_path: str) -> int:
+    """
+    Appends several signals with ONE read + ONE atomic rewrite (all validated first), committed
+    optimistically (see _commit; redone if another writer got in first). Returns number of
+    signals written.
+    """
+    for signal in batch:
+        validate_signal(signal)
+    if not batch:
+        return 0
+    # everything that doesn't depend on the file happens before the lock
+    for signal in batch:
+        signal["_fingerprint"] = _fingerprint(signal)
+        tracing.ensure_trace_id(signal)
+
+    ts0, t0 = time.time(), time.perf_counter()
+    while True:
+        written = _append_once(batch, outbox_path)
+        if written is not None:
+            break
+        _check_deadline(outbox_path, t0)
+    _trace_append(batch, ts0, time.perf_counter() - t0)
+    return written
+
+
+def _trace_append(batch: List[Dict[str, Any]], ts0: float, dur_s: float) -> None:
+    for signal in batch:
+        appended = signal.get("_appended_ts")
+        if appended is None:
+            continue  # deduped
+        tid = tracing.trace_id(signal)
+        tracing.record(tid, "generate", signal_created_ts(signal), appended)
+        tracing.record(tid, "append", ts0, ts0 + dur_s)
+    tracing.flush()
+
+
+def _append_once(batch: List[Dict[str, Any]], outbox_path: str) -> Optional[int]:
+    """One optimistic attempt: signals written, or None if another writer committed first."""
+    rev, data = _read_snapshot(outbox_path)
+    signals: List[Dict[str, Any]] = data.get("signals", [])
+
+    # soft dedupe of repeats within the recent tail (executed_signals is the hard idempotency check)
+    recent = {s.get("_fingerprint") for s in signals[-50:]}
+    deduped = []
+    for signal in batch:
+        signal.pop("_appended_ts", None)
+        fp = signal["_fingerprint"]
+        if fp in recent:
+            deduped.append(fp)
+            continue
+        recent.add(fp)
+        signal["_appended_ts"] = time.time()
+        signals.append(signal)
+
+    written = len(batch) - len(deduped)
+    if written:
+        data["signals"] = signals
+        if not _commit(outbox_path, rev, _write_temp(outbox_path, data)):
+            return None
+        APPENDED.inc(written)
+    for fp in deduped:
+        logger.info("OUTBOX_DEDUPED | fingerprint=%s", fp)
+        DEDUPED.inc()
+    return written
+
+
+def pop_next_signal(outbox_path: str, lanes: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Pops the next live signal: lane chosen by _LaneScheduler (only `lanes` if given),
+    oldest first within the lane.
+    Every expired signal (see signal_expiry_ts) is dropped in the same atomic rewrite, with one
+    OUTBOX_EXPIRED audit rollup per batch. Committed optimistically like append_signals: the
+    exclusive lock only covers the revision check + rename.
+    """
+    if not os.path.exists(outbox_path):
+        return None
+    allowed = set(lanes) if lanes is not None else set(LANES)
+    now = clock.now()
+    ts0, t0 = time.time(), time.perf_counter()
+    while True:
+        rev, data = _read_snapshot(outbox_path)
+        signals: List[Dict[str, Any]] = data.get("signals", [])
+        if not signals:
+            return None
+
+        expired: List[Dict[str, Any]] = []
+        live = []
+        head: Dict[str, int] = {}  # lane -> index in live of its oldest signal
+        for s in signals:
+            if is_signal_expired(s, now):
+                expired.append(s)
+                continue
+            lane = signal_lane(s)
+            if lane in allowed and lane not in head:
+                head[lane] = len(live)
+            live.append(s)
+
+        sig = lane = None
+        weights = dict(_scheduler.current)  # pick() advances the round-robin: undone on conflict
+        if head:
+            lane = _scheduler.pick([l for l in LANES if l in head])
+            sig = live.pop(head[lane])
+        if sig is None and not expired:
+            return None
+        data["signals"] = live
+        if _commit(outbox_path, rev, _write_temp(outbox_path, data)):
+            break
+        _scheduler.current = weights
+        _check_deadline(outbox_path, t0)
+
+    if sig is not None:
+        created = _parse_ts(sig.get("created_at_utc"))
+        _scheduler.record(lane, now - created if created is not None else None)
+        POPPED.labels(lane=lane).inc()
+    if expired:
+        _report_expired(expired, now)
+    if sig is not None:
+        tid = tracing.trace_id(sig)
+        tracing.record(tid, "queue", _safe_float(sig.get("_appended_ts")), ts0)
+        tracing.record(tid, "pop", ts0, ts0 + time.perf_counter() - t0)
+    return sig
+
+
+def lane_stats(outbox_path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Per lane: current depth and oldest wait of live signals (outbox; expired ones are dropped at
+    the next pop and not counted), popped count and wait avg / max (this process).
+    """
+    now = clock.now()
+    out = _scheduler.stats()
+    for lane in LANES:
+        out[lane].update({"depth": 0, "oldest_wait_s": 0.0})
+    try:
+        signals = _read_outbox(outbox_path).get("signals", [])
+    except Exception:
+        signals = []
+    for s in signals:
+        if is_signal_expired(s, now):
+            continue
+        st = out[signal_lane(s)]
+        st["depth"] += 1
+        created = _parse_ts(s.get("created_at_utc"))
+        if created is not None and now - created > st["oldest_wait_s"]:
+            st["oldest_wait_s"] = now - created
+    return out
+
+
+def _report_expired(expired: List[Dict[str, Any]], now: float) -> None:
+    EXPIRED.inc(len(expired))
+    oldest = min((signal_expiry_ts(s) or now) for s in expired)
+    symbols = sorted({str((s.get("execution") or {}).get("symbol") or "?") for s in expired})
+    msg = (
+        f"dropped={len(expired)} max_overdue_s={now - oldest:.0f} "
+        f"symbols={','.join(symbols[:20])}{'...' if len(symbols) > 20 else ''} "
+        f"first_id={expired[0].get('signal_id')}"
+    )
+    logger.warning("OUTBOX_EXPIRED | %s", msg)
+    try:
+        from execution.db.repository import log_event
+        log_event("OUTBOX_EXPIRED", msg)
+    except Exception:
+        pass
@@ -1,228 +1,293 @@
-# execution/signal_generator.py
-import os
-import json
-import uuid
-from datetime import datetime, timezone
-from pathlib import Path
-from typing import Dict, Any, List, Optional
-
-import ccxt
-import openpyxl
-
-from execution.signal_client import append_signal
-from execution.db.repository import get_open_positions_count
-
-EXCEL_PATH = Path(os.getenv("BRAIN_XLSX_PATH", "/var/data/brain.xlsx"))
-
-
-def _bool(v: Any) -> bool:
-    return str(v).strip().lower() in ("true", "1", "yes", "y")
-
-
-def _read_kv_sheet(ws) -> Dict[str, Any]:
-    """
-    Reads GENERATOR_CONFIG formatted as:
-      Column A = key
-      Column B = value
-    """
-    cfg: Dict[str, Any] = {}
-    r = 1
-    while True:
-        k = ws[f"A{r}"].value
-        v = ws[f"B{r}"].value
-        if k is None:
-            break
-        cfg[str(k).strip()] = v
-        r += 1
-        if r > 200:
-            break
-    return cfg
-
-
-def _parse_symbols(cfg: Dict[str, Any]) -> List[str]:
-    symbols_csv = str(cfg.get("SYMBOLS_CSV") or "").strip()
-    if symbols_csv:
-        return [s.strip() for s in symbols_csv.split(",") if s.strip()]
-    # fallback single symbol
-    sym = str(cfg.get("SYMBOL") or "BTC/USDT").strip()
-    return [sym]
-
-
-def _safe_float(v: Any, default: float) -> float:
-    try:
-        return float(v)
-    except Exception:
-        return default
-
-
-def _safe_int(v: Any, default: int) -> int:
-    try:
-        return int(v)
-    except Exception:
-        return default
-
-
-def _utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
-
-
-def _load_symbol_overrides(wb) -> Dict[str, Dict[str, float]]:
-    """
-    Optional sheet: SYMBOL_OVERRIDES
-    Columns: SYMBOL | USDT_SIZE_OVERRIDE | TP_PCT_OVERRIDE | SL_PCT_OVERRIDE
-    """
-    if "SYMBOL_OVERRIDES" not in wb.sheetnames:
-        return {}
-
-    ws = wb["SYMBOL_OVERRIDES"]
-    overrides: Dict[str, Dict[str, float]] = {}
-
-    # header at row 1
-    for r in range(2, 500):
-        sym = ws[f"A{r}"].value
-        if sym is None:
-            break
-        sym = str(sym).strip()
-        if not sym:
-            continue
-
-        o: Dict[str, float] = {}
-        usdt = ws[f"B{r}"].value
-        tp = ws[f"C{r}"].value
-        sl = ws[f"D{r}"].value
-
-        if usdt not in (None, ""):
-            o["USDT_SIZE"] = _safe_float(usdt, 0.0)
-        if tp not in (None, ""):
-            o["TP_PCT"] = _safe_float(tp, 0.0)
-        if sl not in (None, ""):
-            o["SL_PCT"] = _safe_float(sl, 0.0)
-
-        if o:
-            overrides[sym] = o
-
-    return overrides
-
-
-def _get_last_signal_time_map() -> Dict[str, float]:
-    """
-    Very small in-process cache in env-less runtime: use a module-level dict by attaching to function.
-    """
-    if not hasattr(_get_last_signal_time_map, "_cache"):
-        _get_last_signal_time_map._cache = {}  # type: ignore
-    return _get_last_signal_time_map._cache  # type: ignore
-
-
-def _sma(values: List[float], n: int) -> Optional[float]:
-    if len(values) < n:
-        return None
-    return sum(values[-n:]) / n
-
-
-def run_once(outbox_path: str) -> bool:
-    """
-    Reads brain.xlsx (brain_FINAL layout), scans multiple symbols, and writes at most ONE signal per loop.
-    Returns True if a signal was written.
-    """
-    if not EXCEL_PATH.exists():
-        raise FileNotFoundError(f"brain.xlsx not found at {EXCEL_PATH}")
-
-    wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True)
-    if "GENERATOR_CONFIG" not in wb.sheetnames:
-        raise ValueError("GENERATOR_CONFIG sheet missing")
-
-    cfg = _read_kv_sheet(wb["GENERATOR_CONFIG"])
-    enabled = _bool(cfg.get("ENABLED", False))
-    if not enabled:
-        return False
-
-    max_open = _safe_int(cfg.get("MAX_OPEN_POSITIONS"), 1)
-    if get_open_positions_count() >= max_open:
-        return False
-
-    tf = str(cfg.get("TIMEFRAME") or "1m").strip()
-    limit = _safe_int(cfg.get("LIMIT"), 50)
-    ma_period = _safe_int(cfg.get("MA_PERIOD"), 20)
-    min_conf = _safe_float(cfg.get("MIN_CONF"), 0.70)
-
-    usdt_size_default = _safe_float(cfg.get("USDT_SIZE"), 1.0)
-    tp_pct_default = _safe_float(cfg.get("TP_PCT"), 0.03)
-    sl_pct_default = _safe_float(cfg.get("SL_PCT"), 0.015)
-
-    sl_buf = _safe_float(cfg.get("SL_LIMIT_BUFFER_PCT"), 0.001)
-    cooldown_s = _safe_int(cfg.get("COOLDOWN_SECONDS"), 600)
-
-    direction = str(cfg.get("DIRECTION") or "LONG").strip().upper()
-    if direction != "LONG":
-        # spot only in this demo
-        return False
-
-    symbols = _parse_symbols(cfg)
-    overrides = _load_symbol_overrides(wb)
-
-    ex = ccxt.binance({"enableRateLimit": True, "options": {"defaultType": "spot"}})
-
-    last_map = _get_last_signal_time_map()
-    now_ts = datetime.now(timezone.utc).timestamp()
-
-    # scan symbols; create at most ONE signal
-    for symbol in symbols:
-        # cooldown per symbol
-        last_ts = float(last_map.get(symbol, 0.0))
-        if now_ts - last_ts < cooldown_s:
-            continue
-
-        # per-symbol overrides (optional)
-        o = overrides.get(symbol, {})
-        usdt_size = float(o.get("USDT_SIZE", usdt_size_default))
-        tp_pct = float(o.get("TP_PCT", tp_pct_default))
-        sl_pct = float(o.get("SL_PCT", sl_pct_default))
-
-        ohlcv = ex.fetch_ohlcv(symbol, timeframe=tf, limit=limit)
-        closes = [c[4] for c in ohlcv]
-        last = closes[-1]
-        ma = _sma(closes, ma_period)
-        if ma is None:
-            continue
-
-        # Example rule: BUY if price > MA
-        confidence = 0.75 if last > ma else 0.50
-        if not (last > ma and confidence >= min_conf):
-            continue
-
-        position_size = usdt_size / last
-
-        tp_price = last * (1 + tp_pct)
-        sl_stop = last * (1 - sl_pct)
-        sl_limit = sl_stop * (1 - sl_buf)
-
-        signal = {
-            "signal_id": f"DYZEN-{uuid.uuid4().hex[:12]}",
-            "created_at_utc": _utc_now(),
-            "final_verdict": "TRADE",
-            "certified_signal": True,
-            "execution": {
-                "symbol": symbol,
-                "direction": "LONG",
-                "position_size": float(position_size),
-                "entry": {"type": "MARKET"},
-                "exits": {
-                    "tp": {"type": "LIMIT", "price": float(tp_price)},
-                    "sl": {"type": "STOP_LIMIT", "stop_price": float(sl_stop), "limit_price": float(sl_limit)},
-                },
-            },
-            "meta": {
-                "tf": tf,
-                "last": float(last),
-                "ma": float(ma),
-                "confidence": float(confidence),
-            },
-        }
-
-        append_signal(signal, outbox_path)
-
-        # mark cooldown
-        last_map[symbol] = now_ts
-        return True
-
-    return False
+# execution/signal_generator.py
+import os
+import json
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from execution import clock
+from execution.cassette import wrap_exchange
+from execution.fake_exchange import create_exchange
+from execution.brain_config import get_brain_config
+from execution.candle_store import get_candle_store, timeframe_ms
+from execution.resampler import get_resampler, bucket_start, BASE_TF, BASE_MS
+from execution.rate_limiter import get_bucket
+from execution.indicators import get_indicator_bank, indicator_state_path
+from execution.signal_client import append_signals, pending_entries
+from execution.signal_history import get_signal_history
+from execution.db.repository import get_open_positions_count, get_pause_reason
+
+EXCEL_PATH = Path(os.getenv("BRAIN_XLSX_PATH", "/var/data/brain.xlsx"))
+CANDLE_STORE_ENABLED = os.getenv("CANDLE_STORE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "y")
+# higher timeframes built locally from the 1m stream (no extra klines per timeframe)
+RESAMPLE_FROM_1M = os.getenv("GEN_RESAMPLE_FROM_1M", "true").strip().lower() in ("1", "true", "yes", "y")
+# above this many 1m candles per window (e.g. 1d x 50) the timeframe is fetched directly
+RESAMPLE_MAX_1M = int(os.getenv("GEN_RESAMPLE_MAX_1M", "20000"))
+SCAN_WORKERS = int(os.getenv("GEN_SCAN_WORKERS", "64"))
+# below this many symbols a bulk ticker request costs more than it saves
+TICKER_PREFILTER_MIN = int(os.getenv("GEN_TICKER_PREFILTER_MIN", "5"))
+
+# Binance request weights
+KLINES_WEIGHT = 2
+TICKERS_WEIGHT = 40
+
+logger = logging.getLogger("gbm")
+
+_ex = None
+
+
+def _utc_now() -> str:
+    return datetime.fromtimestamp(clock.now(), timezone.utc).isoformat()
+
+
+def _candles(ex, symbol: str, tf: str, limit: int) -> np.ndarray:
+    """Last `limit` OHLCV rows: local store (incremental fetch, zero-copy view) or a full REST fetch."""
+    if CANDLE_STORE_ENABLED:
+        step = timeframe_ms(tf)
+        need_1m = (limit + 1) * (step // BASE_MS)
+        if RESAMPLE_FROM_1M and tf != BASE_TF and need_1m <= RESAMPLE_MAX_1M:
+            base = get_candle_store().sync(ex, symbol, BASE_TF, need_1m)
+            if base.shape[0] == 0:
+                return base
+            # start the window on a bucket boundary so the first candle is complete
+            start_ts = float(bucket_start(base[-1:, 0], tf)[0]) - limit * step
+            base = base[int(np.searchsorted(base[:, 0], start_ts)):]
+            return get_resampler().feed(symbol, base, [tf]).candles(tf, limit)
+        return get_candle_store().sync(ex, symbol, tf, limit)[-limit:]
+    return np.asarray(ex.fetch_ohlcv(symbol, timeframe=tf, limit=limit), dtype=np.float64).reshape(-1, 6)
+
+
+def _exchange():
+    # REST pacing comes from the shared token bucket: ccxt's own throttle is not meant for a thread pool
+    global _ex
+    if _ex is None:
+        _ex = wrap_exchange(create_exchange({"enableRateLimit": False, "options": {"defaultType": "spot"}}), channel="generator")
+    return _ex
+
+
+def _prefilter(ex, symbols: List[str], tf: str, bank, ruleset) -> List[str]:
+    """
+    One bulk fetch_tickers instead of per-symbol klines for symbols that cannot qualify:
+    if the forming candle is already in the indicator state, the ticker price gives the
+    rule inputs (last, indicators with the forming candle revised) without any OHLCV request.
+    Skipped when a rule reads open / high / low / volume.
+    """
+    if len(symbols) < TICKER_PREFILTER_MIN or ruleset.needs_candle():
+        return symbols
+    forming_ts = float(bucket_start(np.array([clock.now() * 1000.0]), tf)[0])
+    known = [s for s in symbols if s in bank.sets and bank.sets[s].last_ts == forming_ts]
+    if len(known) < TICKER_PREFILTER_MIN:
+        return symbols
+
+    get_bucket().acquire(TICKERS_WEIGHT)
+    try:
+        tickers = ex.fetch_tickers(known)
+    except Exception as e:
+        logger.warning("GEN_PREFILTER_FAIL | symbols=%s err=%s", len(known), e)
+        return symbols
+
+    peeked: List[str] = []
+    rows: List[Dict[str, Any]] = []
+    for s in known:
+        last = (tickers.get(s) or {}).get("last")
+        if last is None:
+            continue
+        vals = bank.sets[s].peek(forming_ts, float(last), float(last), float(last))
+        if vals:
+            peeked.append(s)
+            rows.append({"last": float(last), "close": float(last), **vals})
+    if not peeked:
+        return symbols
+    ok, _conf, _score = ruleset.evaluate(_env(rows, ruleset))
+    drop = {s for s, keep in zip(peeked, ok.tolist()) if not keep}
+    return [s for s in symbols if s not in drop]
+
+
+def _env(rows: List[Dict[str, Any]], ruleset) -> Dict[str, np.ndarray]:
+    """Per-symbol values -> one float array per rule input (missing -> NaN)."""
+    keys = set(ruleset.needs) | set(ruleset.prices) | {"last"}
+    return {k: np.array([np.nan if r.get(k) is None else float(r[k]) for r in rows], dtype=np.float64) for k in keys}
+
+
+def _scan(ex, symbols: List[str], tf: str, limit: int) -> Dict[str, np.ndarray]:
+    """Candles for all symbols in parallel; a failing symbol is logged and left out."""
+    out: Dict[str, np.ndarray] = {}
+    if not symbols:
+        return out
+    bucket = get_bucket()
+
+    def one(sym: str) -> np.ndarray:
+        bucket.acquire(KLINES_WEIGHT)
+        return _candles(ex, sym, tf, limit)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(SCAN_WORKERS, len(symbols))), thread_name_prefix="gen-scan") as pool:
+        futs = {pool.submit(one, s): s for s in symbols}
+        for f in as_completed(futs):
+            sym = futs[f]
+            try:
+                out[sym] = f.result()
+            except Exception as e:
+                logger.warning("GEN_SCAN_FAIL | symbol=%s err=%s", sym, e)
+    return out
+
+
+def build_trade_signal(
+    symbol: str,
+    last: float,
+    ma: float,
+    confidence: float,
+    usdt_size: float,
+    tp_pct: float,
+    sl_pct: float,
+    sl_buf: float,
+    tf: str,
+) -> Dict[str, Any]:
+    position_size = usdt_size / last
+
+    tp_price = last * (1 + tp_pct)
+    sl_stop = last * (1 - sl_pct)
+    sl_limit = sl_stop * (1 - sl_buf)
+
+    return {
+        "signal_id": f"DYZEN-{uuid.uuid4().hex[:12]}",
+        "created_at_utc": _utc_now(),
+        "final_verdict": "TRADE",
+        "certified_signal": True,
+        "execution": {
+            "symbol": symbol,
+            "direction": "LONG",
+            "position_size": float(position_size),
+            "entry": {"type": "MARKET"},
+            "exits": {
+                "tp": {"type": "LIMIT", "price": float(tp_price)},
+                "sl": {"type": "STOP_LIMIT", "stop_price": float(sl_stop), "limit_price": float(sl_limit)},
+            },
+        },
+        "meta": {
+            "tf": tf,
+            "last": float(last),
+            "ma": float(ma),
+            "confidence": float(confidence),
+        },
+    }
+
+
+def run_once(outbox_path: str) -> int:
+    """
+    Reads brain.xlsx (brain_FINAL layout), scans multiple symbols, ranks every qualifying
+    candidate and writes the top-K (K = MAX_OPEN_POSITIONS minus open positions minus entries
+    already queued in the outbox) as one outbox batch.
+    Returns number of signals written.
+    """
+    # one stat() per loop; parsed only when brain.xlsx changes
+    cfg = get_brain_config(EXCEL_PATH)
+
+    # cooldowns / signal history (DB-backed mirror); pending rows flushed every few seconds
+    history = get_signal_history()
+    history.maybe_flush()
+
+    if not cfg.enabled:
+        return 0
+
+    # guard entry gate (limit breach): no new entries while it is set
+    if get_pause_reason():
+        return 0
+
+    max_open = cfg.max_open
+    # entries still queued in the outbox take a slot too (the worker may drain slower than we tick)
+    open_count = get_open_positions_count() + pending_entries(outbox_path)
+    if open_count >= max_open:
+        return 0
+
+    if cfg.direction != "LONG":
+        # spot only in this demo
+        return 0
+
+    tf, limit, min_conf = cfg.tf, cfg.limit, cfg.min_conf
+    sl_buf, cooldown_s = cfg.sl_buf, cfg.cooldown_s
+    symbols = list(cfg.symbols)
+
+    ex = _exchange()
+
+    # RULES sheet (validated when brain.xlsx was loaded) decides which indicators are kept
+    ruleset = cfg.ruleset()
+
+    # per-symbol rolling state: only candles newer than the last one seen are applied
+    bank = get_indicator_bank(ruleset.indicator_spec(), name=f"generator_{tf}")
+
+    now_ts = clock.now()
+
+    # cooldown per symbol, then bulk prefilter and one concurrent candle fetch for the rest
+    t0 = time.perf_counter()
+    eligible = [s for s in symbols if not history.in_cooldown(s, cooldown_s, now_ts)]
+    if cfg.max_signals_per_hour > 0:
+        eligible = [s for s in eligible if history.count_since(s, 3600.0, now_ts) < cfg.max_signals_per_hour]
+    candidates = _prefilter(ex, eligible, tf, bank, ruleset)
+    scanned = _scan(ex, candidates, tf, limit)
+    logger.info(
+        "GEN_SCAN | symbols=%s eligible=%s prefiltered=%s fetched=%s failed=%s ms=%.0f",
+        len(symbols), len(eligible), len(eligible) - len(candidates),
+        len(scanned), len(candidates) - len(scanned), (time.perf_counter() - t0) * 1000,
+    )
+
+    for symbol, candles in scanned.items():
+        if candles.shape[0]:
+            bank.feed(symbol, candles)
+
+    # rank: evaluate every rule over all candidates in one pass, best first
+    ranked = [s for s in candidates if s in scanned and scanned[s].shape[0] and bank.value(s, ruleset.ma_key) is not None]
+    if not ranked:
+        bank.maybe_save(indicator_state_path(f"generator_{tf}"))
+        return 0
+    rows = []
+    for s in ranked:
+        c = scanned[s][-1]
+        rows.append({
+            "last": c[4], "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5],
+            **bank.sets[s].values(),
+        })
+    env = _env(rows, ruleset)
+    last, ma = env["last"], env[ruleset.ma_key]
+
+    ok, confidence, score = ruleset.evaluate(env)
+    ok &= confidence >= min_conf
+
+    slots = max(0, max_open - open_count)
+    order = np.flatnonzero(ok)
+    order = order[np.argsort(-score[order], kind="stable")][:slots]
+
+    batch: List[Dict[str, Any]] = []
+    for i in order:
+        symbol = ranked[i]
+
+        # per-symbol overrides (optional)
+        usdt_size, tp_pct, sl_pct = cfg.for_symbol(symbol)
+
+        signal = build_trade_signal(
+            symbol=symbol, last=float(last[i]), ma=float(ma[i]), confidence=float(confidence[i]),
+            usdt_size=usdt_size, tp_pct=tp_pct, sl_pct=sl_pct, sl_buf=sl_buf, tf=tf,
+        )
+        signal["meta"]["score"] = float(score[i])
+        batch.append(signal)
+
+    written = append_signals(batch, outbox_path) if batch else 0
+
+    # mark cooldown (persisted write-behind)
+    for signal in batch:
+        history.record(signal["execution"]["symbol"], signal_id=signal["signal_id"], ts=now_ts)
+    history.maybe_flush()
+    if batch:
+        logger.info(
+            "GEN_RANK | qualified=%s slots=%s written=%s top=%s score=%.3f",
+            int(ok.sum()), slots, written, batch[0]["execution"]["symbol"], batch[0]["meta"]["score"],
+        )
+
+    bank.maybe_save(indicator_state_path(f"generator_{tf}"))
+    return written
+
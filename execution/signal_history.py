@@ -0,0 +1,122 @@
+# execution/signal_history.py
+"""
+Generator cooldowns / signal history: signal_history table + in-memory mirror.
+
+  - last_ts(symbol), in_cooldown(...)  O(1) dict lookup
+  - count_since(symbol, seconds)       per-symbol deque, trimmed from the left (amortised O(1)) + bisect
+  - record(...)                        updates the mirror, queues the DB row (write-behind)
+  - maybe_flush()                      one executemany per SIGNAL_HISTORY_FLUSH_SECONDS (and at exit)
+
+On start the mirror is loaded from the last SIGNAL_HISTORY_RETENTION_HOURS of rows, so a
+redeploy keeps cooldowns of symbols that just traded.
+"""
+import os
+import atexit
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from execution import clock
+from execution.db.repository import insert_signal_history, list_signal_history_since, prune_signal_history
+
+logger = logging.getLogger("gbm")
+
+
+class SignalHistory:
+    def __init__(self, retention_s: float = 7 * 86400.0, flush_s: float = 5.0):
+        self.retention_s = float(retention_s)
+        self.flush_s = float(flush_s)
+        self._last: Dict[str, float] = {}
+        self._recent: Dict[str, Deque[float]] = {}
+        self._pending: List[Tuple[str, Optional[str], str, float]] = []
+        self._lock = threading.Lock()
+        self._last_flush = clock.monotonic()
+        self._last_prune = 0.0
+
+    def load(self) -> "SignalHistory":
+        since = clock.now() - self.retention_s
+        rows = list_signal_history_since(since)
+        with self._lock:
+            self._last.clear()
+            self._recent.clear()
+            for symbol, ts in rows:
+                self._recent.setdefault(str(symbol), deque()).append(float(ts))
+                self._last[str(symbol)] = float(ts)
+        logger.info("SIGNAL_HISTORY_LOADED | rows=%s symbols=%s", len(rows), len(self._last))
+        return self
+
+    # ----------------------------
+    # lookups
+    # ----------------------------
+    def last_ts(self, symbol: str) -> float:
+        return self._last.get(symbol, 0.0)
+
+    def in_cooldown(self, symbol: str, cooldown_s: float, now: Optional[float] = None) -> bool:
+        now = clock.now() if now is None else now
+        return now - self._last.get(symbol, 0.0) < cooldown_s
+
+    def count_since(self, symbol: str, seconds: float, now: Optional[float] = None) -> int:
+        """Signals for symbol in the last `seconds` (seconds <= retention)."""
+        q = self._recent.get(symbol)
+        if not q:
+            return 0
+        now = clock.now() if now is None else now
+        with self._lock:
+            horizon = now - self.retention_s
+            while q and q[0] < horizon:
+                q.popleft()
+            # deque is time-ordered
+            return len(q) - bisect.bisect_left(q, now - float(seconds))
+
+    # ----------------------------
+    # writes
+    # ----------------------------
+    def record(self, symbol: str, signal_id: Optional[str] = None, source: str = "GEN", ts: Optional[float] = None) -> None:
+        ts = clock.now() if ts is None else float(ts)
+        with self._lock:
+            self._recent.setdefault(symbol, deque()).append(ts)
+            if ts > self._last.get(symbol, 0.0):
+                self._last[symbol] = ts
+            self._pending.append((symbol, signal_id, source, ts))
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._pending = self._pending, []
+        try:
+            n = insert_signal_history(rows)
+        except Exception as e:
+            with self._lock:
+                self._pending = rows + self._pending
+            logger.warning("SIGNAL_HISTORY_FLUSH_FAIL | pending=%s err=%s", len(rows), e)
+            return 0
+        self._last_flush = clock.monotonic()
+
+        # retention prune: at most hourly
+        if self._last_flush - self._last_prune >= 3600.0:
+            self._last_prune = self._last_flush
+            try:
+                prune_signal_history(clock.now() - self.retention_s)
+            except Exception as e:
+                logger.warning("SIGNAL_HISTORY_PRUNE_FAIL | err=%s", e)
+        return n
+
+    def maybe_flush(self) -> int:
+        if self._pending and clock.monotonic() - self._last_flush >= self.flush_s:
+            return self.flush()
+        return 0
+
+
+_history: Optional[SignalHistory] = None
+
+
+def get_signal_history() -> SignalHistory:
+    global _history
+    if _history is None:
+        _history = SignalHistory(
+            retention_s=float(os.getenv("SIGNAL_HISTORY_RETENTION_HOURS", "168")) * 3600.0,
+            flush_s=float(os.getenv("SIGNAL_HISTORY_FLUSH_SECONDS", "5")),
+        ).load()
+        atexit.register(_history.flush)
+    return _history
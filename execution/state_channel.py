@@ -0,0 +1,180 @@
+# execution/state_channel.py
+"""
+Worker -> guard state record: fixed binary layout in a memory-mapped file, seqlock-protected.
+
+  writer (worker, single):  seq += 1 (odd) -> fields -> seq += 1 (even)
+  reader (guard, any rate): seq1 even -> copy fields -> seq2 == seq1, else retry
+
+A heartbeat is a few stores into the page cache (no serialisation, no file replace), so the
+guard can poll at high frequency. Layout (little-endian, 160 bytes):
+
+  magic 4s | version u32 | seq u64 | pid i64 | open_positions i64 | daily_drawdown f64
+  | heartbeat_ts f64 | changed_ts f64 | mode 16s | worker_status 32s | last_signal_id 56s
+"""
+import os
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+MAGIC = b"GBMS"
+VERSION = 1
+
+_HEAD = struct.Struct("<4sIQ")  # magic, version, seq
+_BODY = struct.Struct("<qqddd16s32s56s")
+SIZE = _HEAD.size + _BODY.size
+_SEQ_OFF = 8
+
+DEFAULT_PATH = Path(os.getenv("GENIUS_STATE_MMAP_PATH", "shared/genius_state.bin"))
+
+
+def _enc(s: Any, n: int) -> bytes:
+    return str(s or "").encode("utf-8")[:n]
+
+
+def _dec(b: bytes) -> str:
+    return b.rstrip(b"\0").decode("utf-8", "replace")
+
+
+class StateChannel:
+    def __init__(self, path: Path = DEFAULT_PATH, writer: bool = False):
+        self.path = Path(path)
+        self.writer = writer
+        self._mm: Optional[mmap.mmap] = None
+        self._seq = 0
+        self._body = [0, 0, 0.0, 0.0, 0.0, b"", b"", b""]
+
+    def _open(self) -> Optional[mmap.mmap]:
+        if self._mm is not None:
+            return self._mm
+        if self.writer:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != SIZE:
+                    os.ftruncate(fd, SIZE)
+                self._mm = mmap.mmap(fd, SIZE, access=mmap.ACCESS_WRITE)
+            finally:
+                os.close(fd)
+            magic, version, seq = _HEAD.unpack_from(self._mm, 0)
+            self._seq = seq + (seq & 1) if magic == MAGIC and version == VERSION else 0
+            _HEAD.pack_into(self._mm, 0, MAGIC, VERSION, self._seq)
+        else:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                return None
+            try:
+                if os.fstat(fd).st_size < SIZE:
+                    return None
+                self._mm = mmap.mmap(fd, SIZE, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+        return self._mm
+
+    # ----------------------------
+    # writer
+    # ----------------------------
+    def write(
+        self,
+        mode: Optional[str] = None,
+        worker_status: Optional[str] = None,
+        open_positions: Optional[int] = None,
+        daily_drawdown: Optional[float] = None,
+        last_signal_id: Optional[str] = None,
+        heartbeat_ts: Optional[float] = None,
+    ) -> bool:
+        """Updates the given fields + heartbeat. Returns True if anything besides the heartbeat changed."""
+        mm = self._open()
+        old = list(self._body)
+        b = self._body
+        b[0] = os.getpid()
+        if open_positions is not None:
+            b[1] = int(open_positions)
+        if daily_drawdown is not None:
+            b[2] = float(daily_drawdown)
+        if mode is not None:
+            b[5] = _enc(mode, 16)
+        if worker_status is not None:
+            b[6] = _enc(worker_status, 32)
+        if last_signal_id:
+            b[7] = _enc(last_signal_id, 56)
+        changed = b != old
+        now = time.time() if heartbeat_ts is None else float(heartbeat_ts)
+        b[3] = now
+        if changed:
+            b[4] = now
+
+        self._seq += 1
+        struct.pack_into("<Q", mm, _SEQ_OFF, self._seq)
+        _BODY.pack_into(mm, _HEAD.size, *b)
+        self._seq += 1
+        struct.pack_into("<Q", mm, _SEQ_OFF, self._seq)
+        return changed
+
+    def heartbeat(self, ts: Optional[float] = None) -> None:
+        self.write(heartbeat_ts=ts)
+
+    # ----------------------------
+    # reader
+    # ----------------------------
+    def read(self, retries: int = 100) -> Optional[Dict[str, Any]]:
+        """Consistent snapshot, or None (no channel yet / writer mid-update for every retry)."""
+        mm = self._open()
+        if mm is None:
+            return None
+        for _ in range(retries):
+            magic, version, s1 = _HEAD.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION:
+                return None
+            if s1 & 1:
+                continue
+            body = _BODY.unpack_from(mm, _HEAD.size)
+            if struct.unpack_from("<Q", mm, _SEQ_OFF)[0] != s1:
+                continue
+            if s1 == 0:
+                return None
+            pid, open_positions, dd, hb, changed, mode, status, last_id = body
+            return {
+                "seq": s1,
+                "pid": pid,
+                "open_positions": open_positions,
+                "daily_drawdown": dd,
+                "heartbeat_ts": hb,
+                "changed_ts": changed,
+                "mode": _dec(mode),
+                "worker_status": _dec(status),
+                "last_signal_id": _dec(last_id),
+            }
+        return None
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def stale_reason(snap: Dict[str, Any], pid: Optional[int], max_age_s: float, now: Optional[float] = None) -> Optional[str]:
+    """
+    Why a snapshot can't be trusted for limit checks, or None. The record outlives its writer:
+    after a crash it keeps the last values, a wedged worker keeps an old heartbeat.
+    """
+    if pid is None:
+        return f"no live worker (record from pid={snap.get('pid')})"
+    if snap.get("pid") != pid:
+        return f"record from pid={snap.get('pid')}, worker is pid={pid}"
+    age = (time.time() if now is None else now) - float(snap.get("heartbeat_ts") or 0.0)
+    if age > max_age_s:
+        return f"heartbeat older than {max_age_s:.0f}s"
+    return None
+
+
+_writer: Optional[StateChannel] = None
+
+
+def get_state_writer() -> StateChannel:
+    global _writer
+    if _writer is None:
+        _writer = StateChannel(DEFAULT_PATH, writer=True)
+    return _writer
@@ -0,0 +1,272 @@
+# execution/tracing.py
+"""
+Signal latency tracing: generator -> outbox -> worker -> OCO armed.
+
+Every signal carries a trace_id (assigned at append if the producer didn't set one). Stages
+record spans against it:
+
+  generate       created_at_utc -> appended          (producer side)
+  append         outbox lock + rewrite
+  queue          appended -> popped                   (time waiting in the outbox)
+  pop            outbox lock + rewrite
+  dedupe         executed_signals idempotency check
+  gates          system state / kill switch / payload gates
+  price_fetch    last price (cache, ticker)
+  buy            market buy (DEMO: wallet fill)
+  balance_fetch  free base balance after the buy
+  oco_place      OCO order
+  db_commit      executed_signals / oco_links writes
+  execute        whole execute_signal
+  e2e            created_at_utc -> OCO armed (DEMO: position open)
+
+Off by default (TRACE_ENABLED=true to turn on; loadgen does). Span file (TRACE_PATH,
+append-only TSV, one line per span):
+
+  trace_id  stage  start_ts  dur_ms  ok  pid
+
+Spans are buffered per process and written with a single O_APPEND write per flush (the worker
+flushes after each signal), so lines from several processes never interleave. The descriptor
+stays open between flushes; past TRACE_MAX_BYTES (default 64 MiB, 0 = unbounded) the file is
+rotated to TRACE_PATH.1 (one generation kept). A process that finds the file rotated under it
+reopens it instead of writing into the old generation.
+
+  python -m execution.tracing [trace.tsv] [--since-minutes N]   per-stage p50 / p95 / p99
+                                                                (reads trace.tsv.1 too)
+
+Wall-clock timestamps (time.time()), never the virtual clock: spans from different processes
+are compared with each other.
+"""
+import os
+import sys
+import math
+import time
+import uuid
+import atexit
+import argparse
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+STAGES = (
+    "generate", "append", "queue", "pop", "dedupe", "gates", "price_fetch",
+    "buy", "balance_fetch", "oco_place", "db_commit", "execute", "e2e",
+)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "y", "on")
+TRACE_PATH = os.getenv("TRACE_PATH", "/var/data/traces/signal_trace.tsv")
+# spans buffered before a forced flush (callers flush explicitly at signal boundaries)
+TRACE_FLUSH_SPANS = int(os.getenv("TRACE_FLUSH_SPANS", "64"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_NULL = nullcontext()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def trace_id(signal: Dict[str, Any]) -> str:
+    return str(signal.get("trace_id") or "")
+
+
+def ensure_trace_id(signal: Dict[str, Any]) -> str:
+    tid = trace_id(signal)
+    if not tid:
+        tid = signal["trace_id"] = new_trace_id()
+    return tid
+
+
+class Tracer:
+    def __init__(self, path: str, flush_spans: int = 64, max_bytes: int = 0):
+        self.path = path
+        self.flush_spans = max(1, int(flush_spans))
+        self.max_bytes = max(0, int(max_bytes))
+        self._buf: List[str] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pid = os.getpid()
+
+    def record(self, tid: str, stage: str, start_ts: float, dur_s: float, ok: bool = True) -> None:
+        line = f"{tid}\t{stage}\t{start_ts:.6f}\t{dur_s * 1000.0:.3f}\t{1 if ok else 0}\t{self._pid}\n"
+        with self._lock:
+            self._buf.append(line)
+            full = len(self._buf) >= self.flush_spans
+        if full:
+            self.flush()
+
+    @contextmanager
+    def span(self, tid: str, stage: str) -> Iterator[None]:
+        ts = time.time()
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(tid, stage, ts, time.perf_counter() - t0, ok)
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._buf:
+                return
+            blob = "".join(self._buf).encode("utf-8")
+            self._buf = []
+        with self._io_lock:
+            try:
+                fd = self._open()
+                os.write(fd, blob)
+                if self.max_bytes and os.fstat(fd).st_size >= self.max_bytes:
+                    self._rotate(fd)
+            except OSError:
+                # tracing must never break the trading path
+                self._close()
+
+    def _open(self) -> int:
+        """Current descriptor; reopened when another process rotated the file away from it."""
+        fd = self._fd
+        if fd is not None and self.max_bytes:
+            try:
+                if os.stat(self.path).st_ino != os.fstat(fd).st_ino:
+                    fd = None
+            except FileNotFoundError:
+                fd = None
+            if fd is None:
+                self._close()
+        if fd is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            fd = self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return fd
+
+    def _rotate(self, fd: int) -> None:
+        # only the process whose descriptor is still the live file rotates it
+        if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+            os.replace(self.path, self.path + ".1")
+        self._close()
+
+    def _close(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.flush()
+        with self._io_lock:
+            self._close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None or _tracer._pid != os.getpid():
+        _tracer = Tracer(TRACE_PATH, TRACE_FLUSH_SPANS, TRACE_MAX_BYTES)
+        atexit.register(_tracer.close)
+    return _tracer
+
+
+def span(tid: str, stage: str):
+    """Context manager timing `stage` for trace `tid`; no-op when tracing is off or tid is empty."""
+    if not TRACE_ENABLED or not tid:
+        return _NULL
+    return get_tracer().span(tid, stage)
+
+
+def record(tid: str, stage: str, start_ts: Optional[float], end_ts: float, ok: bool = True) -> None:
+    """Span from explicit wall-clock timestamps (e.g. created_at_utc -> now)."""
+    if not TRACE_ENABLED or not tid or start_ts is None:
+        return
+    get_tracer().record(tid, stage, start_ts, max(0.0, end_ts - start_ts), ok)
+
+
+def flush() -> None:
+    if TRACE_ENABLED and _tracer is not None:
+        _tracer.flush()
+
+
+# ----------------------------
+# summariser
+# ----------------------------
+def _pct(sorted_ms: List[float], p: float) -> float:
+    # nearest rank
+    k = max(0, min(len(sorted_ms) - 1, math.ceil(p / 100.0 * len(sorted_ms)) - 1))
+    return sorted_ms[k]
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    """Rotated generation (if any), then the live file; FileNotFoundError if the live file is missing."""
+    with open(path, "r", encoding="utf-8") as live:
+        try:
+            with open(path + ".1", "r", encoding="utf-8") as old:
+                yield from old
+        except FileNotFoundError:
+            pass
+        yield from live
+
+
+def summarize(path: str, since_ts: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+    """Per stage: span count, errors, p50 / p95 / p99 / max (ms); includes the rotated generation."""
+    by_stage: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for line in _read_lines(path):
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 5:
+            continue
+        try:
+            start_ts, dur_ms = float(parts[2]), float(parts[3])
+        except ValueError:
+            continue
+        if since_ts is not None and start_ts < since_ts:
+            continue
+        stage = parts[1]
+        by_stage.setdefault(stage, []).append(dur_ms)
+        if parts[4] != "1":
+            errors[stage] = errors.get(stage, 0) + 1
+
+    order = {s: i for i, s in enumerate(STAGES)}
+    out: Dict[str, Dict[str, float]] = {}
+    for stage in sorted(by_stage, key=lambda s: (order.get(s, len(order)), s)):
+        ms = sorted(by_stage[stage])
+        out[stage] = {
+            "n": len(ms),
+            "errors": errors.get(stage, 0),
+            "p50": _pct(ms, 50),
+            "p95": _pct(ms, 95),
+            "p99": _pct(ms, 99),
+            "max": ms[-1],
+        }
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m execution.tracing")
+    ap.add_argument("path", nargs="?", default=TRACE_PATH)
+    ap.add_argument("--since-minutes", type=float, default=None)
+    args = ap.parse_args(argv)
+
+    since = time.time() - 60.0 * args.since_minutes if args.since_minutes else None
+    try:
+        stats = summarize(args.path, since)
+    except FileNotFoundError:
+        print(f"no trace file: {args.path}")
+        return 2
+    if not stats:
+        print("no spans")
+        return 0
+    print(f"{'stage':14s} {'n':>7s} {'err':>5s} {'p50_ms':>10s} {'p95_ms':>10s} {'p99_ms':>10s} {'max_ms':>10s}")
+    for stage, s in stats.items():
+        print(
+            f"{stage:14s} {s['n']:7d} {s['errors']:5d} {s['p50']:10.3f} {s['p95']:10.3f} "
+            f"{s['p99']:10.3f} {s['max']:10.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,57 +1,372 @@
-# execution/virtual_wallet.py
-
-from datetime import datetime
-from execution.config import VIRTUAL_START_BALANCE
-from execution.logger import log_info
-
-_balance = None
-
-
-def _ensure_init():
-    global _balance
-    if _balance is None:
-        _balance = float(VIRTUAL_START_BALANCE)
-        log_info(f"Virtual wallet initialized | balance={_balance}")
-
-
-def get_balance() -> float:
-    _ensure_init()
-    return float(_balance)
-
-
-def simulate_market_entry(symbol: str, side: str, size: float, price: float) -> dict:
-    _ensure_init()
-
-    if price is None:
-        raise ValueError("price is required for demo entry simulation")
-
-    log_info(f"[DEMO] Simulated ENTRY | {symbol} {side} size={size} price={price}")
-
-    return {
-        "status": "FILLED",
-        "symbol": symbol,
-        "side": side,
-        "size": float(size),
-        "price": float(price),
-        "filled_at": datetime.utcnow().isoformat() + "Z",
-        "demo": True,
-    }
-
-
-def simulate_market_close(symbol: str, side: str, size: float, close_price: float) -> dict:
-    _ensure_init()
-
-    if close_price is None:
-        raise ValueError("close_price is required for demo close simulation")
-
-    log_info(f"[DEMO] Simulated CLOSE | {symbol} {side} size={size} close_price={close_price}")
-
-    return {
-        "status": "FILLED",
-        "symbol": symbol,
-        "side": side,
-        "size": float(size),
-        "price": float(close_price),
-        "filled_at": datetime.utcnow().isoformat() + "Z",
-        "demo": True,
-    }
+# execution/virtual_wallet.py
+"""
+DEMO ledger.
+
+In-memory aggregates (balances per asset, open positions, realized PnL, fees) are the
+source for every balance/PnL query. Each fill is written to demo_fills (+ positions)
+immediately; aggregates are checkpointed to demo_wallet periodically. On start the
+last checkpoint is loaded and only fills newer than it are replayed.
+"""
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from execution.config import (
+    VIRTUAL_START_BALANCE,
+    DEMO_QUOTE_ASSET,
+    DEMO_FEE_PCT,
+    DEMO_CHECKPOINT_SECONDS,
+    DEMO_CHECKPOINT_FILLS,
+)
+from execution.db.repository import (
+    record_demo_entry,
+    record_demo_exit,
+    list_demo_fills_after,
+    list_open_positions_detail,
+    get_demo_wallet_checkpoint,
+    save_demo_wallet_checkpoint,
+)
+from execution.logger import log_info
+
+
+class VirtualWalletError(Exception):
+    pass
+
+
+def _split_symbol(symbol: str):
+    parts = str(symbol).upper().split("/")
+    base = parts[0]
+    quote = parts[1] if len(parts) > 1 else DEMO_QUOTE_ASSET
+    return base, quote
+
+
+class VirtualWallet:
+    def __init__(
+        self,
+        start_balance: float = VIRTUAL_START_BALANCE,
+        quote_asset: str = DEMO_QUOTE_ASSET,
+        fee_pct: float = DEMO_FEE_PCT,
+        checkpoint_seconds: float = DEMO_CHECKPOINT_SECONDS,
+        checkpoint_fills: int = DEMO_CHECKPOINT_FILLS,
+    ):
+        self.start_balance = float(start_balance)
+        self.quote_asset = str(quote_asset).upper()
+        self.fee_rate = float(fee_pct) / 100.0
+        self.checkpoint_seconds = float(checkpoint_seconds)
+        self.checkpoint_fills = int(checkpoint_fills)
+
+        self.balances: Dict[str, float] = {}
+        self.positions: Dict[int, Dict[str, Any]] = {}
+        self.realized_pnl = 0.0
+        self.fees_paid = 0.0
+
+        # open exposure aggregates (kept in step with self.positions)
+        self._open_qty: Dict[str, float] = {}
+        self._open_cost = 0.0
+
+        self._last_fill_id = 0
+        self._fills_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    # ----------------------------
+    # restore / checkpoint
+    # ----------------------------
+    def load(self) -> "VirtualWallet":
+        cp = get_demo_wallet_checkpoint()
+        if cp:
+            balances_json, realized, fees, last_fill_id, _updated_at = cp
+            self.balances = {str(k): float(v) for k, v in (json.loads(balances_json) or {}).items()}
+            self.realized_pnl = float(realized or 0.0)
+            self.fees_paid = float(fees or 0.0)
+            self._last_fill_id = int(last_fill_id or 0)
+        else:
+            self.balances = {self.quote_asset: self.start_balance}
+
+        replayed = 0
+        for (fill_id, _sid, _pid, symbol, side, size, price, fee, fee_asset, pnl, _reason, _at) in list_demo_fills_after(self._last_fill_id):
+            self._apply_fill(symbol, side, float(size), float(price), float(fee), str(fee_asset), pnl)
+            self._last_fill_id = int(fill_id)
+            replayed += 1
+
+        for (pid, symbol, side, size, entry_price, signal_id, tp, sl, entry_fee, opened_at) in list_open_positions_detail():
+            self._track_open(int(pid), {
+                "symbol": str(symbol),
+                "side": str(side),
+                "size": float(size),
+                "entry_price": float(entry_price),
+                "signal_id": signal_id,
+                "tp_price": float(tp) if tp is not None else None,
+                "sl_price": float(sl) if sl is not None else None,
+                "entry_fee": float(entry_fee or 0.0),
+                "opened_at": opened_at,
+            })
+
+        log_info(
+            "Virtual wallet loaded | %s=%s open=%d realized=%.8f replayed_fills=%d",
+            self.quote_asset, self.balance(self.quote_asset), len(self.positions), self.realized_pnl, replayed,
+        )
+        if replayed:
+            self.checkpoint()
+        return self
+
+    def checkpoint(self) -> None:
+        save_demo_wallet_checkpoint(
+            balances_json=json.dumps(self.balances, separators=(",", ":")),
+            realized_pnl=self.realized_pnl,
+            fees_paid=self.fees_paid,
+            last_fill_id=self._last_fill_id,
+        )
+        self._fills_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def maybe_checkpoint(self) -> bool:
+        if self._fills_since_checkpoint == 0:
+            return False
+        if (
+            self._fills_since_checkpoint >= self.checkpoint_fills
+            or time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds
+        ):
+            self.checkpoint()
+            return True
+        return False
+
+    # ----------------------------
+    # aggregates
+    # ----------------------------
+    def _credit(self, asset: str, amount: float) -> None:
+        v = self.balances.get(asset, 0.0) + amount
+        if abs(v) < 1e-12 and asset != self.quote_asset:
+            self.balances.pop(asset, None)  # drop base dust after a full close
+        else:
+            self.balances[asset] = v
+
+    def _apply_fill(self, symbol: str, side: str, size: float, price: float, fee: float, fee_asset: str, pnl: Any) -> None:
+        base, quote = _split_symbol(symbol)
+        notional = size * price
+        if str(side).upper() == "BUY":
+            self._credit(quote, -notional)
+            self._credit(base, size)
+        else:
+            self._credit(base, -size)
+            self._credit(quote, notional)
+            if pnl is not None:
+                self.realized_pnl += float(pnl)
+        self._credit(fee_asset, -fee)
+        self.fees_paid += fee
+        self._fills_since_checkpoint += 1
+
+    def _track_open(self, position_id: int, pos: Dict[str, Any]) -> None:
+        pos["cost"] = pos["size"] * pos["entry_price"] + pos["entry_fee"]
+        self.positions[position_id] = pos
+        self._open_qty[pos["symbol"]] = self._open_qty.get(pos["symbol"], 0.0) + pos["size"]
+        self._open_cost += pos["cost"]
+
+    def _untrack_open(self, position_id: int) -> Dict[str, Any]:
+        pos = self.positions.pop(position_id)
+        left = self._open_qty.get(pos["symbol"], 0.0) - pos["size"]
+        if left <= 1e-12:
+            self._open_qty.pop(pos["symbol"], None)
+        else:
+            self._open_qty[pos["symbol"]] = left
+        self._open_cost -= pos["cost"]
+        return pos
+
+    def balance(self, asset: str) -> float:
+        return float(self.balances.get(str(asset).upper(), 0.0))
+
+    def open_symbols(self) -> List[str]:
+        return list(self._open_qty.keys())
+
+    def unrealized_pnl(self, prices: Dict[str, float]) -> float:
+        """Mark-to-market of open positions; symbols without a price are valued at cost."""
+        value = 0.0
+        for pos in self.positions.values():
+            px = prices.get(pos["symbol"])
+            value += pos["size"] * float(px) if px is not None else pos["cost"]
+        return value - self._open_cost
+
+    def pnl(self) -> Dict[str, float]:
+        return {
+            "realized_pnl": self.realized_pnl,
+            "fees_paid": self.fees_paid,
+            "open_cost": self._open_cost,
+            "open_positions": float(len(self.positions)),
+        }
+
+    # ----------------------------
+    # fills
+    # ----------------------------
+    def buy(
+        self,
+        symbol: str,
+        size: float,
+        price: float,
+        signal_id: Optional[str] = None,
+        tp_price: Optional[float] = None,
+        sl_price: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if price is None or float(price) <= 0:
+            raise ValueError("price is required for demo entry simulation")
+        size = float(size)
+        price = float(price)
+        if size <= 0:
+            raise ValueError("size must be > 0")
+
+        base, quote = _split_symbol(symbol)
+        notional = size * price
+        fee = notional * self.fee_rate
+        if self.balance(quote) < notional + fee:
+            raise VirtualWalletError(
+                f"INSUFFICIENT_BALANCE | {quote}={self.balance(quote):.8f} need={notional + fee:.8f}"
+            )
+
+        position_id, fill_id = record_demo_entry(
+            signal_id=signal_id, symbol=symbol, side="LONG", size=size, price=price,
+            fee=fee, fee_asset=quote, tp_price=tp_price, sl_price=sl_price,
+        )
+        self._apply_fill(symbol, "BUY", size, price, fee, quote, None)
+        self._last_fill_id = fill_id
+        self._track_open(position_id, {
+            "symbol": str(symbol),
+            "side": "LONG",
+            "size": size,
+            "entry_price": price,
+            "signal_id": signal_id,
+            "tp_price": float(tp_price) if tp_price is not None else None,
+            "sl_price": float(sl_price) if sl_price is not None else None,
+            "entry_fee": fee,
+            "opened_at": datetime.utcnow().isoformat() + "Z",
+        })
+        self.maybe_checkpoint()
+
+        return {
+            "status": "FILLED",
+            "position_id": position_id,
+            "symbol": symbol,
+            "side": "BUY",
+            "size": size,
+            "price": price,
+            "fee": fee,
+            "fee_asset": quote,
+            "filled_at": datetime.utcnow().isoformat() + "Z",
+            "demo": True,
+        }
+
+    def close(self, position_id: int, price: float, reason: str = "MANUAL") -> Dict[str, Any]:
+        if price is None or float(price) <= 0:
+            raise ValueError("close_price is required for demo close simulation")
+        if position_id not in self.positions:
+            raise VirtualWalletError(f"POSITION_NOT_OPEN | id={position_id}")
+
+        price = float(price)
+        pos = self.positions[position_id]
+        _base, quote = _split_symbol(pos["symbol"])
+        proceeds = pos["size"] * price
+        fee = proceeds * self.fee_rate
+        pnl = proceeds - fee - pos["cost"]
+
+        fill_id = record_demo_exit(
+            position_id=position_id, signal_id=pos.get("signal_id"), symbol=pos["symbol"],
+            size=pos["size"], price=price, fee=fee, fee_asset=quote, pnl=pnl, reason=reason,
+        )
+        self._untrack_open(position_id)
+        self._apply_fill(pos["symbol"], "SELL", pos["size"], price, fee, quote, pnl)
+        self._last_fill_id = fill_id
+        self.maybe_checkpoint()
+
+        return {
+            "status": "FILLED",
+            "position_id": position_id,
+            "signal_id": pos.get("signal_id"),
+            "symbol": pos["symbol"],
+            "side": "SELL",
+            "size": pos["size"],
+            "price": price,
+            "fee": fee,
+            "fee_asset": quote,
+            "pnl": pnl,
+            "reason": reason,
+            "filled_at": datetime.utcnow().isoformat() + "Z",
+            "demo": True,
+        }
+
+    def check_exits(self, prices: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        Simulated TP/SL: TP fills at its limit price, SL at the observed price (stop -> market-like).
+        """
+        closed = []
+        for pid, pos in list(self.positions.items()):
+            px = prices.get(pos["symbol"])
+            if px is None:
+                continue
+            px = float(px)
+            tp = pos.get("tp_price")
+            sl = pos.get("sl_price")
+            if tp is not None and px >= tp:
+                closed.append(self.close(pid, tp, reason="TP"))
+            elif sl is not None and px <= sl:
+                closed.append(self.close(pid, px, reason="SL"))
+        return closed
+
+
+_wallet: Optional[VirtualWallet] = None
+
+
+def get_wallet() -> VirtualWallet:
+    global _wallet
+    if _wallet is None:
+        _wallet = VirtualWallet().load()
+    return _wallet
+
+
+def set_wallet(wallet: Optional[VirtualWallet]) -> None:
+    """Install a pre-configured wallet (backtests); None -> lazily reloaded from DB."""
+    global _wallet
+    _wallet = wallet
+
+
+def get_balance() -> float:
+    w = get_wallet()
+    return w.balance(w.quote_asset)
+
+
+def simulate_market_entry(
+    symbol: str,
+    side: str,
+    size: float,
+    price: float,
+    signal_id: Optional[str] = None,
+    tp_price: Optional[float] = None,
+    sl_price: Optional[float] = None,
+) -> dict:
+    if price is None:
+        raise ValueError("price is required for demo entry simulation")
+    if str(side).upper() not in ("LONG", "BUY"):
+        raise VirtualWalletError(f"DEMO supports LONG entries only, got side={side}")
+
+    resp = get_wallet().buy(symbol, size, price, signal_id=signal_id, tp_price=tp_price, sl_price=sl_price)
+    log_info("[DEMO] Simulated ENTRY | %s %s size=%s price=%s fee=%.8f pos=%s", symbol, side, size, price, resp["fee"], resp["position_id"])
+    return resp
+
+
+def simulate_market_close(symbol: str, side: str, size: float, close_price: float) -> dict:
+    """
+    Closes the oldest open DEMO position on symbol at close_price. Whole positions only (the
+    ledger has no partial closes): size must equal that position's size, otherwise
+    VirtualWalletError and nothing is closed.
+    """
+    if close_price is None:
+        raise ValueError("close_price is required for demo close simulation")
+
+    w = get_wallet()
+    for pid, pos in w.positions.items():
+        if pos["symbol"] == symbol:
+            if size is None or abs(float(size) - pos["size"]) > 1e-9 * max(1.0, pos["size"]):
+                raise VirtualWalletError(
+                    f"PARTIAL_CLOSE_UNSUPPORTED | symbol={symbol} id={pid} size={size} position_size={pos['size']}"
+                )
+            resp = w.close(pid, close_price, reason="MANUAL")
+            log_info("[DEMO] Simulated CLOSE | %s %s size=%s close_price=%s pnl=%.8f", symbol, side, pos["size"], close_price, resp["pnl"])
+            return resp
+    raise VirtualWalletError(f"NO_OPEN_POSITION | symbol={symbol}")
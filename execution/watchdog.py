@@ -0,0 +1,249 @@
+# execution/watchdog.py
+"""
+Worker loop watchdog: per-stage heartbeats + a monitor thread.
+
+  with get_watchdog().stage("reconcile"):   marks the stage active (start time, thread)
+      engine.reconcile_oco()
+  get_watchdog().beat("loop")               end of a loop iteration
+
+Monitor (every WATCHDOG_INTERVAL_SECONDS):
+  - a stage active for WATCHDOG_STALL_SECONDS: WATCHDOG_STALL log + audit, faulthandler stack
+    dump of every thread (once per stall)
+  - a stage active, or no loop beat, for WATCHDOG_KILL_SECONDS: system_state.kill_switch=1
+    (WATCHDOG_KILL_SWITCH audit event, once per stall); clearing it is an operator action
+  - WATCHDOG_DEFER_STAGES (default "execute") are never escalated mid-flight: the kill switch
+    is the engine's last gate before the OCO, so setting it between the buy and the OCO would
+    leave an unprotected position. The escalation fires when the stage ends (WATCHDOG_KILL_DEFERRED
+    in the meantime); the loop-beat escalation waits for it too
+  - metrics: gbm_watchdog_stalls_total / gbm_watchdog_escalations_total (counters),
+    gbm_watchdog_stall_seconds (histogram, at stall end), gbm_watchdog_stage_active_seconds
+    (per scrape, from stats())
+
+Time is time.monotonic() (never the virtual clock). A gap between monitor ticks much larger
+than the interval means the whole process was suspended (guard SIGSTOP): active stages are
+shifted by the gap so a pause doesn't count as a stall.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import faulthandler
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from execution.metrics import collector, counter, gauge, histogram
+
+logger = logging.getLogger("gbm")
+
+STAGE_SECONDS = histogram("gbm_stage_seconds", "worker loop stage duration", ["stage"])
+STALLS = counter("gbm_watchdog_stalls_total", "stages active past WATCHDOG_STALL_SECONDS", ["stage"])
+STALL_SECONDS = histogram(
+    "gbm_watchdog_stall_seconds", "duration of stalled stages", ["stage"],
+    buckets=(30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0),
+)
+ESCALATIONS = counter("gbm_watchdog_escalations_total", "kill switch escalations", ["stage"])
+
+
+class Watchdog:
+    def __init__(
+        self,
+        interval_s: float = 1.0,
+        stall_s: float = 60.0,
+        kill_s: float = 300.0,
+        loop_s: float = 300.0,
+        defer_stages: Sequence[str] = ("execute",),
+    ):
+        self.interval_s = float(interval_s)
+        self.stall_s = float(stall_s)
+        self.kill_s = float(kill_s)
+        self.loop_s = float(loop_s)
+        self.defer_stages = frozenset(defer_stages)
+        # stage -> (start monotonic, thread ident)
+        self._active: Dict[str, Any] = {}
+        self._last_beat: Dict[str, float] = {}
+        self._reported: Dict[str, float] = {}  # stage -> start of the stall already dumped
+        self._killed: Dict[str, float] = {}  # stage -> start of the stall already escalated
+        self._deferred: Dict[str, float] = {}  # stage -> start of a stall escalated at stage end
+        self._stalls: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ----------------------------
+    # worker side
+    # ----------------------------
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.monotonic()
+        with self._lock:
+            self._active[name] = [t0, threading.get_ident()]
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                start = self._active.pop(name, [t0])[0]
+                self._last_beat[name] = now
+                stalled = name in self._reported
+                self._reported.pop(name, None)
+                self._killed.pop(name, None)
+                deferred = self._deferred.pop(name, None) is not None
+            STAGE_SECONDS.labels(stage=name).observe(now - t0)
+            if stalled:
+                self._record_stall(name, now - start)
+                logger.warning("WATCHDOG_STALL_END | stage=%s duration_s=%.1f", name, now - start)
+            if deferred:
+                self._escalate(name, now - start)
+
+    def beat(self, name: str = "loop") -> None:
+        with self._lock:
+            self._last_beat[name] = time.monotonic()
+
+    # ----------------------------
+    # monitor
+    # ----------------------------
+    def start(self) -> "Watchdog":
+        if self._thread is None:
+            self._last_beat.setdefault("loop", time.monotonic())
+            self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+            self._thread.start()
+            self._register_gauges()
+            logger.info("WATCHDOG_START | stall_s=%s kill_s=%s loop_s=%s", self.stall_s, self.kill_s, self.loop_s)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        prev = time.monotonic()
+        while not self._stop.wait(self.interval_s):
+            now = time.monotonic()
+            gap = now - prev
+            prev = now
+            if gap > 3 * self.interval_s:
+                # process was suspended: don't bill the pause to whatever was running
+                shift = gap - self.interval_s
+                with self._lock:
+                    for entry in self._active.values():
+                        entry[0] += shift
+                    for d in (self._last_beat, self._reported, self._killed):
+                        for k in d:
+                            d[k] += shift
+            try:
+                self.check(now)
+            except Exception as e:
+                logger.warning("WATCHDOG_CHECK_FAIL | err=%s", e)
+
+    def check(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        stalls, escalations, deferrals = [], [], []
+        with self._lock:
+            for name, (start, ident) in self._active.items():
+                age = now - start
+                if age >= self.stall_s and self._reported.get(name) != start:
+                    self._reported[name] = start
+                    stalls.append((name, age, ident))
+                if age >= self.kill_s and self._killed.get(name) != start:
+                    self._killed[name] = start
+                    if name in self.defer_stages:
+                        self._deferred[name] = start
+                        deferrals.append((name, age))
+                    else:
+                        escalations.append((name, age))
+            in_flight = any(name in self.defer_stages for name in self._active)
+            loop_beat = self._last_beat.get("loop")
+            if (
+                loop_beat is not None
+                and not in_flight
+                and now - loop_beat >= self.loop_s
+                and self._killed.get("loop") != loop_beat
+            ):
+                self._killed["loop"] = loop_beat
+                escalations.append(("loop", now - loop_beat))
+
+        for name, age, ident in stalls:
+            self._on_stall(name, age, ident)
+        for name, age in deferrals:
+            logger.error("WATCHDOG_KILL_DEFERRED | stage=%s age_s=%.1f", name, age)
+        for name, age in escalations:
+            if name == "loop":
+                STALLS.labels(stage="loop").inc()
+                self._record_stall("loop", age)
+            self._escalate(name, age)
+
+    def _on_stall(self, name: str, age: float, ident: int) -> None:
+        STALLS.labels(stage=name).inc()
+        thread = next((t.name for t in threading.enumerate() if t.ident == ident), "?")
+        logger.error("WATCHDOG_STALL | stage=%s age_s=%.1f thread=%s", name, age, thread)
+        try:
+            sys.stderr.flush()
+            faulthandler.dump_traceback(file=sys.stderr, all_threads=True)
+        except Exception:
+            pass
+        try:
+            from execution.db.repository import log_event
+            log_event("WATCHDOG_STALL", f"stage={name} age_s={age:.1f} thread={thread}")
+        except Exception:
+            pass
+
+    def _escalate(self, name: str, age: float) -> None:
+        ESCALATIONS.labels(stage=name).inc()
+        logger.critical("WATCHDOG_KILL_SWITCH | stage=%s age_s=%.1f", name, age)
+        try:
+            from execution.db.repository import update_system_state, log_event
+            update_system_state(kill_switch=1)
+            log_event("WATCHDOG_KILL_SWITCH", f"stage={name} age_s={age:.1f}")
+        except Exception as e:
+            logger.error("WATCHDOG_KILL_SWITCH_FAIL | stage=%s err=%s", name, e)
+
+    def _record_stall(self, name: str, duration: float) -> None:
+        with self._lock:
+            st = self._stalls.setdefault(name, {"count": 0, "max_s": 0.0, "last_s": 0.0, "total_s": 0.0})
+            st["count"] += 1
+            st["last_s"] = duration
+            st["total_s"] += duration
+            st["max_s"] = max(st["max_s"], duration)
+        STALL_SECONDS.labels(stage=name).observe(duration)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "active": {k: now - v[0] for k, v in self._active.items()},
+                "since_beat": {k: now - v for k, v in self._last_beat.items()},
+                "stalls": {k: dict(v) for k, v in self._stalls.items()},
+            }
+
+    def _register_gauges(self) -> None:
+        """How long each stage has been running, and time since its last completion (per scrape)."""
+        active = gauge("gbm_watchdog_stage_active_seconds", "running time of the active stage, 0 when idle", ["stage"])
+        since = gauge("gbm_watchdog_since_beat_seconds", "time since the stage last completed", ["stage"])
+
+        seen = set()
+
+        def collect() -> None:
+            st = self.stats()
+            seen.update(st["active"])
+            for name in seen:
+                active.labels(stage=name).set(st["active"].get(name, 0.0))
+            for name, age in st["since_beat"].items():
+                since.labels(stage=name).set(age)
+
+        collector(collect)
+
+
+_watchdog: Optional[Watchdog] = None
+
+
+def get_watchdog() -> Watchdog:
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = Watchdog(
+            interval_s=float(os.getenv("WATCHDOG_INTERVAL_SECONDS", "1")),
+            stall_s=float(os.getenv("WATCHDOG_STALL_SECONDS", "60")),
+            kill_s=float(os.getenv("WATCHDOG_KILL_SECONDS", "300")),
+            loop_s=float(os.getenv("WATCHDOG_LOOP_STALE_SECONDS", "300")),
+            defer_stages=[s.strip() for s in os.getenv("WATCHDOG_DEFER_STAGES", "execute").split(",") if s.strip()],
+        )
+    return _watchdog
@@ -1,9 +1,44 @@
 # guard.py
+"""
+Supervisor for the GENIUS BOT MAN worker.
+
+  - policy.json re-read whenever its mtime changes, worker state on every heartbeat
+    (GUARD_HEARTBEAT_SECONDS): limits are enforced while the worker runs, not only at boot.
+    State comes from the memory-mapped state channel (seqlock read, no parse); genius_state.json
+    is the fallback until the worker has written the channel
+  - stale state: a snapshot whose pid is not the live worker, or whose heartbeat is older than
+    GUARD_STALE_HEARTBEATS worker loops (LOOP_SLEEP_SECONDS) + GUARD_STALE_GRACE_SECONDS, is
+    not taken as news: limits stay enforced against the last trusted snapshot while the worker
+    is held, frozen, restarting or not yet publishing, so a breach is only cleared by fresh
+    state (or a policy change). A running worker with stale state (wedged) is a staleness
+    breach, handled with the entry gate
+  - emergency_stop / expired policy: worker terminated (SIGTERM, SIGKILL after
+    GUARD_TERM_GRACE_SECONDS) and held until the policy changes; a guard-initiated stop counts
+    as a failure for the restart backoff
+  - drawdown / open-position limit: GUARD_BREACH_ACTION=pause (default: system_state.pause_reason
+    entry gate; the worker keeps reconciling OCOs, closing positions and publishing state, so the
+    breach clears by itself once drawdown / positions recover or the UTC day rolls), stop
+    (terminate + hold) or sigstop (opt-in: freeze the worker with SIGSTOP until the breach
+    clears; can stop it mid-order or while it holds the outbox lock)
+  - worker exit: restart after a full-jitter exponential backoff
+    (GUARD_RESTART_BASE_SECONDS .. GUARD_RESTART_MAX_SECONDS, reset after a stable run)
+  - GUARD_PREFORK=true: execution.main is imported once here and each worker is a fork of
+    this warm interpreter (no interpreter start / ccxt import per restart)
+"""
+import os
 import sys
 import json
+import time
+import atexit
+import random
+import signal
 import subprocess
+import traceback
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional, Tuple
+
+from execution.state_channel import StateChannel, stale_reason
 
 POLICY_PATH = Path("shared/policy.json")
 
@@ -12,6 +47,29 @@ GENIUS_STATE_PATH_FALLBACK = Path("shared/genius-state.json")
 
 GENIUS_CMD = ["python", "-m", "execution.main"]
 
+HEARTBEAT_S = float(os.getenv("GUARD_HEARTBEAT_SECONDS", "0.25"))
+TERM_GRACE_S = float(os.getenv("GUARD_TERM_GRACE_SECONDS", "10"))
+BREACH_ACTION = os.getenv("GUARD_BREACH_ACTION", "pause").strip().lower()
+RESTART_BASE_S = float(os.getenv("GUARD_RESTART_BASE_SECONDS", "1"))
+RESTART_MAX_S = float(os.getenv("GUARD_RESTART_MAX_SECONDS", "60"))
+# a worker that ran this long resets the backoff
+RESTART_RESET_S = float(os.getenv("GUARD_RESTART_RESET_SECONDS", "300"))
+PREFORK = os.getenv("GUARD_PREFORK", "true").strip().lower() in ("1", "true", "yes", "y")
+# the worker publishes state once per loop: stale after N loops + grace (batch budget, reconcile)
+STALE_S = (
+    float(os.getenv("GUARD_STALE_HEARTBEATS", "3")) * float(os.getenv("LOOP_SLEEP_SECONDS", "10"))
+    + float(os.getenv("GUARD_STALE_GRACE_SECONDS", "30"))
+)
+
+REQUIRED_FIELDS = [
+    "policy_version",
+    "valid_until",
+    "max_daily_drawdown",
+    "max_open_positions",
+    "allowed_strategies",
+    "emergency_stop",
+]
+
 
 
 def stop(reason: str):
@@ -31,15 +89,6 @@ def _write_json_atomic(path: Path, payload: dict):
     tmp.replace(path)
 
 
-def load_policy() -> dict:
-    if not POLICY_PATH.exists():
-        stop("shared/policy.json not found")
-    try:
-        return _read_json(POLICY_PATH)
-    except Exception as e:
-        stop(f"cannot read shared/policy.json: {e}")
-
-
 def now_utc():
     return datetime.now(timezone.utc)
 
@@ -92,50 +141,325 @@ def load_or_bootstrap_genius_state() -> dict:
         return boot
 
 
-def main():
-    print("[GUARD] starting checks...")
+def read_genius_state(channel: StateChannel, worker_pid: Optional[int] = None) -> Tuple[dict, Optional[str]]:
+    """
+    (state, stale): state channel snapshot if the worker has published one, else the JSON file
+    (bootstrapped). stale is the reason the snapshot isn't current news for the live worker
+    (None = fresh); the caller decides what to enforce instead.
+    """
+    snap = channel.read()
+    if snap is not None:
+        return snap, stale_reason(snap, worker_pid, STALE_S)
+    return load_or_bootstrap_genius_state(), None
 
-    policy = load_policy()
-
-    required_fields = [
-        "policy_version",
-        "valid_until",
-        "max_daily_drawdown",
-        "max_open_positions",
-        "allowed_strategies",
-        "emergency_stop",
-    ]
-    for k in required_fields:
-        if k not in policy:
-            stop(f"policy missing field: {k}")
 
-    # expiry
+def validate_policy(policy: dict) -> Optional[str]:
+    """Structural problem with the policy file, or None."""
+    for k in REQUIRED_FIELDS:
+        if k not in policy:
+            return f"policy missing field: {k}"
     try:
-        valid_until = datetime.fromisoformat(policy["valid_until"].replace("Z", "+00:00"))
+        datetime.fromisoformat(str(policy["valid_until"]).replace("Z", "+00:00"))
     except Exception:
-        stop("invalid valid_until format")
+        return "invalid valid_until format"
+    return None
 
+
+def check_limits(policy: dict, state: dict) -> Tuple[Optional[str], bool]:
+    """
+    (reason, hard) for the first breached rule, (None, False) if the worker may run.
+    hard = the worker must be terminated (emergency stop / expiry); soft breaches follow BREACH_ACTION.
+    """
+    problem = validate_policy(policy)
+    if problem:
+        return problem, True
+
+    valid_until = datetime.fromisoformat(str(policy["valid_until"]).replace("Z", "+00:00"))
     if now_utc() > valid_until:
-        stop("policy expired")
+        return "policy expired", True
 
-    # emergency stop
     if policy.get("emergency_stop") is True:
-        stop("emergency_stop is TRUE")
+        return "emergency_stop is TRUE", True
 
-    # state
-    state = load_or_bootstrap_genius_state()
-    daily_dd = float(state.get("daily_drawdown", 0.0))
-    open_positions = int(state.get("open_positions", 0))
+    daily_dd = float(state.get("daily_drawdown", 0.0) or 0.0)
+    open_positions = int(state.get("open_positions", 0) or 0)
 
-    # limits
     if daily_dd >= float(policy["max_daily_drawdown"]):
-        stop("daily drawdown limit exceeded")
+        return "daily drawdown limit exceeded", False
 
     if open_positions > int(policy["max_open_positions"]):
-        stop("open positions limit exceeded")
+        return "open positions limit exceeded", False
+
+    return None, False
+
+
+class PolicyWatcher:
+    """policy.json, re-parsed only when (mtime_ns, size) changes; an unreadable file is a hard breach."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._key = None
+        self.policy: dict = {}
+        self.error: Optional[str] = None
+
+    def poll(self) -> bool:
+        """True if the file changed since the last poll."""
+        try:
+            st = os.stat(self.path)
+            key = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            key = None
+        if key == self._key and self._key is not None:
+            return False
+        self._key = key
+        if key is None:
+            self.policy, self.error = {}, f"{self.path} not found"
+            return True
+        try:
+            self.policy, self.error = _read_json(self.path), None
+        except Exception as e:
+            self.policy, self.error = {}, f"cannot read {self.path}: {e}"
+        return True
+
+
+def _set_entry_gate(reason: Optional[str]) -> bool:
+    """Writes system_state.pause_reason (None lifts the gate). False if the DB write failed."""
+    try:
+        from execution.db.repository import set_pause_reason
+        set_pause_reason(reason)
+        return True
+    except Exception as e:
+        print(f"[GUARD] entry gate write failed | reason={reason} err={e}", flush=True)
+        return False
+
+
+def _run_worker_in_fork() -> None:
+    """Child side of the prefork: default signal handlers, then the worker's own main()."""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    code = 0
+    try:
+        from execution.main import main as worker_main
+        worker_main()
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        # os._exit skips atexit: run the worker's hooks (log queue listener, trace / signal
+        # history flush, cassette close) here so a crashing worker still gets its records out
+        try:
+            atexit._run_exitfuncs()
+        except BaseException:
+            traceback.print_exc()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+class Worker:
+    """One child process (fork of this interpreter or GENIUS_CMD)."""
+
+    def __init__(self):
+        self.pid: Optional[int] = None
+        self.proc: Optional[subprocess.Popen] = None
+        self.started = 0.0
+        self.paused = False
+
+    @property
+    def alive(self) -> bool:
+        return self.pid is not None
+
+    def start(self) -> None:
+        if PREFORK:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                _run_worker_in_fork()
+            self.pid, self.proc = pid, None
+        else:
+            self.proc = subprocess.Popen(GENIUS_CMD)
+            self.pid = self.proc.pid
+        self.started = time.monotonic()
+        self.paused = False
+        print(f"[GUARD] worker started | pid={self.pid} prefork={PREFORK}", flush=True)
+
+    def poll(self) -> Optional[int]:
+        """Exit code once the child has exited (reaped), else None."""
+        if self.pid is None:
+            return None
+        if self.proc is not None:
+            code = self.proc.poll()
+        else:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            code = None if pid == 0 else os.waitstatus_to_exitcode(status)
+        if code is not None:
+            self.pid, self.proc, self.paused = None, None, False
+        return code
+
+    def pause(self) -> None:
+        if self.pid is not None and not self.paused:
+            os.kill(self.pid, signal.SIGSTOP)
+            self.paused = True
+
+    def resume(self) -> None:
+        if self.pid is not None and self.paused:
+            os.kill(self.pid, signal.SIGCONT)
+            self.paused = False
+
+    def terminate(self, grace_s: float = TERM_GRACE_S) -> Optional[int]:
+        if self.pid is None:
+            return None
+        pid = self.pid
+        try:
+            if self.paused:
+                os.kill(pid, signal.SIGCONT)
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + grace_s
+        while time.monotonic() < deadline:
+            code = self.poll()
+            if code is not None:
+                return code
+            time.sleep(0.05)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        while True:
+            code = self.poll()
+            if code is not None:
+                return code
+            time.sleep(0.05)
+
+
+def _backoff(failures: int) -> float:
+    """Full jitter: uniform(0, min(max, base * 2^failures))."""
+    return random.uniform(0.0, min(RESTART_MAX_S, RESTART_BASE_S * (2 ** max(0, failures - 1))))
+
 
-    print("[GUARD] checks passed. starting GENIUS BOT MAN execution...")
-    subprocess.run(GENIUS_CMD, check=True)
+def main():
+    print("[GUARD] starting checks...")
+
+    watcher = PolicyWatcher(POLICY_PATH)
+    watcher.poll()
+    if watcher.error:
+        stop(watcher.error)
+    problem = validate_policy(watcher.policy)
+    if problem:
+        stop(problem)
+
+    if PREFORK:
+        # warm interpreter: heavy imports (ccxt, numpy, execution.*) paid once, not per restart
+        t0 = time.perf_counter()
+        import execution.main  # noqa: F401
+        print(f"[GUARD] preloaded execution.main in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    try:
+        from execution.db.db import init_db
+        init_db()
+    except Exception as e:
+        print(f"[GUARD] init_db failed | err={e}")
+
+    worker = Worker()
+    channel = StateChannel()
+    stopping = {"flag": False}
+
+    def _on_term(signum, _frame):
+        stopping["flag"] = True
+
+    signal.signal(signal.SIGTERM, _on_term)
+    signal.signal(signal.SIGINT, _on_term)
+
+    failures = 0
+    restart_at = 0.0
+    held: Optional[str] = None  # reason the worker is held down (hard breach / stop action)
+    last_reason: Optional[str] = None
+    gate: Optional[str] = ""  # pause_reason last written; "" = unknown, cleared on the first pass
+    trusted: Optional[dict] = None  # last state that was fresh (or the state found at start)
+
+    while not stopping["flag"]:
+        policy_changed = watcher.poll()
+        if policy_changed:
+            print(f"[GUARD] policy reloaded | version={watcher.policy.get('policy_version')} err={watcher.error}")
+            held = None  # re-evaluated below
+
+        state, stale = read_genius_state(channel, worker.pid)
+        if stale is None or trusted is None:
+            # the first read stands in until a worker publishes: a breach the previous run left
+            # behind stays enforced across the guard restart
+            trusted = state
+        state = trusted
+        if watcher.error:
+            reason, hard = watcher.error, True
+        else:
+            reason, hard = check_limits(watcher.policy, state)
+        # a worker that has run past its first heartbeat window but isn't publishing is wedged
+        stale_breach = (
+            reason is None and stale is not None and worker.alive and not worker.paused
+            and time.monotonic() - worker.started > STALE_S
+        )
+        if stale_breach:
+            reason, hard = f"worker state stale: {stale}", False
+
+        if reason != last_reason:
+            print(f"[GUARD] {'BREACH: ' + reason if reason else 'limits OK'}")
+            last_reason = reason
+
+        # staleness always goes through the entry gate: stopping (and holding) or freezing a
+        # wedged worker would not clear it
+        if reason and (hard or (BREACH_ACTION == "stop" and not stale_breach)):
+            if worker.alive:
+                code = worker.terminate()
+                failures += 1
+                delay = _backoff(failures)
+                restart_at = time.monotonic() + delay
+                print(f"[GUARD] worker stopped | reason={reason} code={code} restart_in_s={delay:.1f}")
+            held = reason
+        elif reason and BREACH_ACTION == "sigstop" and not stale_breach:
+            if worker.alive and not worker.paused:
+                worker.pause()
+                print(f"[GUARD] worker frozen (SIGSTOP) | reason={reason}")
+        elif reason:
+            if gate != reason and _set_entry_gate(reason):
+                gate = reason
+                print(f"[GUARD] entries paused | reason={reason}")
+        else:
+            held = None
+            if worker.paused:
+                worker.resume()
+                print("[GUARD] worker resumed")
+            if gate is not None and _set_entry_gate(None):
+                if gate:
+                    print("[GUARD] entries resumed")
+                gate = None
+
+        # under the entry gate a worker may run (and restart) during a soft breach: it opens nothing
+        gated = reason is not None and not hard and BREACH_ACTION == "pause" and gate == reason
+
+        code = worker.poll()
+        if code is not None:
+            ran = time.monotonic() - worker.started
+            failures = 0 if ran >= RESTART_RESET_S else failures + 1
+            delay = _backoff(failures) if failures else 0.0
+            restart_at = time.monotonic() + delay
+            print(f"[GUARD] worker exited | code={code} ran_s={ran:.0f} restart_in_s={delay:.1f}")
+
+        if not worker.alive and held is None and (reason is None or gated) and time.monotonic() >= restart_at:
+            if gated:
+                print(f"[GUARD] starting GENIUS BOT MAN execution with entries paused | reason={reason}")
+            else:
+                print("[GUARD] checks passed. starting GENIUS BOT MAN execution...")
+            worker.start()
+
+        time.sleep(HEARTBEAT_S)
+
+    print("[GUARD] shutdown requested")
+    if worker.alive:
+        worker.terminate()
 
 
 if __name__ == "__main__":